@@ -0,0 +1,422 @@
+from __future__ import annotations
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+# The board window is drawn offscreen, so the benchmark runs without a display.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy
+import pygame
+from numpy.random import Generator, SeedSequence
+from constraint_table import ConstraintTable, constraint_table
+from dice import Die, all_dice, get_die
+from enums import *
+from main import Game
+from player import Player, RandomAgent
+from pygame_display import PygameDisplay
+from rolloff import RollOffCalculator
+from simulate import SimulationConfig, batch_seed, setup_simulated_game
+from snapshot import GameState
+from streams import make_stream
+from tile import start, tile_named
+
+BENCHMARK_SEED = 0xBE7C
+BASELINE_VERSION = 2
+# Timings only compare within one environment, so a baseline is checked in for each reference environment, named
+# after its environment_id.
+BASELINE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baselines")
+DEFAULT_REPEAT = 5
+# A benchmark regresses when its best time per operation is this much slower than the baseline's.
+DEFAULT_TOLERANCE = 0.25
+
+# A setup function builds its inputs from the given stream and returns the timed function, which returns how many
+# operations it performed. Timed functions start from the same state every call, so every repeat does the same work.
+Setup = Callable[[Generator], Callable[[], int]]
+
+
+class Benchmark(NamedTuple):
+    name: str
+    setup: Setup
+    unit: str
+
+
+def constraint_masks(warm: bool) -> Setup:
+    """
+    Looks up the row constraints each histogram satisfies with ConstraintTable.mask, as claim checks do. A cold
+    table starts every call with an empty cache, so it evaluates each distinct histogram once.
+    """
+    def setup(rng: Generator):
+        table = ConstraintTable(constraint_table.constraints)
+        hists = [tuple(int(count) for count in rng.multinomial(int(dice), [1/6]*6)) for dice in rng.integers(1, 9, size=2000)]
+
+        def run():
+            if not warm:
+                table.masks.clear()
+            for hist in hists:
+                table.mask(hist)
+            return len(hists)
+        return run
+    return setup
+
+
+def die_rolls(rng: Generator):
+    dice = [die.clone() for die in all_dice]
+    seed = int(rng.integers(2**63))
+
+    def run():
+        roll_rng = make_stream(seed)
+        for _ in range(2500):
+            for die in dice:
+                die.roll(roll_rng)
+        return 2500*len(dice)
+    return run
+
+
+def die_pipups(rng: Generator):
+    # Fixed walks of pip-ups from random faces, replayed from the same faces each call.
+    walks: list[tuple[Die, DiceFace, list[int]]] = []
+    for die in all_dice:
+        if not any(face for targets in die.table.pipups.values() for face in targets):
+            continue
+        steps = 0
+        while steps < 2500:
+            first = die.faces[int(rng.integers(die.table.sides))]
+            walker = die.clone().set_face(first)
+            walk: list[int] = []
+            while len(walk) < 4:
+                options = [x for x in range(7) if walker.can_pipup_x(x)]
+                if not options:
+                    break
+                walk.append(options[int(rng.integers(len(options)))])
+                walker.pipup(walk[-1])
+            if walk:
+                walks.append((walker, first, walk))
+                steps += len(walk)
+
+    def run():
+        for die, first, walk in walks:
+            die.set_face(first)
+            for x in walk:
+                die.pipup(x)
+        return sum(len(walk) for _, _, walk in walks)
+    return run
+
+
+def die_flips(rng: Generator):
+    dice = [die.clone().set_face(die.faces[int(rng.integers(die.table.sides))]) for die in all_dice]
+
+    def run():
+        for _ in range(2500):
+            for die in dice:
+                die.flip()
+        return 2500*len(dice)
+    return run
+
+
+def rearrangement_enumeration(size: int, count: int) -> Setup:
+    def setup(rng: Generator):
+        cases: list[list[Die]] = []
+        while len(cases) < count:
+            dice = [get_die(DiceType(int(rng.integers(len(DiceType))))) for _ in range(size)]
+            for die in dice:
+                die.roll(rng)
+            if all(is_numeric(die.face) for die in dice):
+                cases.append(dice)
+        seed = int(rng.integers(2**63))
+
+        def run():
+            agent = RandomAgent("Benchmark", 0, make_stream(seed))
+            for dice in cases:
+                agent.choose_rearrangement(None, None, dice, sum(to_value(die.face).value for die in dice))  # type: ignore
+            return len(cases)
+        return run
+    return setup
+
+
+def frame_game(rng: Generator):
+    """
+    A 4 player game with the given seed, played turn by turn so each frame has something new to draw.
+    """
+    streams = [make_stream(int(seed)) for seed in rng.integers(2**63, size=9)]
+    players = [Player([start.clone()], RandomAgent(f"Player {seat+1}", seat+1, streams[2*seat]),
+                      starting_tokens=seat, rng=streams[2*seat+1]) for seat in range(4)]
+    return Game(players, rng=streams[8])
+
+
+def frames(draw: Callable[[Game], None], frame_count: int = 60) -> Setup:
+    def setup(rng: Generator):
+        seed = int(rng.integers(2**63))
+        # Frames are drawn at turn starts recorded once here, so replaying the game is not timed.
+        game = frame_game(make_stream(seed))
+        states: list[GameState] = []
+        while len(states) < frame_count and not game.game_ended:
+            states.append(game.snapshot())
+            game.play_turn()
+
+        def run():
+            for state in states:
+                game.restore(state)
+                draw(game)
+            return len(states)
+        return run
+    return setup
+
+
+def print_frame(game: Game):
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.print_game()
+
+
+displays: dict[int, PygameDisplay] = {}
+
+
+def draw_frame(game: Game):
+    if id(game) not in displays:
+        displays[id(game)] = PygameDisplay(game)
+        displays[id(game)].draw_board(full=True)
+    displays[id(game)].draw_board()
+
+
+def draw_full_frame(game: Game):
+    if id(game) not in displays:
+        displays[id(game)] = PygameDisplay(game)
+    displays[id(game)].draw_board(full=True)
+
+
+def headless_turns(players: int, turns: int) -> Setup:
+    """
+    Plays seeded games back to back until turns turns have been played, cutting the last game short, so every call
+    times the same number of turns however long the games run.
+    """
+    def setup(rng: Generator):
+        config = SimulationConfig(players=players)
+        seed = int(rng.integers(2**63))
+
+        def run():
+            sequence = batch_seed(seed, 0)
+            played = 0
+            while played < turns:
+                game = setup_simulated_game(config, sequence.spawn(1)[0])
+                game.play_game(max_turns=min(config.max_turns, turns-played))
+                played += game.turns_played
+            return played
+        return run
+    return setup
+
+
+def roll_off_plans(tile_names: list[str]) -> Setup:
+    """
+    Plans the final roll-off of a player with the named tiles, a pip-up and a reroll, against a high score of three sixes.
+    """
+    def setup(rng: Generator):
+        streams = [make_stream(int(seed)) for seed in rng.integers(2**63, size=5)]
+        players = [Player([start.clone()]+([tile_named(name) for name in tile_names] if seat == 0 else []),
+                          RandomAgent(f"Player {seat+1}", seat+1, streams[2*seat]), rng=streams[2*seat+1]) for seat in range(2)]
+        game = Game(players, rng=streams[4])
+        game.begin_final_roll_off()
+        game.high_score = (3, 6)
+        players[0].tokens = [ScarabType.PIPUP, ScarabType.REROLL]
+
+        def run():
+            RollOffCalculator(players[0], game).plan()
+            return 1
+        return run
+    return setup
+
+
+benchmarks = [
+    Benchmark("constraint_mask_cold", constraint_masks(warm=False), "histogram"),
+    Benchmark("constraint_mask_warm", constraint_masks(warm=True), "histogram"),
+    Benchmark("die_roll", die_rolls, "roll"),
+    Benchmark("die_pipup", die_pipups, "pip-up"),
+    Benchmark("die_flip", die_flips, "flip"),
+    Benchmark("rearrangement_2_dice", rearrangement_enumeration(2, 200), "choice"),
+    Benchmark("rearrangement_3_dice", rearrangement_enumeration(3, 200), "choice"),
+    Benchmark("rearrangement_6_dice", rearrangement_enumeration(6, 40), "choice"),
+    Benchmark("print_game", frames(print_frame), "frame"),
+    Benchmark("draw_board", frames(draw_frame), "frame"),
+    Benchmark("draw_board_full", frames(draw_full_frame), "frame"),
+    Benchmark("roll_off_5_dice", roll_off_plans(["FARMER"]), "plan"),
+    Benchmark("roll_off_6_dice", roll_off_plans(["FARMER", "FARMER"]), "plan"),
+    Benchmark("turns_2_players", headless_turns(2, 1500), "turn"),
+    Benchmark("turns_4_players", headless_turns(4, 1500), "turn"),
+    Benchmark("turns_6_players", headless_turns(6, 1500), "turn"),
+]
+
+
+class BenchmarkResult:
+    def __init__(self, unit: str, operations: int, seconds: list[float]) -> None:
+        self.unit = unit
+        self.operations = operations
+        self.seconds = seconds
+
+    @property
+    def seconds_per_op(self):
+        """
+        The best time per operation, which is the least disturbed by other load on the machine.
+        """
+        return min(self.seconds)/self.operations
+
+    @property
+    def ops_per_second(self):
+        return 1/self.seconds_per_op
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]):
+        return BenchmarkResult(data["unit"], data["operations"], data["seconds"])
+
+
+class BenchmarkReport:
+    def __init__(self, seed: int, repeat: int, environment: dict[str, str], results: dict[str, BenchmarkResult]) -> None:
+        self.seed = seed
+        self.repeat = repeat
+        self.environment = environment
+        self.results = results
+
+    def to_dict(self):
+        return {
+            "version": BASELINE_VERSION,
+            "seed": self.seed,
+            "repeat": self.repeat,
+            "environment": self.environment,
+            "results": {name: result.to_dict() for name, result in self.results.items()},
+        }
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]):
+        if data.get("version") != BASELINE_VERSION:
+            raise Exception(f"Unsupported benchmark baseline version {data.get('version')}.")
+        results = {name: BenchmarkResult.from_dict(result) for name, result in data["results"].items()}
+        return BenchmarkReport(data["seed"], data["repeat"], data["environment"], results)
+
+
+def measure(benchmark: Benchmark, repeat: int, seed: int = BENCHMARK_SEED):
+    """
+    Times the benchmark repeat times after one warm-up call.
+    """
+    run = benchmark.setup(make_stream(SeedSequence([seed, benchmarks.index(benchmark)])))
+    operations = run()
+    times: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter()-started)
+    return BenchmarkResult(benchmark.unit, operations, times)
+
+
+def environment_id():
+    """
+    The interpreter, its minor version, the OS and the architecture, e.g. cpython-3.13-linux-x86_64. Timings are
+    only compared between runs with the same ID; finer details such as the kernel version are recorded but ignored.
+    """
+    version = ".".join(platform.python_version_tuple()[:2])
+    return f"{platform.python_implementation()}-{version}-{platform.system()}-{platform.machine()}".lower()
+
+
+def environment():
+    return {
+        "id": environment_id(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+        "numpy": numpy.__version__,
+        "pygame": pygame.version.ver,
+    }
+
+
+def baseline_path(environment_id: str):
+    return os.path.join(BASELINE_DIRECTORY, f"{environment_id}.json")
+
+
+def run_benchmarks(names: list[str] | None = None, repeat: int = DEFAULT_REPEAT, seed: int = BENCHMARK_SEED):
+    selected = [benchmark for benchmark in benchmarks if names is None or benchmark.name in names]
+    if names is not None and len(selected) != len(names):
+        unknown = set(names)-{benchmark.name for benchmark in selected}
+        raise Exception(f"Unknown benchmarks: {', '.join(sorted(unknown))}.")
+    results: dict[str, BenchmarkResult] = {}
+    for benchmark in selected:
+        result = results[benchmark.name] = measure(benchmark, repeat, seed)
+        print(f"{benchmark.name:<24}{result.ops_per_second:>14.1f} {benchmark.unit}/s"
+              f"{result.seconds_per_op*1e6:>14.2f} us/{benchmark.unit}", file=sys.stderr)
+    return BenchmarkReport(seed, repeat, environment(), results)
+
+
+def comparable(report: BenchmarkReport, baseline: BenchmarkReport):
+    """
+    Why the baseline's times can't be compared with the report's, or None when they can.
+    """
+    if baseline.environment["id"] != report.environment["id"]:
+        return f"it was recorded in {baseline.environment['id']}, not {report.environment['id']}"
+    if baseline.seed != report.seed:
+        return f"it was recorded with seed {baseline.seed}, not {report.seed}"
+    if not set(report.results) & set(baseline.results):
+        return "it has none of these benchmarks"
+    return None
+
+
+def compare(report: BenchmarkReport, baseline: BenchmarkReport, tolerance: float = DEFAULT_TOLERANCE):
+    """
+    The benchmarks in both reports whose time per operation rose by more than tolerance, with their slowdown ratio.
+    """
+    regressions: dict[str, float] = {}
+    for name, result in report.results.items():
+        if name in baseline.results:
+            ratio = result.seconds_per_op/baseline.results[name].seconds_per_op
+            if ratio > 1+tolerance:
+                regressions[name] = ratio
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the engine's hot paths and headless games against a stored baseline.")
+    parser.add_argument("--only", nargs="*", help="Benchmark names to run. All by default.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=BENCHMARK_SEED)
+    parser.add_argument("--output", help="Write the results as JSON.")
+    parser.add_argument("--baseline", help="The baseline to compare with. The checked in one for this environment by default.")
+    parser.add_argument("--save-baseline", action="store_true", help="Replace the baseline with these results.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.only, args.repeat, args.seed)
+    path = args.baseline or baseline_path(report.environment["id"])
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report.to_dict(), file, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(report.to_dict(), file, indent=2)
+        print(f"Saved baseline to {path}.")
+        return
+    # Without a comparable baseline nothing was checked, which must not pass for a clean run.
+    if not os.path.exists(path):
+        print(f"No baseline at {path}. Save one with --save-baseline.")
+        sys.exit(2)
+    with open(path) as file:
+        baseline = BenchmarkReport.from_dict(json.load(file))
+    if (reason := comparable(report, baseline)) is not None:
+        print(f"The baseline at {path} is not comparable: {reason}.")
+        sys.exit(2)
+    regressions = compare(report, baseline, args.tolerance)
+    for name, ratio in regressions.items():
+        print(f"{name} regressed: {ratio:.2f}x the baseline time per {report.results[name].unit}.")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} against {path}.")
+
+
+if __name__ == "__main__":
+    main()
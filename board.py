@@ -0,0 +1,101 @@
+from __future__ import annotations
+from collections.abc import Iterator
+from constraint import Constraint
+from constraint_table import constraint_table
+from enums import *
+import undo
+from zobrist import amount_keys, board_hash
+from tile import Tile
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from main import Game
+    from player import Player
+
+MAX_LEVEL = 7
+
+
+def bit_indices(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length()-1
+        mask ^= low
+
+
+class BoardIndex:
+    """
+    Gives every tile on the board a dense ID, in the order of Game.tiles, and tracks tiles as bitsets over those IDs:
+    by level, by type, by condition, which can still be claimed and which each player owns.
+    Game.claim_tile keeps availability and ownership up to date.
+    """
+
+    def __init__(self, game: Game) -> None:
+        self.tiles: list[Tile] = []
+        self.conditions: list[Constraint] = []
+        self.ids: dict[Tile, int] = {}
+        self.levels: dict[int, int] = {}
+        self.types: dict[TileType, int] = {tile_type: 0 for tile_type in TileType}
+        # Tiles whose condition is each constraint's bit in the constraint table.
+        self.by_condition: dict[int, int] = {}
+        for level, row in game.tiles.items():
+            for idx, tile in enumerate(row):
+                tile_id = len(self.tiles)
+                condition = game.get_condition(level, idx)
+                self.tiles.append(tile)
+                self.conditions.append(condition)
+                self.ids[tile] = tile_id
+                self.levels[level] = self.levels.get(level, 0) | 1 << tile_id
+                self.types[tile.type] |= 1 << tile_id
+                condition_bit = constraint_table.bits[condition]
+                self.by_condition[condition_bit] = self.by_condition.get(condition_bit, 0) | 1 << tile_id
+        self.tile_conditions = list(zip(self.tiles, self.conditions))
+        # up_to[n] holds the tiles of level n or lower.
+        self.up_to = [0]*(MAX_LEVEL+1)
+        for n in range(1, MAX_LEVEL+1):
+            self.up_to[n] = self.up_to[n-1] | self.levels.get(n, 0)
+
+        self.available = self.mask(tile for tile in self.tiles if game.amounts[tile] > 0)
+        self.owned: dict[Player, int] = {player: self.mask(tile for tile in player.tiles if tile in self.ids) for player in game.players}
+        self.hash = board_hash(game.amounts[tile] for tile in self.tiles)
+
+    def mask(self, tiles: Iterator[Tile] | list[Tile]):
+        mask = 0
+        for tile in tiles:
+            mask |= 1 << self.ids[tile]
+        return mask
+
+    def select(self, mask: int):
+        return [self.tiles[tile_id] for tile_id in bit_indices(mask)]
+
+    def is_available(self, tile: Tile):
+        return bool(self.available >> self.ids[tile] & 1)
+
+    def owns(self, player: Player, tile: Tile):
+        return tile in self.ids and bool(self.owned.get(player, 0) >> self.ids[tile] & 1)
+
+    def claimable_by(self, player: Player):
+        return self.available & ~self.owned.get(player, 0)
+
+    def levels_up_to(self, level: int):
+        return self.up_to[max(0, min(level, MAX_LEVEL))]
+
+    def satisfied_by(self, constraint_mask: int):
+        """
+        Tiles whose condition is met, given a mask of satisfied constraints from the constraint table.
+        """
+        mask = 0
+        for condition_bit, tiles in self.by_condition.items():
+            if constraint_mask & condition_bit:
+                mask |= tiles
+        return mask
+
+    def claim(self, player: Player, tile: Tile, remaining: int):
+        tile_id = self.ids[tile]
+        tile_bit = 1 << tile_id
+        undo.save(self, "hash")
+        self.hash ^= amount_keys[tile_id][remaining+1] ^ amount_keys[tile_id][remaining]
+        undo.save_item(self.owned, player)
+        self.owned[player] = self.owned.get(player, 0) | tile_bit
+        if remaining == 0:
+            undo.save(self, "available")
+            self.available &= ~tile_bit
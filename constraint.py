@@ -1,3 +1,4 @@
+from collections import Counter
 from collections.abc import Callable
 from enums import *
 
@@ -17,7 +18,7 @@ def constraint_union(*args: ConstraintFunc) -> ConstraintFunc:
 
 
 def get_freq_dist(dice: list[DiceValue]):
-    freq_dist = {i: dice.count(i) for i in set(dice)}
+    freq_dist = dict(Counter(dice))
     # if DiceFace.STAR_ONE in freq_dist:
     #     freq_dist[DiceFace.ONE] = freq_dist.get(DiceFace.ONE, 0)+freq_dist[DiceFace.STAR_ONE]
     return freq_dist
@@ -40,7 +41,7 @@ def x_y_z_of_a_kind(xyz: list[int]) -> ConstraintFunc:
         face_freq = get_freq_dist(dice)
         set_values = sorted(face_freq.values(), reverse=True)
         for requirement_value in xyz:
-            if set_values[0] < requirement_value:
+            if not set_values or set_values[0] < requirement_value:
                 return False
             set_values[0] -= requirement_value
             set_values.sort(reverse=True)
@@ -138,12 +139,24 @@ class Constraint:
     def __init__(self, name: str, function: ConstraintFunc) -> None:
         self.name = name
         self.function = function
+        constraints_by_name[name] = self
+
+    def __reduce__(self):
+        # Functions are closures, so constraints are pickled by name and unpickle to the instance defined below.
+        return (constraint_named, (self.name,))
 
     def __str__(self) -> str:
         return self.name
     __repr__ = __str__
 
 
+constraints_by_name: dict[str, Constraint] = {}
+
+
+def constraint_named(name: str):
+    return constraints_by_name[name]
+
+
 pair_constraint = Constraint("Pair", pair)
 three_of_a_kind_constraint = Constraint("3 of a Kind", three_of_a_kind)
 four_of_a_kind_constraint = Constraint("4 of a Kind", four_of_a_kind)
@@ -0,0 +1,120 @@
+import array
+import itertools
+import math
+import struct
+from collections.abc import Iterator
+from constraint import Constraint, a_rows, b_rows, any_roll_constraint, pair_constraint
+from enums import *
+import profiling
+
+Histogram = tuple[int, ...]
+
+TABLE_MAGIC = b"FPCT"
+TABLE_VERSION = 1
+
+
+def histogram(values: list[DiceValue]) -> Histogram:
+    counts = [0]*6
+    for value in values:
+        if value is not DiceValue.NULL:
+            counts[value.value-1] += 1
+    return tuple(counts)
+
+
+def histogram_values(hist: Histogram) -> list[DiceValue]:
+    return [DiceValue(i+1) for i, count in enumerate(hist) for _ in range(count)]
+
+
+def histograms(max_dice: int) -> Iterator[Histogram]:
+    """
+    Yields every 6-bucket histogram with at most max_dice dice, in a fixed order.
+    """
+    for total in range(max_dice+1):
+        # Stars and bars: choose the positions of the 5 bucket dividers among total+5 slots.
+        for dividers in itertools.combinations(range(total+5), 5):
+            counts: list[int] = []
+            previous = -1
+            for divider in dividers:
+                counts.append(divider-previous-1)
+                previous = divider
+            counts.append(total+4-previous)
+            yield tuple(counts)
+
+
+def row_constraints() -> list[Constraint]:
+    constraints = [any_roll_constraint, pair_constraint]
+    for row in a_rows+b_rows:
+        for constraint in row:
+            if constraint not in constraints:
+                constraints.append(constraint)
+    return constraints
+
+
+class ConstraintTable:
+    """
+    Maps a dice value histogram to a bitmask of every constraint it satisfies.
+
+    Masks are computed the first time a histogram is seen, or all at once with build() or load().
+    """
+
+    def __init__(self, constraints: list[Constraint]) -> None:
+        self.constraints = constraints
+        self.bits = {constraint: 1 << i for i, constraint in enumerate(constraints)}
+        self.masks: dict[Histogram, int] = {}
+
+    def evaluate(self, hist: Histogram) -> int:
+        values = histogram_values(hist)
+        mask = 0
+        for constraint in self.constraints:
+            if constraint.function(values):
+                mask |= self.bits[constraint]
+        return mask
+
+    def mask(self, hist: Histogram) -> int:
+        if profiling.enabled:
+            profiling.current.count("constraint_evaluations")
+        mask = self.masks.get(hist)
+        if mask is None:
+            mask = self.masks[hist] = self.evaluate(hist)
+        return mask
+
+    def satisfies(self, values: list[DiceValue], constraint: Constraint) -> bool:
+        return bool(self.mask(histogram(values)) & self.bits[constraint])
+
+    def satisfied(self, mask: int) -> list[Constraint]:
+        return [constraint for constraint in self.constraints if mask & self.bits[constraint]]
+
+    def build(self, max_dice: int):
+        for hist in histograms(max_dice):
+            self.mask(hist)
+
+    def save(self, path: str, max_dice: int):
+        masks = array.array("Q", (self.mask(hist) for hist in histograms(max_dice)))
+        names = "\n".join(constraint.name for constraint in self.constraints).encode()
+        with open(path, "wb") as file:
+            file.write(TABLE_MAGIC)
+            file.write(struct.pack("<HHI", TABLE_VERSION, max_dice, len(names)))
+            file.write(names)
+            masks.tofile(file)
+
+    def load(self, path: str):
+        with open(path, "rb") as file:
+            if file.read(4) != TABLE_MAGIC:
+                raise Exception(f"{path} is not a constraint table.")
+            version, max_dice, names_length = struct.unpack("<HHI", file.read(8))
+            if version != TABLE_VERSION:
+                raise Exception(f"Unsupported constraint table version {version}.")
+            names = file.read(names_length).decode().split("\n")
+            if names != [constraint.name for constraint in self.constraints]:
+                raise Exception(f"Constraint table {path} was built for different constraints.")
+            data = file.read()
+        # Histograms with at most max_dice dice in 6 buckets, one mask each.
+        expected = math.comb(max_dice+6, 6)
+        masks = array.array("Q")
+        if len(data) != expected*masks.itemsize:
+            raise Exception(f"Constraint table {path} holds {len(data)} bytes of masks, but {max_dice} dice need {expected*masks.itemsize}.")
+        masks.frombytes(data)
+        self.masks.update(zip(histograms(max_dice), masks, strict=True))
+
+
+constraint_table = ConstraintTable(row_constraints())
@@ -1,14 +1,54 @@
-import random
+from numpy.random import Generator
 from display import COLOR
 from enums import *
+import profiling
+import undo
+
+from typing import TYPE_CHECKING, Any
+if TYPE_CHECKING:
+    from zobrist import DiceZone
 
 
 class PipUpException(Exception):
     pass
 
 
+class FaceTable:
+    """
+    Immutable lookups for one kind of die, shared by every Die of that kind.
+    """
+    __slots__ = ("face_pairs", "faces", "values", "sides", "face_set", "value_set", "face_values", "flipped", "pipups")
+
+    def __init__(self, face_pairs: list[tuple[DiceFace, DiceFace]]) -> None:
+        self.face_pairs = tuple(tuple(pair) for pair in face_pairs)
+        self.faces = tuple(face for pair in self.face_pairs for face in pair)
+        self.values = tuple(to_value(face) for face in self.faces)
+        self.sides = len(self.faces)
+        self.face_set = frozenset(self.faces)
+        self.value_set = frozenset(value for value in self.values if value is not DiceValue.NULL)
+        self.face_values = {face: to_value(face) for face in DiceFace}
+
+        # The first pair containing a face decides what it flips to.
+        self.flipped: dict[DiceFace, DiceFace] = {}
+        for first, second in self.face_pairs:
+            self.flipped.setdefault(first, second)
+            self.flipped.setdefault(second, first)
+
+        # pipups[face][x] is the first face showing x more pips than face, or None if there is none.
+        self.pipups: dict[DiceFace, tuple[DiceFace | None, ...]] = {}
+        for face in DiceFace:
+            targets: list[DiceFace | None] = []
+            for x in range(7):
+                new_value = x_higher(x, to_value(face))
+                targets.append(next((f for f in self.faces if to_value(f) == new_value), None)
+                               if new_value is not DiceValue.NULL else None)
+            self.pipups[face] = tuple(targets)
+
+
 class Die:
-    power_faces = [DiceFace.STAR, DiceFace.STAR_ONE, DiceFace.STAR_DECREE, DiceFace.TWO_STAR, DiceFace.REROLL]
+    __slots__ = ("dice_type", "table", "starting_value", "face", "power_triggered", "zone")
+
+    power_faces = frozenset([DiceFace.STAR, DiceFace.STAR_ONE, DiceFace.STAR_DECREE, DiceFace.TWO_STAR, DiceFace.REROLL])
     die_color_dict = {
         DiceType.STANDARD: 160,
         DiceType.IMMEDIATE: 244,
@@ -22,65 +62,91 @@ class Die:
 
     def __init__(self, dice_type: DiceType, face_pairs: list[tuple[DiceFace, DiceFace]], starting_face: DiceFace = DiceFace.NULL) -> None:
         self.dice_type = dice_type
-        self.face_pairs = face_pairs
+        self.table = FaceTable(face_pairs)
         self.starting_value = starting_face
         self.face = starting_face
 
         self.power_triggered = False
+        # The player's zone the die is in, which its face changes rekey.
+        self.zone: DiceZone | None = None
 
     def clone(self):
-        return Die(self.dice_type, self.face_pairs, starting_face=self.starting_value)
+        die = Die.__new__(Die)
+        die.dice_type = self.dice_type
+        die.table = self.table
+        die.starting_value = self.starting_value
+        die.face = self.starting_value
+        die.power_triggered = False
+        die.zone = None
+        return die
+
+    def __getstate__(self):
+        # Zones are pickled as lists of their dice and point those back at themselves when unpickled.
+        return {name: getattr(self, name) for name in Die.__slots__ if name != "zone"}
+
+    def __setstate__(self, state: dict[str, Any]):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.zone = None
+
+    @property
+    def face_pairs(self):
+        return self.table.face_pairs
 
     @property
     def faces(self):
-        return [face for pair in self.face_pairs for face in pair]
+        return self.table.faces
 
     @property
     def values(self):
-        return [to_value(face) for face in self.faces]
+        return self.table.values
 
     @property
     def value(self):
-        return to_value(self.face)
+        return self.table.face_values[self.face]
 
     def can_pipup_x(self, x: int):
-        if self.face == DiceFace.NULL:
-            return False
-        return self.has_value(x_higher(x, to_value(self.face)))
+        return 0 <= x < 7 and self.table.pipups[self.face][x] is not None
 
     def get_flipped(self, face: DiceFace) -> DiceFace:
-        for face_pair in self.face_pairs:
-            if face in face_pair:
-                return face_pair[1-face_pair.index(face)]
-        raise Exception(f"Face {face} not on dice {self.dice_type}.")
+        flipped = self.table.flipped.get(face)
+        if flipped is None:
+            raise Exception(f"Face {face} not on dice {self.dice_type}.")
+        return flipped
 
     def flip(self):
         self.set_face(self.get_flipped(self.face))
 
     def has_face(self, face: DiceFace) -> bool:
-        return face in self.faces
+        return face in self.table.face_set
 
     def has_value(self, value: DiceValue) -> bool:
-        return value is not DiceValue.NULL and value in [to_value(face) for face in self.faces]
-
-    def roll(self):
-        self.face = random.choice(self.faces)
+        return value in self.table.value_set
+
+    def roll(self, rng: Generator):
+        if profiling.enabled:
+            profiling.current.count("die_rolls")
+        undo.save(self, "face", "power_triggered")
+        face = self.table.faces[rng.integers(self.table.sides)]
+        if self.zone is not None:
+            self.zone.change_face(self, face)
+        self.face = face
         if self.face in Die.power_faces:
             self.power_triggered = True
         return self.face
 
     def pipup(self, x: int):
-        if not self.can_pipup_x(x):
+        new_face = self.table.pipups[self.face][x] if 0 <= x < 7 else None
+        if new_face is None:
             raise PipUpException(f"Can't Pipup {self.face} on {self.dice_type}")
-        new_value = x_higher(x, to_value(self.face))
-        for face in self.faces:
-            if to_value(face) == new_value:
-                self.set_face(face)
-                return
+        self.set_face(new_face)
 
     def set_face(self, face: DiceFace):
-        if face not in self.faces:
+        if face not in self.table.face_set:
             raise Exception(f"Face {face} not on dice {self.dice_type}.")
+        undo.save(self, "face", "power_triggered")
+        if self.zone is not None:
+            self.zone.change_face(self, face)
         self.face = face
         if self.face in Die.power_faces:
             self.power_triggered = True
@@ -110,5 +176,22 @@ dice_dict = {DiceType.STANDARD: standard,
              DiceType.DECREE: decree}
 
 
+face_tables = {dice_type: die.table for dice_type, die in dice_dict.items()}
+
+
 def get_die(type: DiceType):
     return dice_dict[type].clone()
+
+
+def roll_dice(dice: list[Die], rng: Generator):
+    if profiling.enabled:
+        profiling.current.count("die_rolls", len(dice))
+    indices: list[int] = rng.integers(0, [die.table.sides for die in dice]).tolist()
+    for die, index in zip(dice, indices):
+        undo.save(die, "face", "power_triggered")
+        face = die.table.faces[index]
+        if die.zone is not None:
+            die.zone.change_face(die, face)
+        die.face = face
+        if die.face in Die.power_faces:
+            die.power_triggered = True
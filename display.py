@@ -1,4 +1,8 @@
 # Display
+import shutil
+import sys
+from typing import TextIO
+
 ESC = "\033"
 RESET = f"{ESC}[0m"
 BOLD = f"{ESC}[1m"
@@ -37,46 +41,146 @@ BLUE_SQUARE = f"{FOREGROUND(21)}{SQUARE}{RESET}"
 GREEN_SQUARE = f"{FOREGROUND(76)}{SQUARE}{RESET}"
 
 
+def STYLE(fore: int | None, back: int | None):
+    if fore is None and back is None:
+        return RESET
+    return RESET+(FOREGROUND(fore) if fore is not None else "")+(BACKGROUND(back) if back is not None else "")
+
+
+def MOVE(x: int, y: int):
+    return f"{ESC}[{y+1};{x+1}H"
+
+
+def SCROLL_REGION(top: int, bottom: int):
+    return f"{ESC}[{top+1};{bottom+1}r"
+
+
+CLEAR_SCREEN = f"{ESC}[H{ESC}[2J"
+SAVE_CURSOR = f"{ESC}7"
+RESTORE_CURSOR = f"{ESC}8"
+# Setting or resetting the scroll region also moves the cursor to the top left.
+RESET_SCROLL_REGION = f"{ESC}[r"
+
+# A cell is a character with its foreground and background colors, None being the terminal default.
+Cell = tuple[str, int | None, int | None]
+BLANK: Cell = (HALF_SQUARE, None, None)
+# Unchanged cells between two changed runs are rewritten when that is shorter than moving the cursor past them.
+MAX_GAP = 6
+
+
 class Screen:
-    def __init__(self, values: list[list[str]]) -> None:
-        self.values = [list(row) for row in values]
+    def __init__(self, width: int, height: int) -> None:
+        self.cells: list[list[Cell]] = [[BLANK]*width for _ in range(height)]
 
     @property
     def width(self):
-        return len(self.values[0])
+        return len(self.cells[0])
 
     @property
     def height(self):
-        return len(self.values)
-
-    def print(self):
-        for row in self.values:
-            for char in row:
-                print(char, end="")
-            print()
-
-    def set_char(self, x: int, y: int, value: str):
-        if x >= 0 and y >= 0 and y < len(self.values) and x < len(self.values[y]):
-            self.values[y][x] = value
+        return len(self.cells)
+
+    def copy(self):
+        screen = Screen.__new__(Screen)
+        screen.cells = [row.copy() for row in self.cells]
+        return screen
+
+    def set_char(self, x: int, y: int, char: str, fore: int | None = None, back: int | None = None):
+        if x >= 0 and y >= 0 and y < len(self.cells) and x < len(self.cells[y]):
+            self.cells[y][x] = (char, fore, back)
+
+    def render_span(self, y: int, start: int, end: int, parts: list[str]):
+        """
+        Appends the cells from start to end of row y, only switching colors where a run of one color ends.
+        """
+        style = None
+        for char, fore, back in self.cells[y][start:end]:
+            if (fore, back) != style:
+                style = (fore, back)
+                parts.append(STYLE(fore, back))
+            parts.append(char)
+        parts.append(RESET)
+
+    def render(self, previous: "Screen | None" = None) -> str:
+        """
+        Returns the escape sequence that draws this screen from the top left of the terminal.
+        Given the previously drawn screen, only the cells that differ from it are drawn.
+        """
+        parts: list[str] = []
+        if previous is None or previous.width != self.width or previous.height != self.height:
+            parts.append(CLEAR_SCREEN)
+            for y in range(self.height):
+                self.render_span(y, 0, self.width, parts)
+                parts.append("\n")
+            return "".join(parts)
+        for y, (row, old_row) in enumerate(zip(self.cells, previous.cells)):
+            if row == old_row:
+                continue
+            changed = [x for x in range(self.width) if row[x] != old_row[x]]
+            start = end = changed[0]
+            for x in changed:
+                if x-end > MAX_GAP:
+                    parts.append(MOVE(start, y))
+                    self.render_span(y, start, end+1, parts)
+                    start = x
+                end = x
+            parts.append(MOVE(start, y))
+            self.render_span(y, start, end+1, parts)
+        return "".join(parts)
 
 
 class Text_Canvas:
-    def __init__(self, width: int, height: int) -> None:
-        self.screen = Screen([[HALF_SQUARE]*width]*height)
+    def __init__(self, width: int, height: int, output: TextIO | None = None, log_lines: int | None = None) -> None:
+        """
+        The lines below the frame are a scroll region of their own, log_lines tall or the rest of the terminal by
+        default, so text printed between frames scrolls there and never moves the frame.
+        """
+        self.screen = Screen(width, height)
+        self.previous: Screen | None = None
+        self.output = output
         self.width = width
         self.height = height
+        self.log_lines = log_lines
 
     def draw_text(self, x: int, y: int, text: str, fcolor: int, bcolor: int):
         for i, char in enumerate(text):
-            self.screen.set_char(x+i, y, FB_COLOR(fcolor, bcolor, char))
+            self.screen.set_char(x+i, y, char, fcolor, bcolor)
 
     def draw_rect(self, x: int, y: int, w: int, h: int, color: int):
         for i in range(w):
             for j in range(h):
-                self.screen.set_char(x+i, y+j, COLOR(color, HALF_SQUARE))
+                self.screen.set_char(x+i, y+j, HALF_SQUARE, color)
 
     def display(self):
-        self.screen.print()
+        """
+        Writes the frame in a single write, redrawing only what changed since the last one.
+        The first frame clears the terminal and reserves the log region; later ones leave the cursor where the log
+        left it.
+        """
+        output = self.output if self.output is not None else sys.stdout
+        if self.previous is None:
+            log_lines = self.log_lines if self.log_lines is not None else max(1, shutil.get_terminal_size().lines-self.height)
+            output.write(RESET_SCROLL_REGION+self.screen.render()+SCROLL_REGION(self.height, self.height+log_lines-1)+MOVE(0, self.height))
+        else:
+            output.write(SAVE_CURSOR+self.screen.render(self.previous)+RESTORE_CURSOR)
+        output.flush()
+        self.previous = self.screen.copy()
+
+    def invalidate(self):
+        """
+        Forces the next frame to clear the terminal and redraw the whole screen, e.g. after it was resized.
+        """
+        self.previous = None
+
+    def close(self):
+        """
+        Gives the whole terminal back to scrolling, leaving the cursor in the log region.
+        """
+        if self.previous is not None:
+            output = self.output if self.output is not None else sys.stdout
+            output.write(SAVE_CURSOR+RESET_SCROLL_REGION+RESTORE_CURSOR)
+            output.flush()
+        self.previous = None
 
     def clear(self):
-        self.screen = Screen([[HALF_SQUARE]*self.width]*self.height)
+        self.screen = Screen(self.width, self.height)
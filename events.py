@@ -0,0 +1,133 @@
+from __future__ import annotations
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from constraint import Constraint
+    from dice import Die
+    from main import Game
+    from player import Player
+    from tile import Effect, Tile
+
+# Events are delivered synchronously, so dice lists are the player's live zones at the time of the event.
+
+
+class GameStarted(NamedTuple):
+    game: Game
+
+
+class GameEnded(NamedTuple):
+    game: Game
+
+
+class TurnLimitReached(NamedTuple):
+    game: Game
+    max_turns: int
+
+
+class TurnStarted(NamedTuple):
+    player: Player
+    final_roll_off: bool
+
+
+class TurnEnded(NamedTuple):
+    player: Player
+
+
+class EffectApplied(NamedTuple):
+    player: Player
+    effect: Effect
+
+
+class DiceRolled(NamedTuple):
+    player: Player
+    dice: list[Die]
+
+
+class ActionPhase(NamedTuple):
+    player: Player
+    game: Game
+
+
+class PowerResolved(NamedTuple):
+    player: Player
+    die: Die
+
+
+class ActionFailed(NamedTuple):
+    player: Player
+    reason: str
+
+
+class LockRejected(NamedTuple):
+    player: Player
+    reason: str
+
+
+class DiceLocked(NamedTuple):
+    player: Player
+    dice: list[Die]
+
+
+class RollFinished(NamedTuple):
+    player: Player
+    locked_dice: list[Die]
+
+
+class TileEligible(NamedTuple):
+    player: Player
+    tile: Tile
+    condition: Constraint
+
+
+class NoTileClaimed(NamedTuple):
+    player: Player
+    tokens: int
+
+
+class TileClaimed(NamedTuple):
+    player: Player
+    tile: Tile
+
+
+class ClaimRejected(NamedTuple):
+    player: Player
+    tile: Tile
+    reason: str
+
+
+class FinalRollOffBegan(NamedTuple):
+    game: Game
+
+
+class ScoreSubmitted(NamedTuple):
+    player: Player
+    score: tuple[int, int]
+    took_pharaoh: bool
+
+
+Subscriber = Callable[[Any], None]
+
+
+class EventBus:
+    """
+    Delivers engine events to subscribers. With no subscribers, emit returns before building the event.
+    """
+
+    def __init__(self) -> None:
+        self.subscribers: list[Subscriber] = []
+
+    def subscribe(self, subscriber: Subscriber):
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.remove(subscriber)
+
+    def emit(self, event_type: Callable[..., Any], *args: Any):
+        if not self.subscribers:
+            return
+        event = event_type(*args)
+        for subscriber in self.subscribers:
+            subscriber(event)
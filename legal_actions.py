@@ -0,0 +1,192 @@
+from __future__ import annotations
+import itertools
+from dice import Die, get_die
+from enums import *
+from player import Player, rearrangement_options
+from tile import Tile, astrologer, soothsayer, surveyor
+
+from typing import NamedTuple, TYPE_CHECKING
+if TYPE_CHECKING:
+    from main import Game
+
+# Die indices below refer to player.available_dice at the time the actions were listed.
+
+
+class Lock(NamedTuple):
+    dice: tuple[int, ...]
+
+
+class UseToken(NamedTuple):
+    token: ScarabType
+    die: int
+
+
+class Activate(NamedTuple):
+    tile: Tile
+
+
+class Rearrange(NamedTuple):
+    tile: Tile
+    dice: tuple[int, ...]
+    faces: tuple[DiceFace, ...]
+
+
+class Split(NamedTuple):
+    tile: Tile
+    die: int
+    faces: tuple[DiceFace, ...]
+
+
+class Claim(NamedTuple):
+    tile: Tile
+
+
+class RerollPower(NamedTuple):
+    power_die: int
+    die: int
+
+
+class AdjustPower(NamedTuple):
+    power_die: int
+    adjustments: tuple[tuple[int, DiceFace], ...]
+
+
+class Pass(NamedTuple):
+    pass
+
+
+LegalAction = Lock | UseToken | Activate | Rearrange | Split | Claim | RerollPower | AdjustPower | Pass
+
+rearrange_amounts = {soothsayer: 2, astrologer: 3}
+
+
+def die_groups(dice: list[Die]) -> list[list[int]]:
+    """
+    Indices of the given dice grouped by (type, face), since dice that match on both are interchangeable.
+    """
+    groups: dict[tuple[DiceType, DiceFace], list[int]] = {}
+    for i, die in enumerate(dice):
+        groups.setdefault((die.dice_type, die.face), []).append(i)
+    return list(groups.values())
+
+
+def distinct_dice(dice: list[Die]) -> list[int]:
+    return [group[0] for group in die_groups(dice)]
+
+
+def distinct_selections(dice: list[Die], amount: int, indices: list[int] | None = None) -> list[tuple[int, ...]]:
+    """
+    Every way to pick amount dice from indices (all dice by default), up to swapping interchangeable dice.
+    """
+    if indices is None:
+        indices = list(range(len(dice)))
+    seen: set[tuple[tuple[int, int], ...]] = set()
+    selections: list[tuple[int, ...]] = []
+    for selection in itertools.combinations(indices, amount):
+        signature = tuple(sorted((dice[i].dice_type.value, dice[i].face.value) for i in selection))
+        if signature not in seen:
+            seen.add(signature)
+            selections.append(selection)
+    return selections
+
+
+def lock_actions(player: Player) -> list[Lock]:
+    if not player.available_dice:
+        return [Lock(())]
+    choices: list[list[tuple[int, ...]]] = []
+    for group in die_groups(player.available_dice):
+        if player.available_dice[group[0]].dice_type == DiceType.IMMEDIATE:
+            choices.append([tuple(group)])
+        else:
+            choices.append([tuple(group[:amount]) for amount in range(len(group)+1)])
+    locks: list[Lock] = []
+    for combo in itertools.product(*choices):
+        dice = tuple(sorted(i for part in combo for i in part))
+        if dice:
+            locks.append(Lock(dice))
+    return locks
+
+
+def token_actions(player: Player) -> list[LegalAction]:
+    actions: list[LegalAction] = []
+    dice = player.available_dice
+    if ScarabType.PIPUP in player.tokens:
+        actions.extend(UseToken(ScarabType.PIPUP, i) for i in distinct_dice(dice) if dice[i].can_pipup_x(1))
+    if ScarabType.REROLL in player.tokens:
+        actions.extend(UseToken(ScarabType.REROLL, i) for i in distinct_dice(dice))
+    return actions
+
+
+def rearrange_actions(player: Player, tile: Tile, amount: int) -> list[LegalAction]:
+    dice = player.available_dice
+    numeric = [i for i, die in enumerate(dice) if is_numeric(die.face)]
+    actions: list[LegalAction] = []
+    for selection in distinct_selections(dice, amount, numeric):
+        chosen = [dice[i] for i in selection]
+        total = sum(die.value.value for die in chosen)
+        actions.extend(Rearrange(tile, selection, faces) for faces in rearrangement_options(chosen, total))
+    return actions
+
+
+def split_actions(player: Player, tile: Tile) -> list[LegalAction]:
+    dice = player.available_dice
+    actions: list[LegalAction] = []
+    for i in distinct_dice(dice):
+        if is_numeric(dice[i].face) and dice[i].value.value > 1:
+            halves = [get_die(DiceType.IMMEDIATE) for _ in range(2)]
+            actions.extend(Split(tile, i, faces) for faces in rearrangement_options(halves, dice[i].value.value))
+    return actions
+
+
+def activation_actions(player: Player, game: Game) -> list[LegalAction]:
+    actions: list[LegalAction] = []
+    for tile in player.get_active_tiles(game):
+        if tile in rearrange_amounts:
+            actions.extend(rearrange_actions(player, tile, rearrange_amounts[tile]))
+        elif tile == surveyor:
+            actions.extend(split_actions(player, tile))
+        else:
+            actions.append(Activate(tile))
+    return actions
+
+
+def power_actions(player: Player) -> list[LegalAction]:
+    dice = player.available_dice
+    actions: list[LegalAction] = []
+    for power_die, die in enumerate(dice):
+        if not die.power_triggered:
+            continue
+        if die.face == DiceFace.REROLL:
+            actions.extend(RerollPower(power_die, i) for i in distinct_dice(dice))
+        elif die.face in Die.power_faces:
+            amount = 2 if die.face == DiceFace.TWO_STAR else 1
+            for count in range(amount+1):
+                for selection in distinct_selections(dice, count):
+                    face_choices = [[(i, face) for face in dice[i].faces if face != dice[i].face] for i in selection]
+                    actions.extend(AdjustPower(power_die, tuple(adjustments)) for adjustments in itertools.product(*face_choices))
+    return list(dict.fromkeys(actions))
+
+
+def claim_actions(player: Player, game: Game, dice: list[Die] | None = None) -> list[LegalAction]:
+    return [Claim(tile) for tile, _ in player.claimable_tiles(game, dice if dice is not None else player.locked_dice)]
+
+
+def legal_actions(player: Player, game: Game, claimed: bool = False) -> list[LegalAction]:
+    """
+    Lists the legal actions for the decision the player's current TurnStep calls for.
+
+    After a roll, triggered dice powers must be resolved first; otherwise tokens, activations and locks are legal.
+    In the claim step a player must claim a tile if any is eligible, so the claimable tiles are listed on their own.
+    The optional activations that follow are a decision of their own, listed once claimed is set or when no tile
+    can be claimed. Optional activations outside the roll can be declined with Pass.
+    """
+    if player.step in (TurnStep.ROLLS, TurnStep.LOCK) and player.available_dice:
+        powers = power_actions(player)
+        if powers:
+            return powers
+        return token_actions(player)+activation_actions(player, game)+lock_actions(player)
+    if player.step == TurnStep.CLAIM and not claimed:
+        claims = claim_actions(player, game)
+        if claims:
+            return claims
+    return activation_actions(player, game)+[Pass()]
@@ -0,0 +1,697 @@
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+from numpy.random import Generator
+from constraint import a_rows, b_rows, any_roll_constraint
+from constraint_table import constraint_table
+from dice import Die, face_tables
+from enums import *
+from player import Player, RandomAgent
+from simulate import SimulationResult
+from solver import (ANCESTRAL_GUIDANCE, ANKH, ENTERTAINER, FIXED, GRAIN_MERCHANT, HEAD_SERVANT, HEIR, IMMEDIATE, INCREMENTAL, LOCKED_WILD,
+                    MASTER_ARTISAN, MATCHMAKER, PRIEST, PRIESTESS, REARRANGE, ROYAL_ASTROLOGER, ROYAL_MOTHER, SERVANT, STANDARD, SURVEYOR, TOKENS,
+                    WILD, Activation, activations_of)
+from streams import make_stream
+from tile import (Tile, bad_omen, good_omen, herder, omen, palace_key, pharaohs_gift, queen, queens_favor, royal_death, royal_decree,
+                  royal_power, secret_passage, tile_ids, tiles, tiles_by_name, treasure)
+
+# Dice slots per game. Dice beyond this are not added, which only very large pools reach.
+MAX_DICE = 24
+# Lock tables index rolled value histograms with counts capped here, in base HISTOGRAM_BASE.
+HISTOGRAM_CAP = 7
+HISTOGRAM_BASE = HISTOGRAM_CAP+1
+# Locked histograms are checked against the constraint table with counts capped here, which no condition tells apart.
+CONSTRAINT_CAP = 9
+DEFAULT_BATCH = 4096
+
+EMPTY, PREPARED, AVAILABLE, LOCKED = range(4)
+# Scores are compared as count*SCORE_BASE+value, so ties in count go to the higher value, as Player.score does.
+SCORE_BASE = 8
+START_SCORE = 7*SCORE_BASE
+
+# Tiles are numbered by their tile ID, the same tiles that tile_named can build.
+catalog: list[Tile] = list(tiles_by_name.values())
+catalog_ids = tile_ids
+QUEEN = catalog_ids[queen.name]
+HERDER = catalog_ids[herder.name]
+OMEN = catalog_ids[omen.name]
+GOOD_OMEN = catalog_ids[good_omen.name]
+PALACE_KEY = catalog_ids[palace_key.name]
+ROYAL_DECREE = catalog_ids[royal_decree.name]
+PHARAOHS_GIFT = catalog_ids[pharaohs_gift.name]
+ROYAL_DEATH = catalog_ids[royal_death.name]
+
+# Tiles whose abilities lockstep games do not play, which are left out of random lineups and refused in given ones.
+unplayed_kinds = {REARRANGE, SURVEYOR, GRAIN_MERCHANT, ROYAL_MOTHER}
+unplayed_tiles = {bad_omen, secret_passage, treasure, queens_favor, royal_power}
+# Tiles whose on-claim abilities the games play themselves rather than from claim_tokens.
+claim_tiles = {queen, omen, good_omen, royal_death}
+# Kinds that turn active dice to other faces.
+adjusting_kinds = {SERVANT, PRIEST, PRIESTESS, HEIR, MASTER_ARTISAN, HEAD_SERVANT, ROYAL_ASTROLOGER, ENTERTAINER, MATCHMAKER}
+
+
+def kind_of(tile: Tile) -> Activation:
+    activations = activations_of([tile])
+    return activations[0] if activations else (-1, 0)
+
+
+def is_played(tile: Tile):
+    return tile not in unplayed_tiles and kind_of(tile)[0] not in unplayed_kinds
+
+
+def ability_gains(tile: Tile) -> tuple[list[int], int, int]:
+    """
+    The dice by type and the tokens a tile's turn start ability gives, and the tokens its on-claim ability gives,
+    found by running them for a scratch player.
+    """
+    dice = [0]*len(DiceType)
+    player = Player([], RandomAgent("Probe", 0, make_stream(0)), rng=make_stream(0))
+    if tile.ability.turn_start is not None:
+        tile.ability.turn_start(player, None, tile)  # type: ignore
+    for die in player.prepared_dice:
+        dice[die.dice_type.value] += 1
+    turn_tokens = player.token_count
+    if tile.ability.on_claim is not None and is_played(tile) and tile not in claim_tiles:
+        tile.ability.on_claim(player, None, tile)  # type: ignore
+    return dice, turn_tokens, player.token_count-turn_tokens
+
+
+gains = [ability_gains(tile) for tile in catalog]
+catalog_dice = np.array([dice for dice, _, _ in gains], dtype=np.int16)
+catalog_tokens = np.array([tokens for _, tokens, _ in gains], dtype=np.int16)
+catalog_levels = np.array([tile.level for tile in catalog], dtype=np.int8)
+catalog_types = np.array([tile.type.value for tile in catalog], dtype=np.int8)
+catalog_played = np.array([is_played(tile) for tile in catalog])
+# What each tile does when used, as the solver's activation kind and value, or -1.
+catalog_kinds = [kind_of(tile) for tile in catalog]
+# Tokens for claiming each tile: 1 for a blue tile and 2 for a red one, as Game.claim_tile gives them, and those of
+# its on-claim ability.
+claim_tokens = np.array([0, 1, 2], dtype=np.int16)[catalog_types]+np.array([tokens for _, _, tokens in gains], dtype=np.int16)
+# Tile IDs by when the games use them.
+value_die_ids = [tile_id for tile_id, (kind, _) in enumerate(catalog_kinds) if kind in (FIXED, WILD, INCREMENTAL)]
+adjusting_ids = [tile_id for tile_id, (kind, _) in enumerate(catalog_kinds) if kind in adjusting_kinds]
+first_roll_ids = [tile_id for tile_id, (kind, _) in enumerate(catalog_kinds) if kind in (TOKENS, ANKH, ANCESTRAL_GUIDANCE)]
+locked_wild_ids = [tile_id for tile_id, (kind, _) in enumerate(catalog_kinds) if kind == LOCKED_WILD]
+
+# Faces are stored as indices into each die type's face list.
+face_lists: list[tuple[DiceFace, ...]] = [face_tables[dice_type].faces for dice_type in DiceType]
+face_values = np.array([[max(to_value(face).value, 0) for face in faces] for faces in face_lists], dtype=np.int8)
+add_two_faces = np.array([[face is DiceFace.ADD_TWO for face in faces] for faces in face_lists])
+reroll_faces = np.array([[face is DiceFace.REROLL for face in faces] for faces in face_lists])
+# How many dice each face's power lets its player adjust.
+star_faces = np.array([[2 if face is DiceFace.TWO_STAR else int(face in Die.power_faces and face is not DiceFace.REROLL)
+                        for face in faces] for faces in face_lists], dtype=np.int8)
+# value_faces[dice type, value] is the first face showing value, pipup_faces[dice type, face, x] the face x pips
+# higher and flip_faces[dice type, face] the face on the other side, each -1 when the die has none.
+value_faces = np.array([[next((i for i, face in enumerate(faces) if to_value(face).value == value), -1) for value in range(7)]
+                        for faces in face_lists], dtype=np.int8)
+pipup_faces = np.array([[[-1 if (new := face_tables[dice_type].pipups[face][x]) is None else faces.index(new) for x in range(4)]
+                         for face in faces] for dice_type, faces in zip(DiceType, face_lists)], dtype=np.int8)
+flip_faces = np.array([[faces.index(face_tables[dice_type].flipped[face]) for face in faces]
+                       for dice_type, faces in zip(DiceType, face_lists)], dtype=np.int8)
+SIDES = face_values.shape[1]
+if any(face_tables[dice_type].sides != SIDES for dice_type in DiceType):
+    raise Exception("Lockstep games need every die type to have the same number of sides.")
+
+# Constraint table bit of each row condition, by mode, level and index.
+condition_bits = np.array([[[constraint_table.bits[constraint].bit_length()-1 for constraint in row] for row in rows]
+                           for rows in (a_rows, b_rows)], dtype=np.int8)
+ANY_ROLL_BIT = constraint_table.bits[any_roll_constraint].bit_length()-1
+# Slots follow the order of Game.tiles: four per level from 3 to 7, then the Herder.
+slot_levels = np.array([level for level in range(3, 8) for _ in range(4)]+[1], dtype=np.int8)
+SLOTS = len(slot_levels)
+
+
+def histogram_ranks(counts: np.ndarray, cap: int) -> np.ndarray:
+    return (np.minimum(counts, cap).astype(np.int64)*(cap+1)**np.arange(6)).sum(-1)
+
+
+def all_histograms(cap: int) -> np.ndarray:
+    """
+    Every capped 6-bucket histogram, at the index histogram_ranks gives it.
+    """
+    ranks = np.arange((cap+1)**6)
+    return np.stack([ranks // (cap+1)**i % (cap+1) for i in range(6)], axis=-1).astype(np.int16)
+
+
+# Constraint table masks by capped histogram rank, filled in as histograms are first seen.
+known_masks = np.zeros((CONSTRAINT_CAP+1)**6, dtype=bool)
+mask_table = np.zeros((CONSTRAINT_CAP+1)**6, dtype=np.int64)
+
+
+def constraint_masks(locked: np.ndarray):
+    ranks = histogram_ranks(locked, CONSTRAINT_CAP)
+    for rank in np.unique(ranks[~known_masks[ranks]]).tolist():
+        mask_table[rank] = constraint_table.mask(tuple(rank // (CONSTRAINT_CAP+1)**i % (CONSTRAINT_CAP+1) for i in range(6)))
+        known_masks[rank] = True
+    return mask_table[ranks]
+
+
+class TableBot:
+    """
+    Plays a seat of lockstep games from lookup tables.
+
+    lock[target, rank] holds how many rolled dice of each value to lock, by the value most of the locked dice show
+    (0 when none are locked, otherwise the value) and the rank of the rolled value histogram. HISTOGRAM_CAP or more
+    locks every die of that value. Immediate dice are locked as well, and a lock of nothing locks every die.
+    claim[tile] is the priority of each catalog tile; the claimable tile with the highest one is taken.
+    Bots do not spend tokens.
+    """
+
+    def __init__(self, lock: np.ndarray, claim: np.ndarray) -> None:
+        if lock.shape != (7, HISTOGRAM_BASE**6, 6):
+            raise Exception(f"Lock tables have shape {(7, HISTOGRAM_BASE**6, 6)}, not {lock.shape}.")
+        if claim.shape != (len(catalog),):
+            raise Exception(f"Claim tables have one priority per catalog tile, not shape {claim.shape}.")
+        self.lock = lock.astype(np.int8)
+        self.claim = claim.astype(np.float32)
+
+
+def dice_priorities():
+    # Tiles that add dice to every turn first, since the Queen needs 7 of a kind, then higher levels.
+    return catalog_dice.sum(1)*8.0+catalog_levels
+
+
+def of_a_kind_bot():
+    """
+    Collects as many dice of one value as it can: the value most locked dice show, or else the most common roll,
+    preferring high values. When no die shows the target, it locks a single die of the most common value.
+    """
+    hists = all_histograms(HISTOGRAM_CAP)
+    # Most common rolled value, ties to the highest.
+    common = np.argmax(hists*8+np.arange(6), axis=-1)
+    lock = np.zeros((7, len(hists), 6), dtype=np.int8)
+    rows = np.arange(len(hists))
+    lock[0, rows, common] = hists[rows, common]
+    for target in range(1, 7):
+        has = hists[:, target-1] > 0
+        lock[target, has, target-1] = hists[has, target-1]
+        lock[target, rows[~has], common[~has]] = np.minimum(hists[~has, common[~has]], 1)
+    return TableBot(lock, dice_priorities())
+
+
+def high_dice_bot():
+    """
+    Locks every 5 and 6, or the single highest die when none shows, for sum and high value conditions.
+    """
+    hists = all_histograms(HISTOGRAM_CAP)
+    lock = np.zeros((7, len(hists), 6), dtype=np.int8)
+    lock[:, :, 4:] = hists[:, 4:]
+    highest = 5-np.argmax(hists[:, ::-1] > 0, axis=-1)
+    none = (hists[:, 4:].sum(-1) == 0) & (hists.sum(-1) > 0)
+    lock[:, none, highest[none]] = 1
+    return TableBot(lock, dice_priorities())
+
+
+bot_builders = {"of-a-kind": of_a_kind_bot, "high-dice": high_dice_bot}
+
+
+class LockstepGames:
+    """
+    Plays a batch of games in lockstep: every unfinished game plays one turn of its current player per step.
+
+    State is held as arrays indexed by game rather than as Game, Player and Die objects, so rolling, locking,
+    histograms and condition checks run on all games at once. Boards are drawn from the tile catalog and the
+    a_rows/b_rows conditions the way Game draws them, and turns follow Player.take_turn: turn start dice and tokens
+    from the tiles owned, roll and lock until no dice are left, dice powers, claiming with the locked dice or gaining
+    2 tokens, and the final roll-off after the Queen is claimed, with +1 Standard die for the seats after the claimer.
+
+    The bots only choose locks and claims; tiles and dice powers are used by fixed rules. Most of them work towards
+    the aim, the value most locked dice show, or else the most common rolled value. After each roll, a reroll face
+    rerolls its own die and star faces adjust dice to the aim. Tiles that change dice turn as many dice to the aim as
+    they may, once per turn and as soon as they change one. Value dice come in after the first roll, the Queen's at
+    the aim, and an incrementing die once its value is the aim. Dice locked with the Spirit or Priest of the Dead
+    show the aim, and the Herder adds its die after a lock with a pair. Red tiles are used at their first chance:
+    the Palace Key, Ankh, Burial Mask and Ancestral Guidance on the next turn, the Royal Decree in the final
+    roll-off, and the Pharaoh's Gift after a roll-off turn that does not beat the high score. The Omens, Royal Death
+    and the Queen act when claimed. Tiles copied with a Decree die are not used, and tokens are not spent.
+    Tiles in unplayed_tiles or of unplayed_kinds are left out.
+    """
+
+    def __init__(self, games: int, bots: list[TableBot], rng: Generator, modes: list[RowMode] | None = None,
+                 tile_names: list[str] | None = None, max_turns: int = 2000) -> None:
+        self.games = games
+        self.players = players = len(bots)
+        self.rng = rng
+        self.max_turns = max_turns
+        self.bot_of_seat = np.arange(players)
+        self.lock_tables = np.stack([bot.lock for bot in bots])
+        self.claim_tables = np.stack([bot.claim for bot in bots])
+
+        if modes is not None:
+            self.modes = np.tile(np.array([mode.value for mode in modes], dtype=np.int8), (games, 1))
+        else:
+            self.modes = rng.integers(2, size=(games, 5)).astype(np.int8)
+        self.tiles = self.lineup(tile_names)
+        self.conditions = np.full((games, SLOTS), ANY_ROLL_BIT, dtype=np.int8)
+        for level in range(3, 8):
+            self.conditions[:, (level-3)*4:(level-2)*4] = condition_bits[self.modes[:, level-3], level-3]
+        amount_by_level = {1: players, 3: players, 4: max(1, players-1), 5: max(1, players-2), 6: max(1, players-2), 7: 1}
+        self.amounts = np.tile(np.array([amount_by_level[level] for level in slot_levels], dtype=np.int8), (games, 1))
+
+        self.owned = np.zeros((games, players, SLOTS), dtype=bool)
+        # Red tiles are used once, after which they stay spent.
+        self.spent = np.zeros((games, players, SLOTS), dtype=bool)
+        # Every player starts with the START tile, which gives 3 Standard dice.
+        self.base_dice = np.zeros(len(DiceType), dtype=np.int16)
+        self.base_dice[STANDARD] = 3
+        self.tokens = np.zeros((games, players, len(ScarabType)), dtype=np.int16)
+        self.add_tokens(np.arange(games), np.tile(np.arange(players), (games, 1)))
+
+        self.dice_types = np.zeros((games, MAX_DICE), dtype=np.int8)
+        self.faces = np.zeros((games, MAX_DICE), dtype=np.int8)
+        self.zones = np.zeros((games, MAX_DICE), dtype=np.int8)
+        # Dice by type that a seat's next turn gains or, below zero, loses.
+        self.extra_dice = np.zeros((games, players, len(DiceType)), dtype=np.int16)
+
+        self.next_player = np.zeros(games, dtype=np.int8)
+        self.turns = np.zeros(games, dtype=np.int32)
+        self.final_roll_off = np.zeros(games, dtype=bool)
+        self.finished = np.zeros((games, players), dtype=bool)
+        self.final_scores = np.zeros((games, players), dtype=np.int16)
+        self.high_score = np.full(games, START_SCORE, dtype=np.int16)
+        self.high_scorer = np.full(games, -1, dtype=np.int8)
+        self.claims = np.zeros(len(catalog), dtype=np.int64)
+
+    def lineup(self, tile_names: list[str] | None):
+        if tile_names is not None:
+            unplayed = sorted(name for name in set(tile_names) if name in catalog_ids and not catalog_played[catalog_ids[name]])
+            if unplayed:
+                raise Exception(f"Lockstep games do not play {', '.join(unplayed)}.")
+        games = self.games
+        board = np.full((games, SLOTS), HERDER, dtype=np.int16)
+        for level in range(3, 8):
+            slot = (level-3)*4
+            for tile_type, amount in ((TileType.YELLOW, 2), (TileType.BLUE, 1), (TileType.RED, 1)):
+                category = [catalog_ids[tile.name] for tile in tiles if tile.level == level and tile.type is tile_type
+                            and (tile.name in tile_names if tile_names is not None else is_played(tile))]
+                if level == 7 and tile_type is TileType.YELLOW:
+                    board[:, slot] = QUEEN
+                    slot += 1
+                    amount -= 1
+                if tile_names is not None:
+                    if len(category) != amount:
+                        raise Exception(f"Incorrect tile setup: expected {amount} level {level} {tile_type.name} tiles, got {len(category)}.")
+                    picks = np.tile(np.arange(amount), (games, 1))
+                else:
+                    picks = np.argsort(self.rng.random((games, len(category))), axis=1)[:, :amount]
+                board[:, slot:slot+amount] = np.array(category, dtype=np.int16)[picks]
+                slot += amount
+        return board
+
+    def add_tokens(self, games: np.ndarray, amounts: np.ndarray, seats: np.ndarray | None = None):
+        # Each token is a pip-up or a reroll with equal chance, as in Player.add_scarabs.
+        amounts = amounts.astype(np.int64)
+        pipups = self.rng.binomial(amounts, 0.5)
+        if seats is None:
+            self.tokens[games, :, ScarabType.PIPUP.value] += pipups.astype(np.int16)
+            self.tokens[games, :, ScarabType.REROLL.value] += (amounts-pipups).astype(np.int16)
+        else:
+            self.tokens[games, seats, ScarabType.PIPUP.value] += pipups.astype(np.int16)
+            self.tokens[games, seats, ScarabType.REROLL.value] += (amounts-pipups).astype(np.int16)
+
+    def add_dice(self, games: np.ndarray, counts: np.ndarray):
+        """
+        Puts counts[i, dice type] new dice to roll into empty slots of games[i], and returns the rows of games and
+        the slots they went to.
+        """
+        empty = self.zones[games] == EMPTY
+        # The n-th empty slot of each game takes the n-th new die, in type order.
+        order = np.cumsum(empty, axis=1, dtype=np.int8)-1
+        bounds = np.cumsum(counts, axis=1)
+        dice_types = (order[:, :, None] >= bounds[:, None, :]).sum(-1)
+        new = empty & (order < bounds[:, -1:])
+        rows, columns = np.nonzero(new)
+        self.dice_types[games[rows], columns] = dice_types[rows, columns]
+        self.zones[games[rows], columns] = PREPARED
+        return rows, columns
+
+    def add_standard_dice(self, games: np.ndarray, values: np.ndarray | None = None, zone: int = PREPARED):
+        """
+        Adds a Standard die to each game, to roll, or showing values and put in zone.
+        """
+        counts = np.zeros((len(games), len(DiceType)), dtype=np.int16)
+        counts[:, STANDARD] = 1
+        rows, columns = self.add_dice(games, counts)
+        if values is not None:
+            self.faces[games[rows], columns] = value_faces[STANDARD, values[rows]]
+            self.zones[games[rows], columns] = zone
+
+    def use(self, games: np.ndarray, seats: np.ndarray, ready: np.ndarray, board: np.ndarray, tile_id: int, allowed: np.ndarray | None = None):
+        """
+        Uses the tile in the games where it is ready and allowed, and returns which those are. It is no longer ready
+        this turn, and a red tile is spent.
+        """
+        mask = ready & (board == tile_id)
+        if allowed is not None:
+            mask &= allowed[:, None]
+        ready &= ~mask
+        if catalog_types[tile_id] == TileType.RED.value:
+            rows, slots = np.nonzero(mask)
+            self.spent[games[rows], seats[rows], slots] = True
+        return mask.any(1)
+
+    def values(self, games: np.ndarray):
+        return face_values[self.dice_types[games], self.faces[games]]
+
+    def histogram(self, values: np.ndarray, mask: np.ndarray):
+        # Each game counts into its own 7 buckets, with bucket 0 for dice without a value.
+        buckets = values+np.arange(len(values))[:, None]*7
+        return np.bincount(buckets[mask], minlength=len(values)*7).reshape(-1, 7)[:, 1:]
+
+    def aim(self, games: np.ndarray):
+        """
+        The value most locked dice show, or else the most common rolled value, ties to the higher value. 0 when no
+        die shows a value.
+        """
+        values = self.values(games)
+        zones = self.zones[games]
+        locked = self.histogram(values, zones == LOCKED)
+        hists = np.where(locked.any(1, keepdims=True), locked, self.histogram(values, zones == AVAILABLE))
+        return np.where(hists.any(1), np.argmax(hists*8+np.arange(6), axis=1)+1, 0)
+
+    def roll(self, games: np.ndarray):
+        """
+        Rolls the dice to roll and returns which dice were rolled.
+        """
+        zones = self.zones[games]
+        rolling = zones == PREPARED
+        self.faces[games] = np.where(rolling, self.rng.integers(SIDES, size=zones.shape), self.faces[games])
+        self.zones[games] = np.where(rolling, AVAILABLE, zones)
+        return rolling
+
+    def adjusted_faces(self, kind: int, games: np.ndarray, aim: np.ndarray):
+        """
+        The faces a tile of kind would turn each active die to so that it shows the aim, and which dice it can turn.
+        """
+        dice_types = self.dice_types[games].astype(np.intp)
+        faces = self.faces[games].astype(np.intp)
+        target = aim[:, None]
+        active = self.zones[games] == AVAILABLE
+        if kind in (PRIEST, PRIESTESS):
+            new = pipup_faces[dice_types, faces, 1 if kind == PRIEST else 2]
+        elif kind == SERVANT:
+            new = np.full(faces.shape, -1, dtype=np.int8)
+            for x in (3, 2, 1):
+                pipped = pipup_faces[dice_types, faces, x]
+                new = np.where((pipped >= 0) & (face_values[dice_types, pipped] == target), pipped, new)
+        elif kind == HEIR:
+            # One pip in each of its two rounds, or in just one of them.
+            once = pipup_faces[dice_types, faces, 1]
+            twice = np.where(once >= 0, pipup_faces[dice_types, once, 1], -1)
+            new = np.where((once >= 0) & (face_values[dice_types, once] == target), once, twice)
+        elif kind == ENTERTAINER:
+            new = flip_faces[dice_types, faces]
+        else:
+            new = value_faces[dice_types, target]
+            if kind == HEAD_SERVANT:
+                active &= dice_types == IMMEDIATE
+            elif kind == ROYAL_ASTROLOGER:
+                active &= dice_types != STANDARD
+            elif kind == MATCHMAKER:
+                # Only a value some locked die shows can be matched.
+                active &= ((self.zones[games] == LOCKED) & (self.values(games) == target)).any(1, keepdims=True)
+        shown = (new >= 0) & (face_values[dice_types, new] == target)
+        return new, active & shown & (face_values[dice_types, faces] != target)
+
+    def adjust(self, games: np.ndarray, new: np.ndarray, movable: np.ndarray, limit: np.ndarray | int):
+        """
+        Turns up to limit of the dice movable marks in each game to their new faces, in slot order.
+        """
+        chosen = movable & (np.cumsum(movable, axis=1) <= np.reshape(limit, (-1, 1)))
+        self.faces[games] = np.where(chosen, new, self.faces[games])
+
+    def resolve_powers(self, games: np.ndarray, rolled: np.ndarray):
+        """
+        Rerolls every rolled die showing a reroll face until none does, each rerolling itself, then has each star face
+        adjust its dice to the aim.
+        """
+        rerolling = rolled & reroll_faces[self.dice_types[games], self.faces[games]]
+        while rerolling.any():
+            rows, columns = np.nonzero(rerolling)
+            self.faces[games[rows], columns] = self.rng.integers(SIDES, size=len(rows))
+            rerolling = rolled & reroll_faces[self.dice_types[games], self.faces[games]]
+        stars = (rolled*star_faces[self.dice_types[games], self.faces[games]]).sum(1)
+        if stars.any():
+            games, stars = games[stars > 0], stars[stars > 0]
+            new, movable = self.adjusted_faces(MASTER_ARTISAN, games, self.aim(games))
+            self.adjust(games, new, movable, stars)
+
+    def act(self, games: np.ndarray, seats: np.ndarray, ready: np.ndarray, board: np.ndarray, rolled: np.ndarray, rolls: int):
+        """
+        Resolves the powers rolled and uses the tiles that act after a roll, the rolls-th of the turn.
+        """
+        self.resolve_powers(games, rolled)
+        present: set[int] = set(np.unique(board[ready]).tolist())
+        if rolls == 1:
+            for tile_id in present.intersection(first_roll_ids):
+                rows = self.use(games, seats, ready, board, tile_id)
+                kind, value = catalog_kinds[tile_id]
+                if kind == TOKENS:
+                    self.add_tokens(games[rows], np.full(rows.sum(), value), seats[rows])
+                elif kind == ANKH:
+                    self.add_tokens(games[rows], self.tokens[games[rows], seats[rows]].sum(-1), seats[rows])
+                else:
+                    self.add_tokens(games[rows], np.full(rows.sum(), 2), seats[rows])
+                    self.add_standard_dice(games[rows])
+        aim = self.aim(games)
+        for tile_id in present.intersection(value_die_ids):
+            kind, value = catalog_kinds[tile_id]
+            if kind == INCREMENTAL:
+                values = np.full(len(games), min(rolls, 6))
+                allowed = aim == values
+            elif rolls == 1:
+                values = np.where(aim > 0, aim, 6) if kind == WILD else np.full(len(games), value)
+                allowed = None
+            else:
+                continue
+            rows = self.use(games, seats, ready, board, tile_id, allowed)
+            self.add_standard_dice(games[rows], values[rows], AVAILABLE)
+        for tile_id in present.intersection(adjusting_ids):
+            kind = catalog_kinds[tile_id][0]
+            # Only the games with the tile ready are looked at, which are few.
+            holders = np.nonzero((ready & (board == tile_id)).any(1))[0]
+            new, movable = self.adjusted_faces(kind, games[holders], aim[holders])
+            changing = movable.any(1)
+            allowed = np.zeros(len(games), dtype=bool)
+            allowed[holders] = changing
+            self.use(games, seats, ready, board, tile_id, allowed)
+            self.adjust(games[holders[changing]], new[changing], movable[changing],
+                        1 if kind in (SERVANT, MASTER_ARTISAN, MATCHMAKER) else MAX_DICE)
+
+    def lock(self, games: np.ndarray, seats: np.ndarray):
+        """
+        Locks the dice the seats' bots choose and returns which games locked a pair and which locked every die.
+        """
+        zones = self.zones[games]
+        values = self.values(games)
+        available = zones == AVAILABLE
+        locked = self.histogram(values, zones == LOCKED)
+        rolled = self.histogram(values, available)
+        target = np.where(locked.max(1) > 0, np.argmax(locked*8+np.arange(6), axis=1)+1, 0)
+        keep = self.lock_tables[self.bot_of_seat[seats], target, histogram_ranks(rolled, HISTOGRAM_CAP)].astype(np.int16)
+        keep[keep >= HISTOGRAM_CAP] = MAX_DICE
+        # Each die's position among the rolled dice showing its value.
+        matches = (values[:, :, None] == np.arange(1, 7)) & available[:, :, None]
+        position = np.cumsum(matches, axis=1, dtype=np.int8)
+        to_lock = (matches & (position <= keep[:, None, :])).any(-1)
+        to_lock |= available & (self.dice_types[games] == IMMEDIATE)
+        nothing = ~to_lock.any(1)
+        to_lock[nothing] = available[nothing]
+        self.zones[games] = np.where(to_lock, LOCKED, np.where(available, PREPARED, zones))
+        pair = self.histogram(values, to_lock).max(1) >= 2
+        add_two = (to_lock & add_two_faces[self.dice_types[games], self.faces[games]]).sum(1)
+        if add_two.any():
+            counts = np.zeros((len(games), len(DiceType)), dtype=np.int16)
+            counts[:, STANDARD] = 2*add_two
+            self.add_dice(games, counts)
+        return pair, ~(self.zones[games] == PREPARED).any(1)
+
+    def after_lock(self, games: np.ndarray, seats: np.ndarray, ready: np.ndarray, board: np.ndarray, pair: np.ndarray, locked_all: np.ndarray):
+        present: set[int] = set(np.unique(board[ready]).tolist())
+        for tile_id in present.intersection(locked_wild_ids):
+            rows = self.use(games, seats, ready, board, tile_id, locked_all)
+            aim = self.aim(games[rows])
+            self.add_standard_dice(games[rows], np.where(aim > 0, aim, 6), LOCKED)
+        if HERDER in present:
+            self.add_standard_dice(games[self.use(games, seats, ready, board, HERDER, pair)])
+
+    def score(self, games: np.ndarray):
+        values = self.values(games)
+        locked = self.histogram(values, self.zones[games] == LOCKED)
+        best = np.argmax(locked*8+np.arange(6), axis=1)
+        counts = locked[np.arange(len(games)), best]
+        return np.where(counts > 0, counts*SCORE_BASE+best+1, 0).astype(np.int16)
+
+    def submit_scores(self, games: np.ndarray, seats: np.ndarray, scores: np.ndarray | None = None):
+        if scores is None:
+            scores = np.maximum(self.final_scores[games, seats], self.score(games))
+        self.final_scores[games, seats] = scores
+        took = (scores > self.high_score[games]) & (scores > 0)
+        self.high_score[games[took]] = scores[took]
+        self.high_scorer[games[took]] = seats[took]
+
+    def claim(self, games: np.ndarray, seats: np.ndarray):
+        values = self.values(games)
+        locked_mask = self.zones[games] == LOCKED
+        masks = constraint_masks(self.histogram(values, locked_mask))
+        satisfied = (masks[:, None] >> self.conditions[games].astype(np.int64) & 1).astype(bool)
+        claimable = (satisfied & (self.amounts[games] > 0) & ~self.owned[games, seats]
+                     & (slot_levels <= locked_mask.sum(1)[:, None]))
+        board = self.tiles[games]
+        priorities = np.where(claimable, self.claim_tables[self.bot_of_seat[seats][:, None], board], -np.inf)
+        slots = np.argmax(priorities, axis=1)
+        claimed = claimable.any(1)
+
+        # Games where nothing could be claimed give 2 tokens instead.
+        self.add_tokens(games[~claimed], np.full((~claimed).sum(), 2), seats[~claimed])
+        games, seats, slots = games[claimed], seats[claimed], slots[claimed]
+        tile_ids = board[claimed, slots]
+        self.amounts[games, slots] -= 1
+        self.owned[games, seats, slots] = True
+        self.add_tokens(games, claim_tokens[tile_ids], seats)
+        np.add.at(self.claims, tile_ids, 1)
+
+        # The Omens and Royal Death give their claimer the next turn, the Omen with a Standard die fewer.
+        again = np.isin(tile_ids, (OMEN, GOOD_OMEN, ROYAL_DEATH))
+        self.next_player[games[again]] = seats[again]
+        omens = tile_ids == OMEN
+        self.extra_dice[games[omens], seats[omens], STANDARD] -= 1
+        deaths = tile_ids == ROYAL_DEATH
+        self.extra_dice[games[deaths], seats[deaths], IMMEDIATE] += 2
+        queens = tile_ids == QUEEN
+        self.submit_scores(games[queens], seats[queens])
+        roll_offs = queens | deaths
+        if roll_offs.any():
+            self.begin_final_roll_off(games[roll_offs])
+
+    def begin_final_roll_off(self, games: np.ndarray):
+        self.final_roll_off[games] = True
+        # Seats from the next player to the last get +1 Standard die, as Game.begin_final_roll_off gives them.
+        self.extra_dice[games, :, STANDARD] += np.arange(self.players) >= self.next_player[games][:, None]
+
+    def end_roll_off_turns(self, games: np.ndarray, seats: np.ndarray, ready: np.ndarray, board: np.ndarray):
+        """
+        Scores the roll-off turns, or redoes those that do not beat the high score with a Pharaoh's Gift.
+        """
+        scores = np.maximum(self.final_scores[games, seats], self.score(games))
+        redo = self.use(games, seats, ready, board, PHARAOHS_GIFT, scores <= self.high_score[games])
+        self.final_scores[games[redo], seats[redo]] = 0
+        self.next_player[games[redo]] = seats[redo]
+        games, seats = games[~redo], seats[~redo]
+        self.submit_scores(games, seats, scores[~redo])
+        self.finished[games, seats] = True
+
+    def play_turns(self):
+        """
+        Plays one turn in every unfinished game and returns how many turns were played.
+        """
+        games = np.nonzero(~self.finished.all(1) & (self.turns < self.max_turns))[0]
+        if not len(games):
+            return 0
+        seats = self.next_player[games].astype(np.int64)
+        self.next_player[games] = (seats+1) % self.players
+        roll_off = self.final_roll_off[games]
+
+        # Turn start: the START tile's dice, the dice and tokens of owned tiles, the Palace Key, the Royal Decree in
+        # the final roll-off and any dice gained or lost for the turn.
+        board = self.tiles[games]
+        owned = self.owned[games, seats]
+        ready = owned & ~self.spent[games, seats]
+        counts = self.base_dice+(catalog_dice[board]*owned[:, :, None]).sum(1)+self.extra_dice[games, seats]
+        self.extra_dice[games, seats] = 0
+        self.add_tokens(games, (catalog_tokens[board]*owned).sum(1), seats)
+        counts[:, STANDARD] += 2*self.use(games, seats, ready, board, PALACE_KEY)
+        counts[:, IMMEDIATE] += 3*self.use(games, seats, ready, board, ROYAL_DECREE, roll_off)
+        self.zones[games] = EMPTY
+        self.add_dice(games, np.maximum(counts, 0))
+
+        rolling, rolling_seats, rolling_ready, rolling_board = games, seats, ready.copy(), board
+        rolls = 0
+        while True:
+            rolls += 1
+            rolled = self.roll(rolling)
+            self.act(rolling, rolling_seats, rolling_ready, rolling_board, rolled, rolls)
+            pair, locked_all = self.lock(rolling, rolling_seats)
+            self.after_lock(rolling, rolling_seats, rolling_ready, rolling_board, pair, locked_all)
+            still = (self.zones[rolling] == PREPARED).any(1)
+            if not still.any():
+                break
+            rolling, rolling_seats = rolling[still], rolling_seats[still]
+            rolling_ready, rolling_board = rolling_ready[still], rolling_board[still]
+
+        if roll_off.any():
+            self.end_roll_off_turns(games[roll_off], seats[roll_off], ready[roll_off], board[roll_off])
+        if (~roll_off).any():
+            self.claim(games[~roll_off], seats[~roll_off])
+        self.turns[games] += 1
+        return len(games)
+
+    def play(self):
+        total = 0
+        while played := self.play_turns():
+            total += played
+        return total
+
+    def result(self) -> SimulationResult:
+        result = SimulationResult(self.players)
+        ended = self.finished.all(1)
+        result.games = self.games
+        result.unfinished = int((~ended).sum())
+        winners = self.high_scorer[ended]
+        result.no_winner = int((winners < 0).sum())
+        result.wins = np.bincount(winners[winners >= 0], minlength=self.players).tolist()
+        result.total_turns = int(self.turns.sum())
+        result.min_turns = int(self.turns.min())
+        result.max_turns = int(self.turns.max())
+        for score, amount in zip(*np.unique(self.final_scores, return_counts=True)):
+            key = f"{score // SCORE_BASE}x{score % SCORE_BASE}"
+            result.score_counts[key] = int(amount)
+        for tile_id, amount in zip(*np.unique(self.tiles, return_counts=True)):
+            result.tile_offered[catalog[int(tile_id)].name] = int(amount)
+        result.tile_claims = {catalog[tile_id].name: int(amount) for tile_id, amount in enumerate(self.claims) if amount}
+        return result
+
+
+def simulate_lockstep(games: int, bots: list[TableBot], seed: int = 0, batch_size: int = DEFAULT_BATCH,
+                      modes: list[RowMode] | None = None, tile_names: list[str] | None = None, max_turns: int = 2000) -> SimulationResult:
+    """
+    Plays games in lockstep batches of batch_size, one bot per seat, and merges their statistics.
+    """
+    rng = make_stream(seed)
+    result = SimulationResult(len(bots))
+    for start_game in range(0, games, batch_size):
+        batch = LockstepGames(min(batch_size, games-start_game), bots, rng, modes, tile_names, max_turns)
+        batch.play()
+        result.merge(batch.result())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play table-driven bots in batches of games run in lockstep.")
+    parser.add_argument("--games", type=int, default=DEFAULT_BATCH)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--bots", nargs="*", choices=list(bot_builders), help="One bot per seat, of-a-kind by default.")
+    parser.add_argument("--modes", help="Row sides for levels 3-7, e.g. ABABA. Random by default.")
+    parser.add_argument("--tiles", nargs="*", help="Tile names for the lineup. Random by default.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH)
+    parser.add_argument("--max-turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    names = args.bots or ["of-a-kind"]*args.players
+    if len(names) != args.players:
+        raise Exception(f"Expected {args.players} bots, got {len(names)}.")
+    built = {name: bot_builders[name]() for name in set(names)}
+    started = time.perf_counter()
+    result = simulate_lockstep(args.games, [built[name] for name in names], seed=args.seed, batch_size=args.batch_size,
+                               modes=[RowMode[mode] for mode in args.modes] if args.modes else None,
+                               tile_names=args.tiles, max_turns=args.max_turns)
+    elapsed = time.perf_counter()-started
+    print(result.summary())
+    print(f"{result.total_turns} turns in {elapsed:.1f}s, {result.total_turns/elapsed*60:,.0f} turns per minute")
+
+
+if __name__ == "__main__":
+    main()
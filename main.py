@@ -1,25 +1,37 @@
+from numpy.random import Generator
+from typing import Any
 
-import random
-
-from display import BOLD, RESET, Text_Canvas
+from board import BoardIndex
+from display import Text_Canvas
+from events import *
 from pygame_display import PygameDisplay
 from tile import *
 from enums import *
 from constraint import Constraint, a_rows, b_rows, any_roll_constraint
-from player import Agent, Player
+from player import Player, TerminalAgent
+from snapshot import GameState
+import undo
+from zobrist import board_hash
+from streams import make_stream, sample, spawn_streams
+from terminal_log import TerminalLog
 
 
 class TileSet:
     def __init__(self, tiles: list[Tile]) -> None:
         self.tiles = tiles
+        self.categories: dict[tuple[int, TileType], list[Tile]] = {}
+        for tile in tiles:
+            self.categories.setdefault((tile.level, tile.type), []).append(tile)
 
     def get_category(self, level: int, type: TileType):
-        return [tile for tile in self.tiles if tile.level == level and tile.type == type]
+        return self.categories.get((level, type), [])
 
 
 class Game:
-    def __init__(self, players: list[Player], modes: list[RowMode] | None = None, tiles: list[Tile] | None = None, ) -> None:
-        self.modes = modes or [random.choice([RowMode.A, RowMode.B]) for _ in range(5)]
+    def __init__(self, players: list[Player], modes: list[RowMode] | None = None, tiles: list[Tile] | None = None, rng: Generator | None = None) -> None:
+        self.rng = rng if rng is not None else make_stream()
+        self.events = EventBus()
+        self.modes = modes or [RowMode(int(mode)) for mode in self.rng.integers(2, size=5)]
         self.players = players
         self.tiles: dict[int, list[Tile]] = {}
 
@@ -28,13 +40,16 @@ class Game:
         self.high_scorer: Player | None = None
 
         self.next_player_turn = 0
+        self.turns_played = 0
+        # Created by the first print_game, as games that are never printed don't need it.
+        self.canvas: Text_Canvas | None = None
 
         if tiles is None:
             for level in range(3, 8):
-                yellows = random.sample(tile_set.get_category(level, TileType.YELLOW), 2) if level != 7 else [
-                    queen]+random.sample(tile_set.get_category(level, TileType.YELLOW), 1)
-                blue = random.sample(tile_set.get_category(level, TileType.BLUE), 1)
-                red = random.sample(tile_set.get_category(level, TileType.RED), 1)
+                yellows = sample(self.rng, tile_set.get_category(level, TileType.YELLOW), 2) if level != 7 else [
+                    queen]+sample(self.rng, tile_set.get_category(level, TileType.YELLOW), 1)
+                blue = sample(self.rng, tile_set.get_category(level, TileType.BLUE), 1)
+                red = sample(self.rng, tile_set.get_category(level, TileType.RED), 1)
                 self.tiles[level] = yellows+blue+red
         else:
             for level in range(3, 8):
@@ -59,6 +74,50 @@ class Game:
         for level, tiles in self.tiles.items():
             for tile in tiles:
                 self.amounts[tile] = amount_by_level[level]
+        self.board = BoardIndex(self)
+
+    def __getstate__(self):
+        # Subscribers and the canvas belong to the process showing the game, so copies start without them.
+        state = self.__dict__.copy()
+        del state["events"], state["canvas"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]):
+        self.__dict__.update(state)
+        self.events = EventBus()
+        self.canvas = None
+
+    def snapshot(self):
+        """
+        Captures the mutable state of the game and its players, to be put back with restore.
+        Agents, event subscribers and the board layout are not part of it.
+        """
+        return GameState(
+            tuple(player.snapshot() for player in self.players),
+            tuple(self.amounts.values()),
+            self.board.available,
+            tuple(self.board.owned.get(player, 0) for player in self.players),
+            self.final_roll_off,
+            self.high_score,
+            self.players.index(self.high_scorer) if self.high_scorer is not None else None,
+            self.next_player_turn,
+            self.turns_played,
+            self.rng.bit_generator.state,
+        )
+
+    def restore(self, state: GameState):
+        for player, player_state in zip(self.players, state.players):
+            player.restore(player_state)
+        self.amounts.update(zip(self.board.tiles, state.amounts))
+        self.board.available = state.available
+        self.board.owned = dict(zip(self.players, state.owned))
+        self.board.hash = board_hash(state.amounts)
+        self.final_roll_off = state.final_roll_off
+        self.high_score = state.high_score
+        self.high_scorer = self.players[state.high_scorer] if state.high_scorer is not None else None
+        self.next_player_turn = state.next_player_turn
+        self.turns_played = state.turns_played
+        self.rng.bit_generator.state = state.rng
 
     @property
     def game_ended(self):
@@ -79,18 +138,19 @@ class Game:
             return b_rows[level-3][idx]
 
     def get_all_tiles(self):
-        return [tile for row in self.tiles.values() for tile in row]
+        return self.board.tiles
 
     def get_available_tiles(self, player: Player, condition: Callable[[Tile], bool]) -> list[Tile]:
-        return [tile for tile in self.get_all_tiles() if tile not in player.tiles and self.tile_available(tile) and condition(tile)]
+        return [tile for tile in self.board.select(self.board.claimable_by(player)) if condition(tile)]
 
     def print_game(self):
         # self.print_tiles()
         # return
 
-        canvas_width = 180
-        canvas_height = 60
-        canvas = Text_Canvas(canvas_width, canvas_height)
+        if self.canvas is None:
+            self.canvas = Text_Canvas(180, 60)
+        canvas = self.canvas
+        canvas.clear()
         '''
         White 255\n
         Red 196\n
@@ -140,33 +200,31 @@ class Game:
                     return [text[i:i+length] for i in range(0, len(text), length)]
                 for i, row in enumerate(split_string_by_length(tile.description, tile_width-2)):
                     canvas.draw_text(x + 1, y+1+i, row, fcolor=7, bcolor=color_dict[tile.type])
-            canvas.display()
+        canvas.display()
 
     def print_tiles(self):
         for level in range(7, 2, -1):
             print(f"Level {level} Tiles ({self.get_row_mode(level).name} side): {self.tiles[level]}")
 
-    def get_tiles_conditions(self):
-        tiles_and_conditions: list[tuple[Tile, Constraint]] = []
-        for level, tiles in self.tiles.items():
-            for idx, tile in enumerate(tiles):
-                tiles_and_conditions.append((tile, self.get_condition(level, idx)))
-        return tiles_and_conditions
+    def get_tiles_conditions(self) -> list[tuple[Tile, Constraint]]:
+        return self.board.tile_conditions
 
     def tile_available(self, tile: Tile):
-        return self.amounts[tile] > 0
+        return self.board.is_available(tile)
 
     def claim_tile(self, player: Player, tile: Tile):
         if self.final_roll_off:
-            print("Players cannot claim tiles during the final roll-off.")
+            self.events.emit(ClaimRejected, player, tile, "Players cannot claim tiles during the final roll-off.")
             return
-        if tile in player.tiles:
+        if self.board.owns(player, tile):
             raise Exception("Players may only have one of each tile.")
-        if self.amounts[tile] == 0:
+        if not self.board.is_available(tile):
             raise Exception(f"All {tile}s have been claimed.")
+        undo.save_item(self.amounts, tile)
         self.amounts[tile] -= 1
+        self.board.claim(player, tile, self.amounts[tile])
         player.add_tile(tile.clone())
-        print(f"{tile} claimed by {player}!")
+        self.events.emit(TileClaimed, player, tile)
         if tile.type == TileType.BLUE:
             player.add_scarabs(1)
         if tile.type == TileType.RED:
@@ -175,54 +233,54 @@ class Game:
             tile.ability.on_claim(player, self, tile)
 
     def set_next_turn(self, player: Player):
+        undo.save(self, "next_player_turn")
         self.next_player_turn = self.players.index(player)
 
     def begin_final_roll_off(self):
-        def add_red(player: Player, game: Game):
-            player.prepared_dice.append(get_die(DiceType.STANDARD))
+        undo.save(self, "final_roll_off")
         self.final_roll_off = True
         for i in range(self.next_player_turn, len(self.players)):
             self.players[i].add_effect(Effect(add_red))
-        print("The Final Roll-Off has begun!")
+        self.events.emit(FinalRollOffBegan, self)
 
     def submit_score(self, player: Player):
         if player.final_score == (0, 0):
             return
-        print(f"{player} has submitted a score of {player.final_score[0]} {DiceValue(player.final_score[1]).name}s!")
-        if player.final_score > self.high_score:
+        took_pharaoh = player.final_score > self.high_score
+        if took_pharaoh:
+            undo.save(self, "high_scorer", "high_score")
             self.high_scorer = player
             self.high_score = player.final_score
-            print(f"{player} takes the Pharaoh!")
-        else:
-            print(f"{player} does not take the Pharaoh...")
-
-    def play_game(self):
-        print(BOLD+"Welcome to Favor of the Pharaoh!"+RESET)
-        print("================================")
+        self.events.emit(ScoreSubmitted, player, player.final_score, took_pharaoh)
+
+    def play_turn(self):
+        next_player = self.players[self.next_player_turn]
+        undo.save(self, "next_player_turn")
+        self.next_player_turn += 1
+        self.next_player_turn %= len(self.players)
+        next_player.take_turn(self)
+        undo.save(self, "turns_played")
+        self.turns_played += 1
+
+    def play_game(self, max_turns: int | None = None):
+        self.events.emit(GameStarted, self)
         while not self.game_ended:
-            next_player = self.players[self.next_player_turn]
-            self.next_player_turn += 1
-            self.next_player_turn %= len(self.players)
-            next_player.take_turn(self)
-        print("================================")
-        print(BOLD+"Game Over!"+RESET)
-        print("================================")
-        for player in self.players:
-            print(f"{player} scored {player.final_score[0]} {DiceValue(player.final_score[1]).name}s.")
-        if self.high_scorer is not None:
-            print(f"{self.high_scorer} wins!")
-        else:
-            print("Nobody wins!")
+            if max_turns is not None and self.turns_played >= max_turns:
+                self.events.emit(TurnLimitReached, self, max_turns)
+                break
+            self.play_turn()
+        self.events.emit(GameEnded, self)
 
 
 tile_set = TileSet(tiles)
 
 
 def main():
-    player = Player([start.clone()], Agent("Player 1", 4), starting_tokens=0)
-    player2 = Player([start.clone()], Agent("Player 2", 1), starting_tokens=1)
-    random.seed(6)
-    game = Game([player, player2])
+    game_rng, rng1, rng2 = spawn_streams(6, 3)
+    player = Player([start.clone()], TerminalAgent("Player 1", 4), starting_tokens=0, rng=rng1)
+    player2 = Player([start.clone()], TerminalAgent("Player 2", 1), starting_tokens=1, rng=rng2)
+    game = Game([player, player2], rng=game_rng)
+    game.events.subscribe(TerminalLog())
     # game.play_game()
 
     # game.print_game()
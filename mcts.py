@@ -0,0 +1,281 @@
+from __future__ import annotations
+import itertools
+import math
+import pickle
+import time
+from abc import abstractmethod
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from numpy.random import Generator
+from dice import Die
+from enums import *
+from legal_actions import distinct_selections, lock_actions
+from player import Action, Agent, DiceConstraint, RandomAgent, T, dice_options
+from snapshot import GameState
+from streams import make_stream
+from tile import SelectionException
+import undo
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from main import Game
+    from player import Player
+
+TIME_BUDGET = 0.2
+# Time kept back from the budget for sending the game to workers and collecting their results.
+OVERHEAD = 0.02
+ROLLOUT_TURNS = 4
+EXPLORATION = 1.4
+
+
+class ChoiceAgent(Agent):
+    """
+    Reduces every decision to picking an index into a list of candidates, built the same way each time the
+    same state is reached. Interchangeable dice are only offered once, and locks always include Immediate dice.
+    """
+
+    @abstractmethod
+    def pick(self, player: Player, game: Game, amount: int) -> int:
+        """
+        The index of the chosen candidate out of amount.
+        """
+
+    def choose_dice(self, player: Player, game: Game, amount: int, maximum: int | None = -1, message: str = "Choose dice:", constraint: DiceConstraint = lambda d: True, source: list[Die] | None = None) -> list[Die]:
+        available_dice = dice_options(player, constraint, source)
+        if amount > len(available_dice):
+            raise SelectionException(f"Cannot choose {amount} dice from only {len(available_dice)} available.")
+        maximum = len(available_dice) if maximum is None else min(max(maximum, amount), len(available_dice))
+        candidates = [selection for size in range(amount, maximum+1) for selection in distinct_selections(available_dice, size)]
+        return [available_dice[i] for i in candidates[self.pick(player, game, len(candidates))]]
+
+    def choose_item(self, options: list[T], display: Callable[[T], str] = str, message: str | None = None) -> T:
+        if not options:
+            raise ValueError("No options available to choose from.")
+        return options[self.pick(self.player, self.game, len(options))]
+
+    def choose_items(self, prompt: str, options: list[T], min_amount: int, max_amount: int | None = -1) -> list[T]:
+        if min_amount > len(options):
+            raise ValueError(f"Cannot choose {min_amount} items from only {len(options)} options.")
+        max_amount = len(options) if max_amount is None else min(max(max_amount, min_amount), len(options))
+        candidates = [selection for size in range(min_amount, max_amount+1) for selection in itertools.combinations(options, size)]
+        return list(candidates[self.pick(self.player, self.game, len(candidates))])
+
+    def choose_action(self, player: Player, game: Game, actions: list[Action]) -> Action | None:
+        candidates = [None, *actions]
+        return candidates[self.pick(player, game, len(candidates))]
+
+    def choose_lock(self, player: Player, game: Game) -> list[Die]:
+        candidates = lock_actions(player)
+        lock = candidates[self.pick(player, game, len(candidates))]
+        return [player.available_dice[i] for i in lock.dice]
+
+    def start_turn(self, player: Player, game: Game):
+        # choose_item and choose_items are not given the player or game, so they use the ones whose turn it is.
+        self.player = player
+        self.game = game
+
+
+class Node:
+    def __init__(self) -> None:
+        self.visits = 0
+        self.total = 0.0
+        self.children: dict[int, Node] = {}
+
+
+class RolloutAgent(ChoiceAgent):
+    """
+    Plays the searching player in a rollout: replays the decisions already made this turn, then walks the tree
+    with UCB1, adds one node and finishes with random choices.
+
+    The tree is open loop: a node stands for a sequence of choices, whatever the dice did in between.
+    """
+
+    def __init__(self, name: str, color: int, search: Search) -> None:
+        super().__init__(name, color)
+        self.search = search
+        self.rng = search.rng
+        self.replayed = 0
+        self.node: Node | None = search.root
+        self.path = [search.root]
+
+    def pick(self, player: Player, game: Game, amount: int) -> int:
+        prefix = self.search.prefix
+        if self.replayed < len(prefix):
+            self.replayed += 1
+            return prefix[self.replayed-1]
+        if self.node is self.search.root:
+            self.search.reseed()
+        node = self.node
+        if node is None or amount == 1:
+            return int(self.rng.integers(amount))
+        untried = [i for i in range(amount) if i not in node.children]
+        if untried:
+            choice = untried[int(self.rng.integers(len(untried)))]
+            child = node.children[choice] = Node()
+            self.node = None
+        else:
+            log_visits = math.log(max(node.visits, 1))
+            choice = max(range(amount), key=lambda i: node.children[i].total/node.children[i].visits
+                         + EXPLORATION*math.sqrt(log_visits/node.children[i].visits))
+            child = self.node = node.children[choice]
+        self.path.append(child)
+        return choice
+
+
+def evaluate(game: Game, player: Player) -> float:
+    """
+    1 for a win and 0 for a loss once the game is over. Before that, the player's share of the tile levels held by
+    them and their strongest opponent, and during the final roll-off whether they hold the high score.
+    """
+    if game.game_ended or game.final_roll_off:
+        return 1.0 if game.high_scorer is player else 0.0
+    levels = [sum(tile.level for tile in other.tiles) for other in game.players]
+    own = levels[game.players.index(player)]
+    best = max(level for other, level in zip(game.players, levels) if other is not player)
+    return own/(own+best) if own+best else 0.5
+
+
+class Search:
+    """
+    Monte Carlo tree search over one decision, on a copy of the game taken at the start of the searching player's turn.
+
+    Each rollout restores that state, replays the turn's earlier decisions, reseeds every random number generator
+    so rolls differ between rollouts, and plays on for rollout_turns more turns with random opponents.
+    """
+
+    def __init__(self, payload: bytes, prefix: tuple[int, ...], seed: int, rollout_turns: int = ROLLOUT_TURNS) -> None:
+        self.game, self.start, seat = pickle.loads(payload)
+        self.player: Player = self.game.players[seat]
+        self.prefix = prefix
+        self.rng = make_stream(seed)
+        self.rollout_turns = rollout_turns
+        self.root = Node()
+        self.opponents = [RandomAgent(f"Rollout {i}", 0, self.rng) for i in range(len(self.game.players))]
+
+    def reseed(self):
+        for generator in [self.game.rng]+[player.rng for player in self.game.players]:
+            generator.bit_generator.state = type(generator.bit_generator)(int(self.rng.integers(2**63))).state
+
+    def rollout(self, deadline: float):
+        game = self.game
+        game.restore(self.start)
+        agent = RolloutAgent("Rollout", 0, self)
+        for player, opponent in zip(game.players, self.opponents):
+            player.agent = agent if player is self.player else opponent
+        self.player.take_turn(game)
+        game.turns_played += 1
+        for _ in range(self.rollout_turns):
+            if game.game_ended or time.time() >= deadline:
+                break
+            game.play_turn()
+        reward = evaluate(game, self.player)
+        for node in agent.path:
+            node.visits += 1
+            node.total += reward
+
+    def run(self, deadline: float) -> dict[int, tuple[int, float]]:
+        """
+        Runs rollouts until the deadline, at least one, and returns the visits and total reward of each root choice.
+        Rollouts still running at the deadline are cut short after the current turn.
+        """
+        with undo.paused():
+            self.rollout(deadline)
+            while time.time() < deadline:
+                self.rollout(deadline)
+        return {choice: (child.visits, child.total) for choice, child in self.root.children.items()}
+
+
+def search(payload: bytes, prefix: tuple[int, ...], seed: int, deadline: float, rollout_turns: int = ROLLOUT_TURNS):
+    return Search(payload, prefix, seed, rollout_turns).run(deadline)
+
+
+class MCTSAgent(ChoiceAgent):
+    """
+    Chooses by Monte Carlo tree search within a wall-clock budget per decision.
+
+    By default one tree is searched in this process. With workers above one, decisions use root parallelization:
+    each worker searches its own tree from the same state with its own seed until the deadline, and the choice
+    visited most across all trees wins. The trees run on the given executor, which the caller shuts down, or else
+    on a process pool the agent starts on its first search and shuts down in close() or on leaving a with block.
+    Decisions with a single candidate are answered at once.
+
+    simulate already runs games in worker processes, so agents in a SimulationConfig must search serially: a pooled
+    agent there would start a pool of its own in every worker and never close it.
+    """
+
+    def __init__(self, name: str, color: int, rng: Generator | None = None, time_budget: float = TIME_BUDGET,
+                 workers: int | None = None, rollout_turns: int = ROLLOUT_TURNS, executor: Executor | None = None) -> None:
+        super().__init__(name, color)
+        self.rng = rng if rng is not None else make_stream()
+        self.time_budget = time_budget
+        self.workers = workers if workers is not None else 1
+        self.rollout_turns = rollout_turns
+        self.executor = executor
+        # Only a pool the agent started itself is shut down by close().
+        self.owns_executor = False
+        self.start: GameState | None = None
+        self.payload: bytes | None = None
+        self.prefix: list[int] = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["owns_executor"] = False
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info: object):
+        self.close()
+
+    def start_turn(self, player: Player, game: Game):
+        super().start_turn(player, game)
+        self.start = game.snapshot()
+        self.payload = None
+        self.prefix = []
+
+    def pick(self, player: Player, game: Game, amount: int) -> int:
+        if amount == 1 or self.start is None:
+            choice = 0 if amount == 1 else int(self.rng.integers(amount))
+        else:
+            choice = self.search(player, game, amount)
+        self.prefix.append(choice)
+        return choice
+
+    def encode(self, player: Player, game: Game):
+        # Agents are replaced in rollouts, so they are left out rather than copied.
+        agents = [other.agent for other in game.players]
+        for other in game.players:
+            other.agent = None  # type: ignore
+        try:
+            return pickle.dumps((game, self.start, game.players.index(player)))
+        finally:
+            for other, agent in zip(game.players, agents):
+                other.agent = agent
+
+    def search(self, player: Player, game: Game, amount: int) -> int:
+        deadline = time.time()+self.time_budget-OVERHEAD
+        if self.payload is None:
+            self.payload = self.encode(player, game)
+        prefix = tuple(self.prefix)
+        seeds = self.rng.integers(2**63, size=self.workers).tolist()
+        if self.workers > 1:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                self.owns_executor = True
+            futures = [self.executor.submit(search, self.payload, prefix, seed, deadline, self.rollout_turns) for seed in seeds]
+            results = [future.result() for future in futures]
+        else:
+            results = [search(self.payload, prefix, seeds[0], deadline, self.rollout_turns)]
+        visits = [0]*amount
+        for result in results:
+            for choice, (count, _) in result.items():
+                visits[choice] += count
+        return max(range(amount), key=visits.__getitem__)
+
+    def close(self):
+        if self.owns_executor and self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.owns_executor = False
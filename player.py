@@ -1,14 +1,23 @@
 from __future__ import annotations
-from collections.abc import Callable
-import itertools
-import random
-from dice import Die, PipUpException, get_die
-from display import COLOR, FOREGROUND, RESET
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+import functools
+from numpy.random import Generator
+from dice import Die, PipUpException, get_die, roll_dice
+from display import COLOR
+from events import *
 from enums import *
 from tile import ActionFunction, Effect, SelectionException, RearrangementException, Tile
-from constraint import pair_constraint
-
-from typing import TYPE_CHECKING, TypeVar
+from constraint import Constraint, pair_constraint
+from board import bit_indices
+from constraint_table import constraint_table, histogram
+import profiling
+import undo
+from snapshot import PlayerState, dice_state, restore_dice, restore_tile, tile_state
+from streams import make_stream
+from zobrist import AVAILABLE, LOCKED, PREPARED, DiceZone, EffectList, HashedAttribute, TileList, TokenList
+
+from typing import TYPE_CHECKING, Any, TypeVar
 if TYPE_CHECKING:
     from main import Game
 
@@ -22,14 +31,16 @@ class Action:
 def pipup_function(player: Player, game: Game):
     if ScarabType.PIPUP not in player.tokens:
         raise Exception("No pip-up scarab!")
-    player.agent.choose_dice(player, game, 1, message="Choose die to pipup:")[0].pipup(1)
+    player.agent.choose_dice(player, game, 1, message="Choose die to pipup:", constraint=lambda d: d.can_pipup_x(1))[0].pipup(1)
+    undo.save_list(player.tokens)
     player.tokens.remove(ScarabType.PIPUP)
 
 
 def reroll_function(player: Player, game: Game):
     if ScarabType.REROLL not in player.tokens:
         raise Exception("No reroll scarab!")
-    player.agent.choose_dice(player, game, 1, message="Choose die to reroll:")[0].roll()
+    player.agent.choose_dice(player, game, 1, message="Choose die to reroll:")[0].roll(player.rng)
+    undo.save_list(player.tokens)
     player.tokens.remove(ScarabType.REROLL)
 
 
@@ -41,14 +52,175 @@ reroll_action = Action(f"Use {COLOR(reroll_color, "Reroll")} Token", reroll_func
 DiceConstraint = Callable[[Die], bool]
 
 
-class Agent:
+T = TypeVar('T')
+
+
+def dice_options(player: Player, constraint: DiceConstraint = lambda d: True, source: list[Die] | None = None) -> list[Die]:
+    return [die for die in (source if source is not None else player.available_dice) if constraint(die)]
+
+
+def rearrangement_faces(dice: list[Die]) -> list[list[DiceFace]]:
+    """
+    The numeric faces each die can be set to, in the order of its faces, once each.
+    """
+    options: list[list[DiceFace]] = []
+    for die in dice:
+        valid_faces = list(dict.fromkeys(face for face in die.faces if face.value in range(1, 7) or face == DiceFace.STAR_ONE))
+        if not valid_faces:
+            raise ValueError(f"No valid numeric faces for die: {die}")
+        options.append(valid_faces)
+    return options
+
+
+def rearrangement_counter(dice: list[Die]) -> tuple[list[list[DiceFace]], Callable[[int, int, tuple[int, ...]], int]]:
+    """
+    The faces each die can take, and a memoized count of the rearrangements of the dice from pos onwards that add up
+    to remaining, given the lowest face index each die type may still use.
+
+    Dice of the same type are interchangeable, so each multiset of faces is only counted in one order: the faces of
+    a type never go back to an earlier face index. That order is also where itertools.product would first reach it.
+    """
+    options = rearrangement_faces(dice)
+    values = [[1 if face == DiceFace.STAR_ONE else face.value for face in faces] for faces in options]
+    kinds = list(dict.fromkeys(die.dice_type for die in dice))
+    kind_of = [kinds.index(die.dice_type) for die in dice]
+    lowest = [0]*(len(dice)+1)
+    highest = [0]*(len(dice)+1)
+    for pos in reversed(range(len(dice))):
+        lowest[pos] = lowest[pos+1]+min(values[pos])
+        highest[pos] = highest[pos+1]+max(values[pos])
+
+    @functools.cache
+    def count(pos: int, remaining: int, floors: tuple[int, ...]) -> int:
+        if pos == len(dice):
+            return int(remaining == 0)
+        if not lowest[pos] <= remaining <= highest[pos]:
+            return 0
+        kind = kind_of[pos]
+        total = 0
+        for index in range(floors[kind], len(values[pos])):
+            if values[pos][index] <= remaining:
+                total += count(pos+1, remaining-values[pos][index], floors[:kind]+(index,)+floors[kind+1:])
+        return total
+    return options, count
+
+
+def rearrangements(dice: list[Die], target_sum: int) -> Iterator[tuple[DiceFace, ...]]:
+    """
+    Lazily yields the distinct ways to set the dice to numeric faces with the same total, one per multiset of
+    (dice type, face), in the order the first of each would come up in itertools.product over the dice's faces.
+    Branches that cannot reach the total are never entered.
+    """
+    options, count = rearrangement_counter(dice)
+    kinds = list(dict.fromkeys(die.dice_type for die in dice))
+    kind_of = [kinds.index(die.dice_type) for die in dice]
+    chosen: list[DiceFace] = []
+
+    def extend(pos: int, remaining: int, floors: tuple[int, ...]) -> Iterator[tuple[DiceFace, ...]]:
+        if pos == len(dice):
+            yield tuple(chosen)
+            return
+        kind = kind_of[pos]
+        for index in range(floors[kind], len(options[pos])):
+            face = options[pos][index]
+            left = remaining-(1 if face == DiceFace.STAR_ONE else face.value)
+            next_floors = floors[:kind]+(index,)+floors[kind+1:]
+            if count(pos+1, left, next_floors):
+                chosen.append(face)
+                yield from extend(pos+1, left, next_floors)
+                chosen.pop()
+    if count(0, target_sum, (0,)*len(kinds)):
+        yield from extend(0, target_sum, (0,)*len(kinds))
+
+
+def count_rearrangements(dice: list[Die], target_sum: int) -> int:
+    _, count = rearrangement_counter(dice)
+    return count(0, target_sum, (0,)*len({die.dice_type for die in dice}))
+
+
+def rearrangement_options(dice: list[Die], target_sum: int) -> list[tuple[DiceFace, ...]]:
+    return list(rearrangements(dice, target_sum))
+
+
+class Agent(ABC):
+    """
+    Makes every decision for a player. The engine never prompts or reads input itself.
+
+    Subclasses implement choose_dice, choose_item, choose_items and choose_action. The remaining
+    decisions are built on top of those and may be overridden for smarter play.
+    """
+
     def __init__(self, name: str, color: int) -> None:
         self.name = name
         self.color = color
 
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        profiling.agent_classes.append(cls)
+        if profiling.enabled:
+            profiling.wrap_decisions(cls)
+
+    @abstractmethod
+    def choose_dice(self, player: Player, game: Game, amount: int, maximum: int | None = -1, message: str = "Choose dice:", constraint: DiceConstraint = lambda d: True, source: list[Die] | None = None) -> list[Die]:
+        """
+        Chooses between amount and maximum dice from source (the player's available dice by default) that pass constraint.
+        A maximum of None allows any number of dice, and a maximum of amount or less requires exactly amount.
+        """
+
+    @abstractmethod
+    def choose_item(self, options: list[T], display: Callable[[T], str] = str, message: str | None = None) -> T:
+        """
+        Chooses one of options, which display shows to a person.
+        """
+
+    @abstractmethod
+    def choose_items(self, prompt: str, options: list[T], min_amount: int, max_amount: int | None = -1) -> list[T]:
+        """
+        Chooses between min_amount and max_amount of options, with the same meaning of max_amount as in choose_dice.
+        """
+
+    @abstractmethod
+    def choose_action(self, player: Player, game: Game, actions: list[Action]) -> Action | None:
+        """
+        Chooses an action to take after a roll, or None to lock dice.
+        """
+
+    def choose_lock(self, player: Player, game: Game) -> list[Die]:
+        return self.choose_dice(player, game, 0, maximum=None, message="Choose Dice to Lock")
+
+    def start_turn(self, player: Player, game: Game):
+        """
+        Called at the start of each of the player's turns, before anything changes.
+        """
+
+    def choose_rearrangement(self, player: Player, game: Game, dice: list[Die], target_sum: int) -> list[tuple[Die, DiceFace]]:
+        valid_combinations = rearrangement_options(dice, target_sum)
+        if not valid_combinations:
+            raise ValueError("No valid rearrangements preserve the original sum.")
+
+        def display(combo: tuple[DiceFace, ...]) -> str:
+            return ', '.join(f"{die.clone().set_face(face)}" for die, face in zip(dice, combo))
+        selected_faces = self.choose_item(valid_combinations, display, message="Valid rearrangements:")
+        return list(zip(dice, selected_faces))
+
+    def adjust_die_to_other(self, die_to_adjust: Die):
+        face_options = sorted(die_to_adjust.faces, key=lambda f: f.value)
+        face_options.remove(die_to_adjust.face)
+        new_face = self.choose_item(face_options, message="Choose a new face:")
+        die_to_adjust.set_face(new_face)
+
+    def __str__(self) -> str:
+        return COLOR(self.color, self.name)
+    __repr__ = __str__
+
+
+profiling.agent_classes.append(Agent)
+
+
+class TerminalAgent(Agent):
     def choose_dice(self, player: Player, game: Game, amount: int, maximum: int | None = -1, message: str = "Choose dice:", constraint: DiceConstraint = lambda d: True, source: list[Die] | None = None) -> list[Die]:
 
-        available_dice = [die for die in (source if source is not None else player.available_dice) if constraint(die)]
+        available_dice = dice_options(player, constraint, source)
 
         if amount > len(available_dice):
             raise SelectionException(f"Cannot choose {amount} dice from only {len(available_dice)} available.")
@@ -94,13 +266,14 @@ class Agent:
             chosen_dice = [available_dice[i - 1] for i in selections]
             return chosen_dice
 
-    def choose_item(self, options: list[T], display: Callable[[T], str] = str) -> T:
+    def choose_item(self, options: list[T], display: Callable[[T], str] = str, message: str | None = None) -> T:
         """
         Prompts the user to choose an item from the provided options list.
 
         Args:
             options (List[T]): A list of available options of any type.
             display (Callable[[T], str]): Function to convert an item to a string for display. Defaults to str.
+            message (str | None): Prompt shown before the options, if any.
 
         Returns:
             T: The selected item from the list.
@@ -108,6 +281,9 @@ class Agent:
         if not options:
             raise ValueError("No options available to choose from.")
 
+        if message is not None:
+            print(message)
+
         while True:
             print("\nAvailable options:")
             for i, option in enumerate(options, start=1):
@@ -155,93 +331,113 @@ class Agent:
             except ValueError:
                 print("Invalid input. Please enter valid integers separated by commas.")
 
-    def choose_rearrangement(self, player: Player, game: Game, dice: list[Die], target_sum: int) -> list[tuple[Die, DiceFace]]:
+    def choose_action(self, player: Player, game: Game, actions: list[Action]) -> Action | None:
+        print("\nAvailable actions:")
+        for i, action in enumerate(actions):
+            print(f"{i + 1}. {action.name}")
+
+        while True:
+            choice = input("Choose an action by number or name (or 'lock'): ").strip().lower()
+            if choice == "lock":
+                return None
+
+            selected_action = None
+            if choice.isdigit():
+                index = int(choice) - 1
+                if 0 <= index < len(actions):
+                    selected_action = actions[index]
+                else:
+                    print("Invalid number. Try again.")
+                    continue
+            else:
+                for action in actions:
+                    if action.name.lower() == choice:
+                        selected_action = action
+                        break
+                if not selected_action:
+                    print("Invalid name. Try again.")
+                    continue
 
-        def is_valid_face(face: DiceFace) -> bool:
-            return face.value in range(1, 7) or face == DiceFace.STAR_ONE
-
-        def face_effective_value(face: DiceFace) -> int:
-            return 1 if face == DiceFace.STAR_ONE else face.value
-
-        # Collect valid faces for each die
-        valid_face_options: list[list[DiceFace]] = []
-        for die in dice:
-            valid_faces = [face for face in die.faces if is_valid_face(face)]
-            if not valid_faces:
-                raise ValueError(f"No valid numeric faces for die: {die}")
-            valid_face_options.append(valid_faces)
-
-        # Generate all combinations
-        all_combinations = list(itertools.product(*valid_face_options))
-
-        # Filter combinations that match the original sum
-        seen_signatures: set[tuple[tuple[int, str], ...]] = set()
-        valid_combinations: list[tuple[DiceFace, ...]] = []
-        for combo in all_combinations:
-            if sum(face_effective_value(face) for face in combo) == target_sum:
-                # Create a sorted signature to eliminate equivalent sets
-                signature = tuple(sorted((die.dice_type.value, face.name) for die, face in zip(dice, combo)))
-                if signature not in seen_signatures:
-                    seen_signatures.add(signature)
-                    valid_combinations.append(combo)
+            print(f"You chose: {selected_action.name}")
+            return selected_action
 
-        if not valid_combinations:
-            raise ValueError("No valid rearrangements preserve the original sum.")
 
-        # Present options to user
-        print("\nValid rearrangements:")
-        for idx, combo in enumerate(valid_combinations):
-            faces_str = ', '.join(f"{die.clone().set_face(face)}" for die, face in zip(dice, combo))
-            print(f"{idx}: {faces_str}")
+class RandomAgent(Agent):
+    """
+    Picks uniformly among legal choices without any input or output, for self-play.
+    """
 
-        # User selection
-        while True:
-            try:
-                choice = int(input("Choose the index of the rearrangement to use: "))
-                if 0 <= choice < len(valid_combinations):
-                    selected_faces = valid_combinations[choice]
-                    return list(zip(dice, selected_faces))
-                else:
-                    print("Invalid index. Try again.")
-            except ValueError:
-                print("Invalid input. Please enter a valid integer.")
+    def __init__(self, name: str, color: int, rng: Generator | None = None) -> None:
+        super().__init__(name, color)
+        self.rng = rng if rng is not None else make_stream()
 
-    def adjust_die_to_other(self, die_to_adjust: Die):
-        face_options = sorted(die_to_adjust.faces, key=lambda f: f.value)
-        face_options.remove(die_to_adjust.face)
-        print("Choose a new face:")
-        new_face = self.choose_item(face_options)
-        die_to_adjust.set_face(new_face)
+    def choose_subset(self, options: list[T], minimum: int, maximum: int) -> list[T]:
+        amount = int(self.rng.integers(minimum, maximum+1))
+        return [options[i] for i in sorted(self.rng.choice(len(options), size=amount, replace=False))]
 
-    def __str__(self) -> str:
-        return COLOR(self.color, self.name)
-    __repr__ = __str__
+    def choose_dice(self, player: Player, game: Game, amount: int, maximum: int | None = -1, message: str = "Choose dice:", constraint: DiceConstraint = lambda d: True, source: list[Die] | None = None) -> list[Die]:
+        available_dice = dice_options(player, constraint, source)
+        if amount > len(available_dice):
+            raise SelectionException(f"Cannot choose {amount} dice from only {len(available_dice)} available.")
+        maximum = len(available_dice) if maximum is None else min(max(maximum, amount), len(available_dice))
+        return self.choose_subset(available_dice, amount, maximum)
+
+    def choose_item(self, options: list[T], display: Callable[[T], str] = str, message: str | None = None) -> T:
+        if not options:
+            raise ValueError("No options available to choose from.")
+        return options[self.rng.integers(len(options))]
+
+    def choose_items(self, prompt: str, options: list[T], min_amount: int, max_amount: int | None = -1) -> list[T]:
+        if min_amount > len(options):
+            raise ValueError(f"Cannot choose {min_amount} items from only {len(options)} options.")
+        max_amount = len(options) if max_amount is None else min(max(max_amount, min_amount), len(options))
+        return self.choose_subset(options, min_amount, max_amount)
 
+    def choose_action(self, player: Player, game: Game, actions: list[Action]) -> Action | None:
+        index = self.rng.integers(len(actions)+1)
+        return actions[index] if index < len(actions) else None
+
+    def choose_lock(self, player: Player, game: Game) -> list[Die]:
+        # Immediate dice must always be locked, and at least one die must be.
+        forced = [die for die in player.available_dice if die.dice_type == DiceType.IMMEDIATE]
+        optional = [die for die in player.available_dice if die.dice_type != DiceType.IMMEDIATE]
+        return forced + self.choose_subset(optional, 0 if forced or not optional else 1, len(optional))
 
-T = TypeVar('T')
+
+scarab_types = [ScarabType.PIPUP, ScarabType.REROLL]
 
 
 class Player:
-    def __init__(self, tiles: list[Tile], agent: Agent, starting_tokens: int = 0) -> None:
-        self._tiles = tiles
+    # Hashed lists keep their part of the player's Zobrist hash up to date as they change.
+    owned_tiles: HashedAttribute[TileList] = HashedAttribute(TileList)
+    available_dice: HashedAttribute[DiceZone] = HashedAttribute(lambda dice: DiceZone(AVAILABLE, dice))
+    locked_dice: HashedAttribute[DiceZone] = HashedAttribute(lambda dice: DiceZone(LOCKED, dice))
+    prepared_dice: HashedAttribute[DiceZone] = HashedAttribute(lambda dice: DiceZone(PREPARED, dice))
+    tokens: HashedAttribute[TokenList] = HashedAttribute(TokenList)
+    effects: HashedAttribute[EffectList] = HashedAttribute(EffectList)
+
+    def __init__(self, tiles: list[Tile], agent: Agent, starting_tokens: int = 0, rng: Generator | None = None) -> None:
+        self.owned_tiles = tiles
         self.agent = agent
-        self.available_dice: list[Die] = []
-        self.locked_dice: list[Die] = []
-        self.prepared_dice: list[Die] = []
-        self.tokens: list[ScarabType] = []
+        self.rng = rng if rng is not None else make_stream()
+        self.available_dice = []
+        self.locked_dice = []
+        self.prepared_dice = []
+        self.tokens = []
         self.add_scarabs(starting_tokens)
 
-        self.effects: list[Effect] = []
+        self.effects = []
         self.step = TurnStep.NONE
         self.locked_pair = False
         self.borrowed_tile: Tile | None = None
+        self.powers_rolled: list[DiceFace] = []
 
         self.final_score = (0, 0)
         self.finished = False
 
     @property
     def tiles(self):
-        return self._tiles + ([self.borrowed_tile] if self.borrowed_tile is not None else [])
+        return self.owned_tiles + ([self.borrowed_tile] if self.borrowed_tile is not None else [])
 
     @property
     def pip_up_amount(self):
@@ -260,29 +456,62 @@ class Player:
         return not self.available_dice and not self.prepared_dice
 
     def add_scarabs(self, amount: int):
-        for _ in range(amount):
-            self.tokens.append(random.choice([ScarabType.PIPUP, ScarabType.REROLL]))
+        undo.save_list(self.tokens)
+        indices: list[int] = self.rng.integers(len(scarab_types), size=amount).tolist()
+        self.tokens.extend(scarab_types[i] for i in indices)
 
     def add_effect(self, effect: Effect):
+        undo.save_list(self.effects)
         self.effects.append(effect)
 
     def add_tile(self, tile: Tile):
-        self._tiles.append(tile)
+        undo.save_list(self.owned_tiles)
+        self.owned_tiles.append(tile)
+
+    def snapshot(self):
+        return PlayerState(
+            tuple(map(tile_state, self.owned_tiles)),
+            tile_state(self.borrowed_tile) if self.borrowed_tile is not None else None,
+            dice_state(self.available_dice),
+            dice_state(self.locked_dice),
+            dice_state(self.prepared_dice),
+            tuple(self.tokens),
+            tuple(self.effects),
+            self.step,
+            self.locked_pair,
+            self.final_score,
+            self.finished,
+            self.rng.bit_generator.state,
+        )
+
+    def restore(self, state: PlayerState):
+        self.owned_tiles = list(map(restore_tile, state.tiles))
+        self.borrowed_tile = restore_tile(state.borrowed_tile) if state.borrowed_tile is not None else None
+        self.available_dice = restore_dice(state.available_dice)
+        self.locked_dice = restore_dice(state.locked_dice)
+        self.prepared_dice = restore_dice(state.prepared_dice)
+        self.tokens = list(state.tokens)
+        self.effects = list(state.effects)
+        self.step = state.step
+        self.locked_pair = state.locked_pair
+        self.final_score = state.final_score
+        self.finished = state.finished
+        self.rng.bit_generator.state = state.rng
 
     def resolve_powers_rolled(self, game: Game):
         powers_triggered = [die for die in self.available_dice if die.power_triggered]
         while powers_triggered:
             if len(self.powers_rolled) > 1:
-                print("Choose a dice power to use:")
-                die = self.agent.choose_item(powers_triggered)
+                die = self.agent.choose_item(powers_triggered, message="Choose a dice power to use:")
 
             else:
                 die = powers_triggered.pop()
             face = die.face
+            undo.save(die, "power_triggered")
             die.power_triggered = False
             if face == DiceFace.REROLL:
                 die_to_roll = self.agent.choose_dice(self, game, 1, message="Choose die to reroll:")[0]
-                die_to_roll.roll()
+                die_to_roll.roll(self.rng)
             if face in [DiceFace.STAR, DiceFace.STAR_ONE, DiceFace.STAR_DECREE, DiceFace.TWO_STAR]:
                 amount = 2 if face == DiceFace.TWO_STAR else 1
                 response = self.agent.choose_dice(
@@ -291,15 +520,14 @@ class Player:
                     self.agent.adjust_die_to_other(die_to_adjust)
 
             powers_triggered = [die for die in self.available_dice if die.power_triggered]
-            print(f'Rolled Dice: {self.available_dice}')
+            game.events.emit(PowerResolved, self, die)
 
     def get_active_tiles(self, game: Game):
         return [tile for tile in self.tiles if tile.ability.activation is not None and not tile.disabled and self.step in tile.ability.activation_window and tile.ability.activation_restriction(self, game)]
 
     def query_optional_activations(self, game: Game):
         for tile in self.get_active_tiles(game):
-            print(f"Activate {tile}?")
-            if self.agent.choose_item(["Yes", "No"]) == "Yes":
+            if self.agent.choose_item(["Yes", "No"], message=f"Activate {tile}?") == "Yes":
                 assert tile.ability.activation is not None
                 tile.activate(self, game)
 
@@ -308,171 +536,176 @@ class Player:
             assert tile.ability.activation is not None
             tile.activate(self, game)
 
-    def claim_tile(self, game: Game, dice: list[Die], restriction: Callable[[Tile], bool] = lambda t: True):
-        self.step = TurnStep.CLAIM
+    def claimable_tiles(self, game: Game, dice: list[Die], restriction: Callable[[Tile], bool] = lambda t: True) -> list[tuple[Tile, Constraint]]:
         dice_values = [to_value(die.face) for die in dice if to_value(die.face) != DiceValue.NULL]
-        dice_amount = len(dice)
+        satisfied = constraint_table.mask(histogram(dice_values))
+        board = game.board
+        candidates = board.claimable_by(self) & board.levels_up_to(len(dice)) & board.satisfied_by(satisfied)
+        return [(board.tiles[tile_id], board.conditions[tile_id]) for tile_id in bit_indices(candidates) if restriction(board.tiles[tile_id])]
+
+    def claim_tile(self, game: Game, dice: list[Die], restriction: Callable[[Tile], bool] = lambda t: True):
+        self.set_step(TurnStep.CLAIM)
         tile_options: list[Tile] = []
-        for tile, condition in game.get_tiles_conditions():
-            if tile not in self.tiles and game.tile_available(tile) and dice_amount >= tile.level and condition.function(dice_values) and restriction(tile):
-                print(f"{self.agent}'s dice fulfill the {condition} condition for the {tile} tile.")
-                tile_options.append(tile)
+        for tile, condition in self.claimable_tiles(game, dice, restriction):
+            game.events.emit(TileEligible, self, tile, condition)
+            tile_options.append(tile)
         if tile_options:
             tile_to_claim = self.agent.choose_item(tile_options)
             game.claim_tile(self, tile_to_claim)
             self.query_optional_activations(game)
         else:
-            print(f"{self.agent} couldn't claim any tiles! They recieved 2 tokens as compensation.")
+            game.events.emit(NoTileClaimed, self, 2)
             self.add_scarabs(2)
 
     def score(self, game: Game):
         values = [die.value.value for die in self.locked_dice if die.value is not DiceValue.NULL]
         scores = [(values.count(i), i) for i in set(values)]
         scores.append(self.final_score)
+        undo.save(self, "final_score")
         self.final_score = sorted(scores, reverse=True)[0]
         game.submit_score(self)
 
-    def take_turn(self, game: Game):
-        # Reset Dice Zones
-        self.available_dice = []
-        self.locked_dice = []
-        self.prepared_dice = []
-
-        # Turn Start
-        print(f"===={self.agent}'s {"turn" if not game.final_roll_off else "final roll"}!====")
-        self.step = TurnStep.TURN_START
-        for tile in self.tiles:
-            if tile.type in [TileType.YELLOW, TileType.BLUE]:
-                tile.disabled = False
-            if tile.ability.turn_start is not None:
-                tile.ability.turn_start(self, game, tile)
-                tile.value = 0
-
-        self.query_optional_activations(game)
-        if game.final_roll_off:
-            self.step = TurnStep.ROLL_OFF_START
-            self.query_optional_activations(game)
+    def set_step(self, step: TurnStep):
+        undo.save(self, "step")
+        self.step = step
+        if profiling.enabled:
+            profiling.current.enter_step(step)
 
-        for effect in self.effects:
-            effect.turn_start(self, game)
-        self.effects = []
-        while self.prepared_dice:
-            # Roll
-            self.step = TurnStep.ROLLS
-            for die in self.prepared_dice:
-                die.roll()
-                self.available_dice.append(die)
+    def take_turn(self, game: Game):
+        if profiling.enabled:
+            profiling.current.begin_turn(self.step)
+        try:
+            self.agent.start_turn(self, game)
+            # Reset Dice Zones
+            undo.save(self, "available_dice", "locked_dice", "prepared_dice")
+            self.available_dice = []
+            self.locked_dice = []
             self.prepared_dice = []
 
+            # Turn Start
+            game.events.emit(TurnStarted, self, game.final_roll_off)
+            self.set_step(TurnStep.TURN_START)
             for tile in self.tiles:
-                tile.value_up()
-
-            # Action Phase
-            while True:
-                actions: list[Action] = []
-                if ScarabType.PIPUP in self.tokens:
-                    actions.append(pipup_action)
-                if ScarabType.REROLL in self.tokens:
-                    actions.append(reroll_action)
-                for tile in self.get_active_tiles(game):
-                    actions.append(Action(f"Activate {tile}", tile.activate))
-
-                game.print_game()
-                print(f"===={self.agent}'s {"turn" if not game.final_roll_off else "final roll"}====")
-                print(f'Rolled Dice: {self.available_dice}')
-                print(f'Locked dice: {self.locked_dice}')
-                print(
-                    f'Tokens: {FOREGROUND(pipup_color)}{self.pip_up_amount} Pip-ups{RESET}, {FOREGROUND(reroll_color)}{self.reroll_amount} Rerolls{RESET}')
-                print(f"Tiles: {self.tiles}")
-
-                self.powers_rolled = [die.face for die in self.available_dice if die.face in Die.power_faces]
-                self.resolve_powers_rolled(game)
-
-                print("\nAvailable actions:")
-                for i, action in enumerate(actions):
-                    print(f"{i + 1}. {action.name}")
-
-                choice = "lock"
-                if actions:
-                    choice = input("Choose an action by number or name (or 'lock'): ").strip().lower()
-
-                if choice == "lock":
-                    self.step = TurnStep.LOCK
-                    dice_to_lock = self.agent.choose_dice(self, game, 0, maximum=None, message="Choose Dice to Lock")
-                    dice_to_reroll = [die for die in self.available_dice if die not in dice_to_lock]
-                    if any(die.dice_type == DiceType.IMMEDIATE for die in dice_to_reroll):
-                        print("Immediate Dice must be locked.")
-                        continue
-                    if not dice_to_lock:
-                        if not self.available_dice:
-                            break
-                        print("Dice Locking cancelled.")
-                        continue
-                    self.locked_dice.extend(dice_to_lock)
-                    self.prepared_dice.extend(dice_to_reroll)
-                    self.available_dice = []
-
-                    for die in dice_to_lock:
-                        if die.face is DiceFace.ADD_TWO:
-                            self.prepared_dice.extend([get_die(DiceType.STANDARD) for _ in range(2)])
-                        if die.face is DiceFace.STAR_DECREE:
-                            copiable_tiles = [tile for opponent in game.get_opponents(
-                                self) for tile in opponent.tiles if tile not in self.tiles]
-                            if copiable_tiles:
-                                print("Choose Tile to Copy:")
-                                self.borrowed_tile = self.agent.choose_item(copiable_tiles).clone()
-
-                    self.locked_pair = pair_constraint.function([die.value for die in dice_to_lock if die.value is not DiceValue.NULL])
-                    self.query_optional_activations(game)
-                    self.locked_pair = False
-                    break
-
-                selected_action = None
-
-                if choice.isdigit():
-                    index = int(choice) - 1
-                    if 0 <= index < len(actions):
-                        selected_action = actions[index]
-                    else:
-                        print("Invalid number. Try again.")
-                        continue
-                else:
-                    for action in actions:
-                        if action.name.lower() == choice:
-                            selected_action = action
-                            break
-                    if not selected_action:
-                        print("Invalid name. Try again.")
-                        continue
-
-                print(f"You chose: {selected_action.name}")
-
-                try:
-                    selected_action.function(self, game)
-                    self.resolve_powers_rolled(game)
-                except SelectionException as e:
-                    print(e.args)
-                except PipUpException:
-                    print("Can't pip-up that die!")
-                except RearrangementException:
-                    print("Rearrangement Failed!")
-        self.borrowed_tile = None
-
-        # Claim Phase
-        print(f"{self.agent} finished their roll with {self.locked_dice} locked.")
-        if not game.final_roll_off:
-            self.claim_tile(game, self.locked_dice)
-            self.step = TurnStep.CLAIM_END
-            self.query_optional_activations(game)
-        else:
-            self.step = TurnStep.ROLL_OFF_END
-            self.finished = True
+                if tile.type in [TileType.YELLOW, TileType.BLUE]:
+                    undo.save(tile, "disabled")
+                    tile.disabled = False
+                if tile.ability.turn_start is not None:
+                    tile.ability.turn_start(self, game, tile)
+                    undo.save(tile, "value")
+                    tile.value = 0
+
             self.query_optional_activations(game)
-            if self.finished:
-                self.score(game)
+            if game.final_roll_off:
+                self.set_step(TurnStep.ROLL_OFF_START)
+                self.query_optional_activations(game)
+
+            for effect in self.effects:
+                if profiling.enabled:
+                    profiling.current.count("effect_applications")
+                effect.turn_start(self, game)
+                game.events.emit(EffectApplied, self, effect)
+            undo.save(self, "effects")
+            self.effects = []
+            while self.prepared_dice:
+                # Roll
+                self.set_step(TurnStep.ROLLS)
+                roll_dice(self.prepared_dice, self.rng)
+                undo.save_list(self.available_dice)
+                self.available_dice.extend(self.prepared_dice)
+                undo.save(self, "prepared_dice")
+                self.prepared_dice = []
+                game.events.emit(DiceRolled, self, self.available_dice)
+
+                for tile in self.tiles:
+                    tile.value_up()
+
+                # Action Phase
+                while True:
+                    actions: list[Action] = []
+                    if ScarabType.PIPUP in self.tokens:
+                        actions.append(pipup_action)
+                    if ScarabType.REROLL in self.tokens:
+                        actions.append(reroll_action)
+                    for tile in self.get_active_tiles(game):
+                        actions.append(Action(f"Activate {tile}", tile.activate))
+
+                    game.events.emit(ActionPhase, self, game)
+
+                    undo.save(self, "powers_rolled")
+                    self.powers_rolled = [die.face for die in self.available_dice if die.face in Die.power_faces]
+                    self.resolve_powers_rolled(game)
 
-        print(f"====End of {self.agent}'s turn!====")
-        self.step = TurnStep.NONE
+                    selected_action = self.agent.choose_action(self, game, actions) if actions else None
+
+                    if selected_action is None:
+                        self.set_step(TurnStep.LOCK)
+                        dice_to_lock = self.agent.choose_lock(self, game)
+                        dice_to_reroll = [die for die in self.available_dice if die not in dice_to_lock]
+                        if any(die.dice_type == DiceType.IMMEDIATE for die in dice_to_reroll):
+                            game.events.emit(LockRejected, self, "Immediate Dice must be locked.")
+                            continue
+                        if not dice_to_lock:
+                            if not self.available_dice:
+                                break
+                            game.events.emit(LockRejected, self, "Dice Locking cancelled.")
+                            continue
+                        undo.save_list(self.locked_dice)
+                        self.locked_dice.extend(dice_to_lock)
+                        undo.save_list(self.prepared_dice)
+                        self.prepared_dice.extend(dice_to_reroll)
+                        undo.save(self, "available_dice")
+                        self.available_dice = []
+                        game.events.emit(DiceLocked, self, dice_to_lock)
+
+                        for die in dice_to_lock:
+                            if die.face is DiceFace.ADD_TWO:
+                                undo.save_list(self.prepared_dice)
+                                self.prepared_dice.extend([get_die(DiceType.STANDARD) for _ in range(2)])
+                            if die.face is DiceFace.STAR_DECREE:
+                                copiable_tiles = [tile for opponent in game.get_opponents(
+                                    self) for tile in opponent.tiles if tile not in self.tiles]
+                                if copiable_tiles:
+                                    undo.save(self, "borrowed_tile")
+                                    self.borrowed_tile = self.agent.choose_item(copiable_tiles, message="Choose Tile to Copy:").clone()
+
+                        undo.save(self, "locked_pair")
+                        self.locked_pair = constraint_table.satisfies([die.value for die in dice_to_lock], pair_constraint)
+                        self.query_optional_activations(game)
+                        undo.save(self, "locked_pair")
+                        self.locked_pair = False
+                        break
+
+                    try:
+                        selected_action.function(self, game)
+                        self.resolve_powers_rolled(game)
+                    except SelectionException as e:
+                        game.events.emit(ActionFailed, self, str(e.args))
+                    except PipUpException:
+                        game.events.emit(ActionFailed, self, "Can't pip-up that die!")
+                    except RearrangementException:
+                        game.events.emit(ActionFailed, self, "Rearrangement Failed!")
+            undo.save(self, "borrowed_tile")
+            self.borrowed_tile = None
+
+            # Claim Phase
+            game.events.emit(RollFinished, self, self.locked_dice)
+            if not game.final_roll_off:
+                self.claim_tile(game, self.locked_dice)
+                self.set_step(TurnStep.CLAIM_END)
+                self.query_optional_activations(game)
+            else:
+                self.set_step(TurnStep.ROLL_OFF_END)
+                undo.save(self, "finished")
+                self.finished = True
+                self.query_optional_activations(game)
+                if self.finished:
+                    self.score(game)
+
+            game.events.emit(TurnEnded, self)
+            self.set_step(TurnStep.NONE)
+        finally:
+            if profiling.enabled:
+                profiling.current.end_turn()
 
     def __str__(self) -> str:
         return str(self.agent)
@@ -0,0 +1,326 @@
+from __future__ import annotations
+import argparse
+import array
+import itertools
+import mmap
+import os
+import struct
+from collections.abc import Callable
+from typing import Any, TypeVar
+import numpy as np
+from numpy.random import Generator
+from board import bit_indices
+from constraint import Constraint
+from constraint_table import Histogram, constraint_table
+from dice import Die
+from enums import *
+from player import RandomAgent
+from solver import Dice, GroupKey, PoolKey, PoolTables, TurnSolver, TurnState, all_codes, code, code_values, null_capacity, potential
+from streams import make_stream
+from tile import Tile
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from main import Game
+    from player import Player
+
+POLICY_MAGIC = b"FPLT"
+POLICY_VERSION = 1
+POLICY_SEED = 0x10C4
+HEADER = struct.Struct("<HHIQ")
+# Lock decisions are bitmasks over the positions of the sorted rolled dice, one byte each.
+MAX_POLICY_DICE = 8
+# Tables hold Standard pools of up to DEFAULT_POLICY_DICE dice and every pool of up to DEFAULT_MIXED_DICE by default.
+# Each die more of every pool multiplies the states by about ten.
+DEFAULT_POLICY_DICE = 7
+DEFAULT_MIXED_DICE = 3
+DEFAULT_POLICY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "policy_tables.bin")
+MASK = 2**64-1
+T = TypeVar('T')
+
+# States are found by an additive hash of the rolled dice and the locked dice, so equal multisets share a key.
+key_stream = make_stream(POLICY_SEED)
+code_keys = dict(zip(all_codes, key_stream.integers(0, 2**64, size=len(all_codes), dtype="uint64").tolist()))
+locked_keys = key_stream.integers(0, 2**64, size=(6, MAX_POLICY_DICE+1), dtype="uint64").tolist()
+null_keys = key_stream.integers(0, 2**64, size=MAX_POLICY_DICE+1, dtype="uint64").tolist()
+
+
+def state_key(dice: Dice, locked: Histogram, nulls: int):
+    h = null_keys[nulls]
+    for die_code in dice:
+        h += code_keys[die_code]
+    for bucket, amount in enumerate(locked):
+        h += locked_keys[bucket][amount]
+    # Zero marks an empty slot.
+    return h & MASK or 1
+
+
+def lock_masks(tables: PoolTables, locks: np.ndarray) -> np.ndarray:
+    """
+    The bitmasks over the positions of each roll's sorted dice of the locks, given by roll as indices into the subs.
+    """
+    # Sorted rolls hold the dice of each code in a run, in the order of the codes.
+    starts = np.cumsum(tables.roll_counts, axis=1)-tables.roll_counts
+    return (((1 << tables.sub_counts[locks])-1) << starts).sum(axis=-1)
+
+
+def standard_pools(max_dice: int) -> list[PoolKey]:
+    return [(amount,)+(0,)*(len(DiceType)-1) for amount in range(1, max_dice+1)]
+
+
+def every_pool(max_dice: int) -> list[PoolKey]:
+    """
+    Every composition of dice that locks 1 to max_dice dice, counting the two a Voyage die can add.
+    """
+    pools: list[PoolKey] = []
+    for size in range(1, max_dice+1):
+        for dice_types in itertools.combinations_with_replacement(range(len(DiceType)), size):
+            pool = tuple(dice_types.count(dice_type) for dice_type in range(len(DiceType)))
+            if size+potential(pool, ()) <= max_dice:
+                pools.append(pool)
+    return pools
+
+
+def default_pools(max_dice: int = DEFAULT_POLICY_DICE, mixed_dice: int = DEFAULT_MIXED_DICE) -> list[PoolKey]:
+    return sorted(set(standard_pools(max_dice)+every_pool(mixed_dice)))
+
+
+def parse_pool(text: str) -> PoolKey:
+    """
+    A pool written as dice type names with counts, such as STANDARD=5,IMMEDIATE=1.
+    """
+    pool = [0]*len(DiceType)
+    for part in text.split(","):
+        name, _, amount = part.partition("=")
+        if name.strip().upper() not in DiceType.__members__ or not amount.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"{part!r} is not a dice type name and count, like STANDARD=5.")
+        pool[DiceType[name.strip().upper()].value] += int(amount)
+    return tuple(pool)
+
+
+def solver_runs(pools: list[PoolKey]) -> list[list[PoolKey]]:
+    """
+    The pools split into runs that one solver can solve in turn without clearing its memo.
+    """
+    def bounds(pool: PoolKey):
+        return sum(pool)+potential(pool, ()), potential(pool, ()), null_capacity(pool)
+    return [list(run) for _, run in itertools.groupby(sorted(pools, key=bounds), key=bounds)]
+
+
+def start_state(pool: PoolKey):
+    return TurnState(pool, (0,)*6, 0, 0, 0, ())
+
+
+class PolicyTable:
+    """
+    Optimal lock decisions for every condition, by rolled dice, locked value histogram and number of locked dice without a value.
+
+    Each decision aims to satisfy one condition by the end of the turn, without tokens or tiles, and comes with its probability.
+    The states are those of the pools the table was built for, with their dice powers, and of the pools their locks leave.
+    All conditions share one open-addressing hash table of states, with a column of decisions and one of probabilities each,
+    so one probe answers for every condition. A saved table is loaded with mmap, so processes reading the same file share it.
+    """
+
+    def __init__(self, constraints: list[Constraint] | None = None) -> None:
+        self.constraints = constraints if constraints is not None else constraint_table.constraints
+        self.columns = {constraint: i for i, constraint in enumerate(self.constraints)}
+        self.capacity = 0
+        self.keys: Any = array.array("Q")
+        self.values: list[Any] = []
+        self.masks: list[Any] = []
+        self.max_dice = 0
+        self.map: mmap.mmap | None = None
+
+    def __len__(self):
+        return sum(1 for key in self.keys if key)
+
+    def find(self, key: int):
+        if not self.capacity:
+            return None
+        mask = self.capacity-1
+        slot = key & mask
+        keys = self.keys
+        while keys[slot]:
+            if keys[slot] == key:
+                return slot
+            slot = slot+1 & mask
+        return None
+
+    def slot(self, dice: Dice, locked: Histogram, nulls: int):
+        if len(dice) > MAX_POLICY_DICE or sum(locked)+nulls > MAX_POLICY_DICE:
+            return None
+        return self.find(state_key(dice, locked, nulls))
+
+    def lock(self, slot: int, constraint: Constraint):
+        return self.masks[self.columns[constraint]][slot]
+
+    def probability(self, slot: int, constraint: Constraint):
+        return self.values[self.columns[constraint]][slot]
+
+    def build(self, pools: list[PoolKey] | None = None):
+        """
+        Solves every decision of each pool and of the pools its locks leave, the default_pools by default.
+        """
+        pools = pools if pools is not None else default_pools()
+        if any(sum(pool)+potential(pool, ()) > MAX_POLICY_DICE for pool in pools):
+            raise Exception(f"Policy tables hold pools that lock at most {MAX_POLICY_DICE} dice.")
+        runs = solver_runs(pools)
+        # The groups a solver goes through and their rows don't depend on the objective, so every condition shares
+        # one layout: the index of each group's states by row and roll. States in more than one group share an index.
+        layout: list[list[tuple[GroupKey, np.ndarray]]] = []
+        indices: dict[int, int] = {}
+        for run in runs:
+            explorer = TurnSolver(lambda locked, count: 0.0)
+            for pool in run:
+                explorer.roll_value(start_state(pool))
+            groups: list[tuple[GroupKey, np.ndarray]] = []
+            for key in sorted(explorer.groups):
+                group = explorer.groups[key]
+                states = [indices.setdefault(state_key(dice, hist[:6], hist[6]), len(indices)) for hist in group.rows.histograms for dice in group.tables.rolls]
+                groups.append((key, np.array(states, dtype=np.intp).reshape(len(group.rows), len(group.tables.rolls))))
+            layout.append(groups)
+        self.max_dice = max(map(sum, pools))
+        self.capacity = 1 << max(4, (len(indices)*4//3).bit_length())
+        self.keys = array.array("Q", bytes(8*self.capacity))
+        slots = np.empty(len(indices), dtype=np.intp)
+        for key, index in indices.items():
+            slot = key & self.capacity-1
+            while self.keys[slot]:
+                slot = slot+1 & self.capacity-1
+            self.keys[slot] = key
+            slots[index] = slot
+        self.values = []
+        self.masks = []
+        for constraint in self.constraints:
+            bit = constraint_table.bits[constraint]
+            values = np.zeros(self.capacity, dtype=np.float32)
+            masks = np.zeros(self.capacity, dtype=np.uint8)
+            for run, groups in zip(runs, layout):
+                solver = TurnSolver(lambda locked, count: float(bool(constraint_table.mask(locked) & bit)))
+                for pool in run:
+                    solver.roll_value(start_state(pool))
+                for key, states in groups:
+                    group = solver.groups[key]
+                    values[slots[states]] = group.values
+                    masks[slots[states]] = lock_masks(group.tables, solver.best_locks(*key))
+            self.values.append(values)
+            self.masks.append(masks)
+
+    def save(self, path: str):
+        names = "\n".join(constraint.name for constraint in self.constraints).encode()
+        header = POLICY_MAGIC+HEADER.pack(POLICY_VERSION, self.max_dice, len(names), self.capacity)+names
+        with open(path, "wb") as file:
+            # Pad so the keys start 8-byte aligned.
+            file.write(header+bytes(-len(header) % 8))
+            file.write(bytes(self.keys))
+            for values in self.values:
+                file.write(bytes(values))
+            for masks in self.masks:
+                file.write(bytes(masks))
+
+    def load(self, path: str):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != POLICY_MAGIC:
+            raise Exception(f"{path} is not a policy table.")
+        version, self.max_dice, names_length, self.capacity = HEADER.unpack_from(self.map, 4)
+        if version != POLICY_VERSION:
+            raise Exception(f"Unsupported policy table version {version}.")
+        offset = 4+HEADER.size
+        names = self.map[offset:offset+names_length].decode().split("\n")
+        if names != [constraint.name for constraint in self.constraints]:
+            raise Exception(f"Policy table {path} was built for different constraints.")
+        offset += names_length
+        offset += -offset % 8
+        view = memoryview(self.map)
+        self.keys = view[offset:offset+8*self.capacity].cast("Q")
+        offset += 8*self.capacity
+        self.values = []
+        for _ in self.constraints:
+            self.values.append(view[offset:offset+4*self.capacity].cast("f"))
+            offset += 4*self.capacity
+        self.masks = []
+        for _ in self.constraints:
+            self.masks.append(view[offset:offset+self.capacity])
+            offset += self.capacity
+
+
+loaded_tables: dict[str, PolicyTable] = {}
+
+
+def shared_table(path: str | None = None):
+    """
+    The policy table saved at path, or DEFAULT_POLICY_PATH, loaded once per process.
+    """
+    path = path if path is not None else DEFAULT_POLICY_PATH
+    if path not in loaded_tables:
+        if not os.path.exists(path):
+            raise Exception(f"No policy table at {path}. Build one with: python policy_table.py --output {path}")
+        table = PolicyTable()
+        table.load(path)
+        loaded_tables[path] = table
+    return loaded_tables[path]
+
+
+class PolicyAgent(RandomAgent):
+    """
+    Locks dice by table lookup, aiming for the claimable tile with the best level times probability of claiming it,
+    and claims that tile when it is offered. Falls back to RandomAgent in the final roll-off, when the dice are not
+    in the table or when no tile can be claimed; other choices are random.
+    """
+
+    def __init__(self, name: str, color: int, rng: Generator | None = None, table: PolicyTable | None = None) -> None:
+        super().__init__(name, color, rng)
+        self.table = table
+        self.target: Tile | None = None
+
+    def choose_item(self, options: list[T], display: Callable[[T], str] = str, message: str | None = None) -> T:
+        target = self.target
+        if target is not None and target in options:
+            return next(option for option in options if option == target)
+        return super().choose_item(options, display, message)
+
+    def choose_lock(self, player: Player, game: Game) -> list[Die]:
+        self.target = None
+        if game.final_roll_off:
+            return super().choose_lock(player, game)
+        table = self.table if self.table is not None else shared_table()
+        dice = sorted(player.available_dice, key=lambda die: code(die.dice_type, die.face))
+        locked = [0]*6
+        nulls = 0
+        for die in player.locked_dice:
+            bucket = code_values[code(die.dice_type, die.face)]
+            if bucket is None:
+                nulls += 1
+            else:
+                locked[bucket] += 1
+        slot = table.slot(tuple(code(die.dice_type, die.face) for die in dice), tuple(locked), nulls)
+        if slot is None:
+            return super().choose_lock(player, game)
+        board = game.board
+        best: tuple[float, int] | None = None
+        for tile_id in bit_indices(board.claimable_by(player) & board.levels_up_to(len(player.locked_dice)+len(dice))):
+            score = board.tiles[tile_id].level*table.probability(slot, board.conditions[tile_id])
+            if score > 0 and (best is None or score > best[0]):
+                best = (score, tile_id)
+        if best is None:
+            return super().choose_lock(player, game)
+        self.target = board.tiles[best[1]]
+        return [dice[i] for i in bit_indices(table.lock(slot, board.conditions[best[1]]))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the lock policy tables for every tile condition.")
+    parser.add_argument("--max-dice", type=int, default=DEFAULT_POLICY_DICE, help="Most dice of the Standard pools")
+    parser.add_argument("--mixed-dice", type=int, default=DEFAULT_MIXED_DICE, help="Most dice of the pools of every composition")
+    parser.add_argument("--pools", type=parse_pool, nargs="+", help="Pools to build instead, like STANDARD=5,IMMEDIATE=1")
+    parser.add_argument("--output", default=DEFAULT_POLICY_PATH)
+    args = parser.parse_args()
+    table = PolicyTable()
+    table.build(args.pools if args.pools is not None else default_pools(args.max_dice, args.mixed_dice))
+    table.save(args.output)
+    print(f"Wrote {len(table)} states for {len(table.constraints)} conditions to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
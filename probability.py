@@ -0,0 +1,113 @@
+from fractions import Fraction
+from constraint import Constraint
+from constraint_table import ConstraintTable, Histogram, constraint_table
+from dice import dice_dict
+from enums import *
+
+PoolKey = tuple[int, ...]
+Distribution = dict[Histogram, int]
+
+
+def pool_key(dice_types: list[DiceType]) -> PoolKey:
+    counts = [0]*len(DiceType)
+    for dice_type in dice_types:
+        counts[dice_type.value] += 1
+    return tuple(counts)
+
+
+def face_weights(dice_type: DiceType) -> dict[int | None, int]:
+    """
+    Number of faces on a die showing each value bucket (0-5), with non-numeric faces under None.
+    """
+    weights: dict[int | None, int] = {}
+    for value in dice_dict[dice_type].values:
+        bucket = value.value-1 if value is not DiceValue.NULL else None
+        weights[bucket] = weights.get(bucket, 0)+1
+    return weights
+
+
+die_weights = {dice_type: list(face_weights(dice_type).items()) for dice_type in DiceType}
+die_sides = {dice_type: len(dice_dict[dice_type].faces) for dice_type in DiceType}
+
+
+def convolve(distribution: Distribution, dice_type: DiceType) -> Distribution:
+    result: Distribution = {}
+    for hist, weight in distribution.items():
+        for bucket, face_weight in die_weights[dice_type]:
+            if bucket is None:
+                new_hist = hist
+            else:
+                new_hist = hist[:bucket]+(hist[bucket]+1,)+hist[bucket+1:]
+            result[new_hist] = result.get(new_hist, 0)+weight*face_weight
+    return result
+
+
+class PoolProbabilities:
+    """
+    Exact outcome distributions for pools of dice, memoized on the pool's type counts.
+
+    A distribution maps each value histogram a roll can produce to the number of face
+    combinations that produce it, so probabilities are exact fractions of the pool's total.
+    """
+
+    def __init__(self, table: ConstraintTable = constraint_table) -> None:
+        self.table = table
+        self.distributions: dict[PoolKey, Distribution] = {(0,)*len(DiceType): {(0,)*6: 1}}
+        self.mask_weights: dict[PoolKey, dict[int, int]] = {}
+
+    def distribution(self, key: PoolKey) -> Distribution:
+        if key in self.distributions:
+            return self.distributions[key]
+        # Build from the largest memoized sub-pool by adding one die at a time.
+        missing: list[DiceType] = []
+        counts = list(key)
+        while tuple(counts) not in self.distributions:
+            dice_type = DiceType(max(i for i, count in enumerate(counts) if count > 0))
+            counts[dice_type.value] -= 1
+            missing.append(dice_type)
+        distribution = self.distributions[tuple(counts)]
+        for dice_type in reversed(missing):
+            counts[dice_type.value] += 1
+            distribution = convolve(distribution, dice_type)
+            self.distributions[tuple(counts)] = distribution
+        return distribution
+
+    def total(self, key: PoolKey) -> int:
+        total = 1
+        for dice_type, count in zip(DiceType, key):
+            total *= die_sides[dice_type]**count
+        return total
+
+    def histogram_probabilities(self, dice_types: list[DiceType]) -> dict[Histogram, Fraction]:
+        key = pool_key(dice_types)
+        total = self.total(key)
+        return {hist: Fraction(weight, total) for hist, weight in self.distribution(key).items()}
+
+    def masks(self, key: PoolKey) -> dict[int, int]:
+        if key not in self.mask_weights:
+            weights: dict[int, int] = {}
+            for hist, weight in self.distribution(key).items():
+                mask = self.table.mask(hist)
+                weights[mask] = weights.get(mask, 0)+weight
+            self.mask_weights[key] = weights
+        return self.mask_weights[key]
+
+    def probability(self, dice_types: list[DiceType], constraint: Constraint) -> Fraction:
+        key = pool_key(dice_types)
+        bit = self.table.bits[constraint]
+        return Fraction(sum(weight for mask, weight in self.masks(key).items() if mask & bit), self.total(key))
+
+    def condition_probabilities(self, dice_types: list[DiceType]) -> dict[Constraint, Fraction]:
+        """
+        Probability that a single roll of the pool satisfies each constraint in the table.
+
+        Faces are taken as rolled, before any powers, tokens or tile abilities are used.
+        """
+        key = pool_key(dice_types)
+        weights = self.masks(key)
+        total = self.total(key)
+        return {constraint: Fraction(sum(weight for mask, weight in weights.items() if mask & bit), total)
+                for constraint, bit in self.table.bits.items()}
+
+
+pool_probabilities = PoolProbabilities()
@@ -0,0 +1,241 @@
+from __future__ import annotations
+import functools
+import marshal
+import time
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from typing import Any
+from enums import *
+
+# Engine hooks check this flag before doing anything else, so a disabled profiler costs one global lookup per hook.
+enabled = False
+
+# Constraint evaluations are constraint table lookups, each of which checks every condition at once.
+COUNTERS = ["constraint_evaluations", "die_rolls", "agent_decisions", "tile_activations", "effect_applications"]
+DECISION_METHODS = ["choose_dice", "choose_item", "choose_items", "choose_action", "choose_lock", "choose_rearrangement", "adjust_die_to_other"]
+TURN_FRAME = "take_turn"
+
+# A stack is the path of frames open when time or a count was recorded, such as ("take_turn", "ROLLS").
+# Turns inside a turn, such as search rollouts, nest under the step they were played in.
+Stack = tuple[str, ...]
+
+
+class Profile:
+    """
+    Wall time per turn step and event counts from Player.take_turn, by the stack they happened in.
+
+    Times are self times: a nested turn's time is counted in its own steps, not in the step that started it.
+    """
+
+    def __init__(self) -> None:
+        self.times: dict[Stack, float] = {}
+        self.entries: dict[Stack, int] = {}
+        self.counts: dict[tuple[Stack, str], int] = {}
+        self.turns = 0
+        self.stack: Stack = ()
+        self.started = 0.0
+        self.outer: list[Stack] = []
+
+    def __getstate__(self):
+        # Open frames belong to the process recording them, so copies only carry the totals.
+        state = self.__dict__.copy()
+        state["stack"], state["started"], state["outer"] = (), 0.0, []
+        return state
+
+    def split(self):
+        now = time.perf_counter()
+        if self.stack:
+            self.times[self.stack] = self.times.get(self.stack, 0.0)+now-self.started
+        self.started = now
+
+    def enter(self, stack: Stack):
+        self.split()
+        self.stack = stack
+        self.entries[stack] = self.entries.get(stack, 0)+1
+
+    def begin_turn(self, step: TurnStep):
+        self.turns += 1
+        self.outer.append(self.stack)
+        turn = self.stack+(TURN_FRAME,)
+        self.entries[turn] = self.entries.get(turn, 0)+1
+        self.enter(turn+(step.name,))
+
+    def enter_step(self, step: TurnStep):
+        if self.stack:
+            self.enter(self.stack[:-1]+(step.name,))
+
+    def end_turn(self):
+        self.split()
+        # A turn already running when profiling was enabled has no frame to close.
+        if self.outer:
+            self.stack = self.outer.pop()
+
+    def count(self, counter: str, amount: int = 1):
+        key = (self.stack, counter)
+        self.counts[key] = self.counts.get(key, 0)+amount
+
+    def merge(self, other: Profile):
+        for stack, seconds in other.times.items():
+            self.times[stack] = self.times.get(stack, 0.0)+seconds
+        for stack, entries in other.entries.items():
+            self.entries[stack] = self.entries.get(stack, 0)+entries
+        for key, amount in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0)+amount
+        self.turns += other.turns
+
+    def counters(self) -> dict[str, int]:
+        totals = dict.fromkeys(COUNTERS, 0)
+        for (_, counter), amount in self.counts.items():
+            totals[counter] = totals.get(counter, 0)+amount
+        return totals
+
+    def step_times(self) -> dict[TurnStep, float]:
+        """
+        Seconds spent in each turn step, over all turns.
+        """
+        totals = dict.fromkeys(TurnStep, 0.0)
+        for stack, seconds in self.times.items():
+            totals[TurnStep[stack[-1]]] += seconds
+        return totals
+
+    def step_counters(self) -> dict[TurnStep, dict[str, int]]:
+        totals = {step: dict.fromkeys(COUNTERS, 0) for step in TurnStep}
+        for (stack, counter), amount in self.counts.items():
+            if stack:
+                totals[TurnStep[stack[-1]]][counter] += amount
+        return totals
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "seconds": sum(self.times.values()),
+            "steps": {step.name: seconds for step, seconds in self.step_times().items() if seconds},
+            "counters": self.counters(),
+            "step_counters": {step.name: counts for step, counts in self.step_counters().items() if any(counts.values())},
+        }
+
+    def summary(self) -> str:
+        total = sum(self.times.values())
+        lines = [f"Turns: {self.turns}, {total:.3f}s"]
+        for step, seconds in sorted(self.step_times().items(), key=lambda item: -item[1]):
+            if seconds:
+                lines.append(f"{step.name}: {seconds:.3f}s ({seconds/total:.1%}), {seconds/max(self.turns, 1)*1e6:.1f}us per turn")
+        lines += [f"{counter}: {amount} ({amount/max(self.turns, 1):.2f} per turn)" for counter, amount in self.counters().items()]
+        return "\n".join(lines)
+
+    def folded(self, counter: str | None = None) -> list[str]:
+        """
+        Stacks in the folded format that flamegraph.pl, speedscope and inferno read: frames joined by semicolons and a
+        weight, here microseconds of self time, or the number of events of counter when given.
+        """
+        if counter is None:
+            weights = {stack: round(seconds*1e6) for stack, seconds in self.times.items()}
+        else:
+            weights: dict[Stack, int] = {}
+            for (stack, name), amount in self.counts.items():
+                if name == counter and stack:
+                    weights[stack] = weights.get(stack, 0)+amount
+        return [f"{';'.join(stack)} {weight}" for stack, weight in sorted(weights.items()) if weight]
+
+    def write_folded(self, path: str, counter: str | None = None):
+        with open(path, "w") as file:
+            file.writelines(line+"\n" for line in self.folded(counter))
+
+    def stats(self) -> dict[tuple[str, int, str], tuple[int, int, float, float, dict[Any, Any]]]:
+        """
+        The profile as the table pstats.Stats loads, with each turn and step as a function.
+        """
+        def function(frame: str) -> tuple[str, int, str]:
+            return ("player.py", 0, frame if frame == TURN_FRAME else f"TurnStep.{frame}")
+
+        stats: dict[tuple[str, int, str], list[Any]] = {}
+        for stack in self.times.keys() | self.entries.keys():
+            seconds = self.times.get(stack, 0.0)
+            calls = self.entries.get(stack, 0)
+            for depth, frame in enumerate(stack):
+                entry = stats.setdefault(function(frame), [0, 0, 0.0, 0.0, {}])
+                # A frame's inclusive time takes the self time of every stack below it, once per stack.
+                if frame not in stack[:depth]:
+                    entry[3] += seconds
+                if depth == len(stack)-1:
+                    entry[0] += calls
+                    entry[1] += calls
+                    entry[2] += seconds
+                    if depth:
+                        caller = entry[4].setdefault(function(stack[depth-1]), [0, 0, 0.0, 0.0])
+                        caller[0] += calls
+                        caller[1] += calls
+                        caller[2] += seconds
+                        caller[3] += seconds
+        for entry in stats.values():
+            entry[4] = {key: tuple(caller) for key, caller in entry[4].items()}
+        return {key: tuple(entry) for key, entry in stats.items()}  # type: ignore
+
+    def dump_stats(self, path: str):
+        """
+        Writes the profile in the format of cProfile's dump_stats, for pstats, snakeviz or gprof2dot.
+        """
+        with open(path, "wb") as file:
+            marshal.dump(self.stats(), file)
+
+
+current = Profile()
+
+# Agent classes register themselves here, so their decisions can be counted while profiling is enabled.
+agent_classes: list[type] = []
+wrapped: list[tuple[type, str, Callable[..., Any]]] = []
+
+
+def count_decisions(method: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(method)
+    def wrapper(agent: Any, *args: Any, **kwargs: Any):
+        # Decisions made by calling another decision method, like choose_lock calling choose_dice, count once.
+        if getattr(agent, "_deciding", False):
+            return method(agent, *args, **kwargs)
+        current.count("agent_decisions")
+        agent._deciding = True
+        try:
+            return method(agent, *args, **kwargs)
+        finally:
+            agent._deciding = False
+    return wrapper
+
+
+def wrap_decisions(cls: type):
+    for name in DECISION_METHODS:
+        if name in cls.__dict__:
+            method = cls.__dict__[name]
+            wrapped.append((cls, name, method))
+            setattr(cls, name, count_decisions(method))
+
+
+def enable(profile: Profile | None = None):
+    """
+    Starts recording into profile, or a new Profile, and returns it.
+    """
+    global enabled, current
+    if enabled:
+        disable()
+    current = profile if profile is not None else Profile()
+    for cls in agent_classes:
+        wrap_decisions(cls)
+    enabled = True
+    return current
+
+
+def disable():
+    global enabled
+    enabled = False
+    while wrapped:
+        cls, name, method = wrapped.pop()
+        setattr(cls, name, method)
+    return current
+
+
+@contextmanager
+def recording(profile: Profile | None = None) -> Generator[Profile]:
+    profile = enable(profile)
+    try:
+        yield profile
+    finally:
+        disable()
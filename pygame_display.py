@@ -1,5 +1,6 @@
 
 import pygame
+from functools import cache
 from tile import Tile, TileType
 from enums import RowMode
 from constraint import Constraint
@@ -37,6 +38,10 @@ Y_MARGIN = 40
 
 DESC_MAX_CHAR_WIDTH = 37
 DESC_MAX_LINES = 5
+COND_BAR_HEIGHT = 28
+LEFT_BUFFER = 30
+# How often an idle window wakes up to check the game for changes.
+POLL_MS = 100
 
 
 def split_string_by_length(text: str, length: int):
@@ -56,6 +61,15 @@ def split_string_by_length(text: str, length: int):
     return lines
 
 
+# A tile slot holds (tile, amount, condition, mode), or None once emptied; a row label holds its mode.
+SlotContents = tuple[Tile, int, Constraint, RowMode] | RowMode | None
+
+
+@cache
+def wrapped_description(description: str):
+    return split_string_by_length(description, DESC_MAX_CHAR_WIDTH)[:DESC_MAX_LINES]
+
+
 class PygameDisplay:
     def __init__(self, game: 'Game'):
         pygame.init()
@@ -68,63 +82,114 @@ class PygameDisplay:
         self.screen_height = SCREEN_HEIGHT
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.RESIZABLE)
         pygame.display.set_caption("Favor of the Pharaoh - Board Display")
+        self.text_cache: dict[tuple[pygame.font.Font, str, tuple[int, int, int]], pygame.Surface] = {}
+        self.tile_cache: dict[tuple[Tile, int, Constraint, RowMode], pygame.Surface] = {}
+        # What each board slot showed when it was last drawn, so only changed slots are redrawn.
+        self.drawn: dict[tuple[int, int], SlotContents] = {}
+
+    def render_text(self, font: pygame.font.Font, text: str, color: tuple[int, int, int]):
+        key = (font, text, color)
+        if key not in self.text_cache:
+            self.text_cache[key] = font.render(text, True, color)
+        return self.text_cache[key]
+
+    def tile_surface(self, tile: Tile, amount: int, condition: Constraint, mode: RowMode):
+        """
+        The tile with its condition bar on top, rendered once per (tile, amount, condition, mode).
+        """
+        key = (tile, amount, condition, mode)
+        if key in self.tile_cache:
+            return self.tile_cache[key]
+        surface = pygame.Surface((TILE_WIDTH, TILE_HEIGHT+COND_BAR_HEIGHT))
+        y = COND_BAR_HEIGHT
 
-    def draw_tile(self, x: int, y: int, tile: Tile, amount: int, condition: Constraint, mode: RowMode):
         # Draw tile background
-        pygame.draw.rect(self.screen, COLOR_DICT["tile_bg"], (x, y, TILE_WIDTH, TILE_HEIGHT))
-        pygame.draw.rect(self.screen, COLOR_DICT[tile.type], (x+4, y+4, TILE_WIDTH-8, TILE_HEIGHT-8))
+        pygame.draw.rect(surface, COLOR_DICT["tile_bg"], (0, y, TILE_WIDTH, TILE_HEIGHT))
+        pygame.draw.rect(surface, COLOR_DICT[tile.type], (4, y+4, TILE_WIDTH-8, TILE_HEIGHT-8))
 
         # Draw condition bar above the tile
-        cond_bar_height = 28
-        cond_bar_rect = (x, y - cond_bar_height, TILE_WIDTH, cond_bar_height)
-        pygame.draw.rect(self.screen, COLOR_DICT["tile_bg"], cond_bar_rect)
-        cond_surf = self.condition_font.render(condition.name, True, COLOR_DICT["text"])
-        cond_text_rect = cond_surf.get_rect(center=(x + TILE_WIDTH // 2, y - cond_bar_height // 2))
-        self.screen.blit(cond_surf, cond_text_rect)
+        pygame.draw.rect(surface, COLOR_DICT["tile_bg"], (0, 0, TILE_WIDTH, COND_BAR_HEIGHT))
+        cond_surf = self.render_text(self.condition_font, condition.name, COLOR_DICT["text"])
+        surface.blit(cond_surf, cond_surf.get_rect(center=(TILE_WIDTH // 2, COND_BAR_HEIGHT // 2)))
 
         text_color = COLOR_DICT["text"] if tile.type is not TileType.YELLOW else COLOR_DICT["text-dark"]
         # Draw tile name
-        name_surf = self.title_font.render(tile.name, True, text_color)
-        self.screen.blit(name_surf, (x+10, y+8))
+        surface.blit(self.render_text(self.title_font, tile.name, text_color), (10, y+8))
 
         # Draw tile amount
-        amount_surf = self.title_font.render(f"x{amount}", True, COLOR_DICT["gray"])
-        self.screen.blit(amount_surf, (x+TILE_WIDTH-40, y+8))
+        surface.blit(self.render_text(self.title_font, f"x{amount}", COLOR_DICT["gray"]), (TILE_WIDTH-40, y+8))
 
         # Draw description (wrapped)
-        desc_lines = split_string_by_length(tile.description, DESC_MAX_CHAR_WIDTH)
-        for i, line in enumerate(desc_lines[:DESC_MAX_LINES]):
-            desc_surf = self.description_font.render(line, True, text_color)
-            self.screen.blit(desc_surf, (x+10, y+30+i*18))
-
-    def draw_board(self):
-        self.screen.fill(COLOR_DICT["background"])
-        left_buffer = 30
+        for i, line in enumerate(wrapped_description(tile.description)):
+            surface.blit(self.render_text(self.description_font, line, text_color), (10, y+30+i*18))
+        self.tile_cache[key] = surface
+        return surface
+
+    def board_slots(self):
+        """
+        The position and current contents of every spot on the board, keyed by (level, index).
+        Row mode labels use index -1.
+        """
+        slots: dict[tuple[int, int], tuple[int, int, SlotContents]] = {}
         for level, tile_list in self.game.tiles.items():
             if level > 1:
-                x = X_MARGIN + 4 * (TILE_WIDTH + X_MARGIN) + left_buffer
+                x = X_MARGIN + 4 * (TILE_WIDTH + X_MARGIN) + LEFT_BUFFER
                 y = Y_MARGIN + (7-level) * (TILE_HEIGHT + Y_MARGIN)
-                mode = self.game.get_row_mode(level)
-                mode_surf = self.side_font.render(f"{mode.name} side", True, COLOR_DICT["gray"])
-                self.screen.blit(mode_surf, (x+10, y))
+                slots[(level, -1)] = (x, y, self.game.get_row_mode(level))
             for index, tile in enumerate(tile_list):
                 row = max(2, level)
-                x = X_MARGIN + index * (TILE_WIDTH + X_MARGIN) + left_buffer
+                x = X_MARGIN + index * (TILE_WIDTH + X_MARGIN) + LEFT_BUFFER
                 y = Y_MARGIN + (7-row) * (TILE_HEIGHT + Y_MARGIN)
-                condition = self.game.get_condition(level, index)
                 amount = self.game.amounts[tile]
-                if amount == 0:
-                    continue
-                self.draw_tile(x, y, tile, amount, condition, self.game.get_row_mode(level))
-        pygame.display.flip()
+                contents: SlotContents = (tile, amount, self.game.get_condition(level, index), self.game.get_row_mode(level)) if amount else None
+                slots[(level, index)] = (x, y - COND_BAR_HEIGHT, contents)
+        return slots
+
+    def draw_slot(self, x: int, y: int, contents: SlotContents) -> pygame.Rect:
+        if isinstance(contents, RowMode):
+            rect = pygame.Rect(x, y, TILE_WIDTH, self.side_font.get_linesize())
+            self.screen.fill(COLOR_DICT["background"], rect)
+            self.screen.blit(self.render_text(self.side_font, f"{contents.name} side", COLOR_DICT["gray"]), (x+10, y))
+            return rect
+        rect = pygame.Rect(x, y, TILE_WIDTH, TILE_HEIGHT+COND_BAR_HEIGHT)
+        self.screen.fill(COLOR_DICT["background"], rect)
+        if contents is not None:
+            self.screen.blit(self.tile_surface(*contents), rect)
+        return rect
+
+    def draw_board(self, full: bool = False):
+        """
+        Redraws the slots whose contents changed since the last call and updates only their rects.
+        With full, the whole window is repainted, as after a resize.
+        """
+        if full:
+            self.screen = pygame.display.get_surface()
+            self.screen.fill(COLOR_DICT["background"])
+            self.drawn = {}
+        dirty: list[pygame.Rect] = []
+        for slot, (x, y, contents) in self.board_slots().items():
+            if slot in self.drawn and self.drawn[slot] == contents:
+                continue
+            dirty.append(self.draw_slot(x, y, contents))
+            self.drawn[slot] = contents
+        if full:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
 
     def run(self):
         running = True
-        clock = pygame.time.Clock()
+        self.draw_board(full=True)
         while running:
-            for event in pygame.event.get():
+            # Sleep until something happens instead of redrawing every frame.
+            event = pygame.event.wait(POLL_MS)
+            full = False
+            while event.type != pygame.NOEVENT:
                 if event.type == pygame.QUIT:
                     running = False
-            self.draw_board()
-            clock.tick(30)
+                elif event.type in (pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED, pygame.WINDOWEXPOSED):
+                    full = True
+                event = pygame.event.poll()
+            if running:
+                self.draw_board(full=full)
         pygame.quit()
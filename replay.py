@@ -0,0 +1,442 @@
+from __future__ import annotations
+import argparse
+import struct
+import sys
+import time
+from array import array
+from collections.abc import Callable
+from typing import Any, NamedTuple, TypeVar
+from numpy.random import Generator, SeedSequence
+from binary_state import START_BIT, decode, encode
+from dice import Die, PipUpException
+from enums import *
+from main import Game
+from player import Action, Agent, DiceConstraint, Player, RandomAgent, dice_options
+from simulate import AgentFactory, SimulationConfig, setup_simulated_game
+from snapshot import GameState
+from tile import RearrangementException, SelectionException, start, tile_ids, tiles_by_name
+
+T = TypeVar('T')
+
+LOG_MAGIC = b"FPRL"
+LOG_VERSION = 2
+DEFAULT_KEYFRAME_INTERVAL = 25
+# magic, version, players, row modes as bits with bit 7 set when they are fixed, max turns
+LOG_HEADER = struct.Struct("<4sBBBI")
+
+# Decisions are stored as one stream of bytes, in the order agents make them:
+#   choose_dice, choose_lock, choose_items: how many were chosen, then the index of each among the options
+#   choose_item: the index of the choice
+#   choose_action: the index of the action, or the number of actions for None
+#   choose_rearrangement: the value of the face each die is set to
+#   adjust_die_to_other: the value of the die's new face
+# A decision the agent refused by raising is FAILED and the index of the exception's type in agent_errors instead,
+# since the engine catches some of those and carries on.
+# Indices are into the lists the engine offers, so replaying them needs the same game, not the same agent. No list
+# the engine offers comes near FAILED options.
+Decisions = array[int]
+FAILED = 0xFF
+agent_errors: list[type[Exception]] = [SelectionException, PipUpException, RearrangementException, ValueError, Exception]
+
+# Keyframes hold the game at the start of a turn:
+#   the length of its binary state as a u16, then the state, as binary_state.encode gives it,
+#   for each player, the number of tiles owned and the slot of each in the order they were claimed, which decoding
+#   the state loses but which orders the activations a replay picks from,
+#   the game's generator state and then each player's: PCG64 state, increment, has_uint32 and uinteger.
+RNG_STATE = struct.Struct("<16s16sBI")
+
+
+def pack_rng(rng: Generator):
+    state = rng.bit_generator.state
+    if state["bit_generator"] != "PCG64":
+        raise Exception(f"Keyframes hold PCG64 generator states, not {state['bit_generator']} ones.")
+    return RNG_STATE.pack(state["state"]["state"].to_bytes(16, "little"), state["state"]["inc"].to_bytes(16, "little"),
+                          state["has_uint32"], state["uinteger"])
+
+
+def unpack_rng(data: bytes, offset: int) -> dict[str, Any]:
+    state, inc, has_uint32, uinteger = RNG_STATE.unpack_from(data, offset)
+    return {"bit_generator": "PCG64", "state": {"state": int.from_bytes(state, "little"), "inc": int.from_bytes(inc, "little")},
+            "has_uint32": has_uint32, "uinteger": uinteger}
+
+
+def encode_keyframe(game: Game) -> bytes:
+    state = encode(game)
+    out = bytearray(struct.pack("<H", len(state))+state)
+    for player in game.players:
+        out.append(len(player.owned_tiles))
+        out += bytes(START_BIT if tile.name == start.name else game.board.ids[tile] for tile in player.owned_tiles)
+    for rng in [game.rng]+[player.rng for player in game.players]:
+        out += pack_rng(rng)
+    return bytes(out)
+
+
+def decode_keyframe(data: bytes) -> GameState:
+    """
+    A snapshot of the game in the keyframe, which restores into any game with the same setup.
+    """
+    length: int = struct.unpack_from("<H", data, 0)[0]
+    game = decode(data[2:2+length], seed=0)
+    offset = 2+length
+    for player in game.players:
+        slots = {START_BIT if tile.name == start.name else game.board.ids[tile]: tile for tile in player.owned_tiles}
+        player.owned_tiles = [slots[slot] for slot in data[offset+1:offset+1+data[offset]]]
+        offset += 1+data[offset]
+    for rng in [game.rng]+[player.rng for player in game.players]:
+        rng.bit_generator.state = unpack_rng(data, offset)
+        offset += RNG_STATE.size
+    return game.snapshot()
+
+
+def index_of(options: list[Any], choice: Any):
+    for i, option in enumerate(options):
+        if option is choice:
+            return i
+    return options.index(choice)
+
+
+class RecordingAgent(Agent):
+    """
+    Plays like the agent it wraps and appends each of its decisions to decisions.
+    """
+
+    def __init__(self, agent: Agent, decisions: Decisions) -> None:
+        super().__init__(agent.name, agent.color)
+        self.agent = agent
+        self.decisions = decisions
+
+    def ask(self, decision: Callable[..., T], *args: Any) -> T:
+        try:
+            return decision(*args)
+        except Exception as e:
+            self.decisions.append(FAILED)
+            self.decisions.append(next(i for i, error in enumerate(agent_errors) if isinstance(e, error)))
+            raise
+
+    def record_subset(self, options: list[Any], chosen: list[Any]):
+        self.decisions.append(len(chosen))
+        self.decisions.extend(index_of(options, choice) for choice in chosen)
+
+    def start_turn(self, player: Player, game: Game):
+        self.agent.start_turn(player, game)
+
+    def choose_dice(self, player: Player, game: Game, amount: int, maximum: int | None = -1, message: str = "Choose dice:", constraint: DiceConstraint = lambda d: True, source: list[Die] | None = None) -> list[Die]:
+        chosen = self.ask(self.agent.choose_dice, player, game, amount, maximum, message, constraint, source)
+        self.record_subset(dice_options(player, constraint, source), chosen)
+        return chosen
+
+    def choose_item(self, options: list[T], display: Callable[[T], str] = str, message: str | None = None) -> T:
+        choice = self.ask(self.agent.choose_item, options, display, message)
+        self.decisions.append(index_of(options, choice))
+        return choice
+
+    def choose_items(self, prompt: str, options: list[T], min_amount: int, max_amount: int | None = -1) -> list[T]:
+        chosen = self.ask(self.agent.choose_items, prompt, options, min_amount, max_amount)
+        self.record_subset(options, chosen)
+        return chosen
+
+    def choose_action(self, player: Player, game: Game, actions: list[Action]) -> Action | None:
+        action = self.ask(self.agent.choose_action, player, game, actions)
+        self.decisions.append(len(actions) if action is None else index_of(actions, action))
+        return action
+
+    def choose_lock(self, player: Player, game: Game) -> list[Die]:
+        chosen = self.ask(self.agent.choose_lock, player, game)
+        self.record_subset(player.available_dice, chosen)
+        return chosen
+
+    def choose_rearrangement(self, player: Player, game: Game, dice: list[Die], target_sum: int) -> list[tuple[Die, DiceFace]]:
+        rearrangement = self.ask(self.agent.choose_rearrangement, player, game, dice, target_sum)
+        faces = {id(die): face for die, face in rearrangement}
+        self.decisions.extend(faces[id(die)].value for die in dice)
+        return rearrangement
+
+    def adjust_die_to_other(self, die_to_adjust: Die):
+        self.ask(self.agent.adjust_die_to_other, die_to_adjust)
+        self.decisions.append(die_to_adjust.face.value)
+
+
+class DecisionReader:
+    def __init__(self, decisions: Decisions) -> None:
+        self.decisions = decisions
+        self.position = 0
+
+    def begin(self):
+        """
+        Starts reading a decision, raising what the agent raised if it refused it.
+        """
+        if self.position < len(self.decisions) and self.decisions[self.position] == FAILED:
+            self.position += 2
+            raise agent_errors[self.decisions[self.position-1]]("Replayed a decision the agent refused.")
+        return self
+
+    def next(self, limit: int | None = None):
+        if self.position >= len(self.decisions):
+            raise Exception("The replay asked for more decisions than the log holds.")
+        value = self.decisions[self.position]
+        self.position += 1
+        if limit is not None and value >= limit:
+            raise Exception(f"The replay diverged from its log: decision {value} of {limit} options at {self.position-1}.")
+        return value
+
+    def subset(self, options: list[T]) -> list[T]:
+        return [options[self.next(len(options))] for _ in range(self.next(len(options)+1))]
+
+
+class ReplayAgent(Agent):
+    """
+    Makes every decision by reading the next one from a log, so replays never call the agents that played.
+    """
+
+    def __init__(self, name: str, color: int, reader: DecisionReader) -> None:
+        super().__init__(name, color)
+        self.reader = reader
+
+    def choose_dice(self, player: Player, game: Game, amount: int, maximum: int | None = -1, message: str = "Choose dice:", constraint: DiceConstraint = lambda d: True, source: list[Die] | None = None) -> list[Die]:
+        return self.reader.begin().subset(dice_options(player, constraint, source))
+
+    def choose_item(self, options: list[T], display: Callable[[T], str] = str, message: str | None = None) -> T:
+        return options[self.reader.begin().next(len(options))]
+
+    def choose_items(self, prompt: str, options: list[T], min_amount: int, max_amount: int | None = -1) -> list[T]:
+        return self.reader.begin().subset(options)
+
+    def choose_action(self, player: Player, game: Game, actions: list[Action]) -> Action | None:
+        index = self.reader.begin().next(len(actions)+1)
+        return actions[index] if index < len(actions) else None
+
+    def choose_lock(self, player: Player, game: Game) -> list[Die]:
+        return self.reader.begin().subset(player.available_dice)
+
+    def choose_rearrangement(self, player: Player, game: Game, dice: list[Die], target_sum: int) -> list[tuple[Die, DiceFace]]:
+        self.reader.begin()
+        return [(die, DiceFace(self.reader.next())) for die in dice]
+
+    def adjust_die_to_other(self, die_to_adjust: Die):
+        die_to_adjust.set_face(DiceFace(self.reader.begin().next()))
+
+
+class GameLog(NamedTuple):
+    """
+    Everything needed to play a game again: the seed sequence simulate gives it, the setup, and every decision.
+    turn_starts[n] is the position in decisions where turn n starts, and keyframes[n] holds the game at the start of
+    turn n*keyframe_interval.
+    """
+    entropy: int
+    spawn_key: tuple[int, ...]
+    players: int
+    modes: tuple[RowMode, ...] | None
+    tile_names: tuple[str, ...] | None
+    max_turns: int
+    decisions: Decisions
+    turn_starts: array[int]
+    keyframe_interval: int
+    keyframes: tuple[bytes, ...]
+
+    @property
+    def turns(self):
+        return len(self.turn_starts)
+
+    def sequence(self):
+        return SeedSequence(self.entropy, spawn_key=self.spawn_key)
+
+    def config(self, agents: list[AgentFactory]):
+        return SimulationConfig(self.players, agents, list(self.modes) if self.modes is not None else None,
+                                list(self.tile_names) if self.tile_names is not None else None, self.max_turns)
+
+
+def little_endian(values: array[int]):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def encode_log(log: GameLog) -> bytes:
+    """
+    The log in a compact binary layout: a header, the entropy, spawn key and lineup, then the decisions as bytes and
+    the turn starts as u32s, each behind its count, then the keyframe interval and count as u32s and each keyframe
+    behind its length.
+    """
+    modes = 0 if log.modes is None else 0x80 | sum(mode.value << i for i, mode in enumerate(log.modes))
+    entropy = log.entropy.to_bytes((log.entropy.bit_length()+7)//8, "little")
+    tile_names = log.tile_names or ()
+    return b"".join([
+        LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, log.players, modes, log.max_turns),
+        bytes([len(entropy)]), entropy,
+        bytes([len(log.spawn_key)]), struct.pack(f"<{len(log.spawn_key)}I", *log.spawn_key),
+        bytes([len(tile_names)]), bytes(tile_ids[name] for name in tile_names),
+        struct.pack("<I", len(log.decisions)), little_endian(log.decisions).tobytes(),
+        struct.pack("<I", len(log.turn_starts)), little_endian(log.turn_starts).tobytes(),
+        struct.pack("<II", log.keyframe_interval, len(log.keyframes)),
+        *(struct.pack("<I", len(keyframe))+keyframe for keyframe in log.keyframes),
+    ])
+
+
+def decode_log(data: bytes) -> GameLog:
+    magic, version, players, modes, max_turns = LOG_HEADER.unpack_from(data, 0)
+    if magic != LOG_MAGIC:
+        raise Exception("Not a game log.")
+    if version != LOG_VERSION:
+        raise Exception(f"Unsupported game log version {version}.")
+    offset = LOG_HEADER.size
+    entropy = int.from_bytes(data[offset+1:offset+1+data[offset]], "little")
+    offset += 1+data[offset]
+    spawn_key = struct.unpack_from(f"<{data[offset]}I", data, offset+1)
+    offset += 1+4*data[offset]
+    names = list(tiles_by_name)
+    tile_names = tuple(names[tile_id] for tile_id in data[offset+1:offset+1+data[offset]]) or None
+    offset += 1+data[offset]
+    lists: list[array[int]] = []
+    for typecode in "BI":
+        values: array[int] = array(typecode)
+        count = struct.unpack_from("<I", data, offset)[0]
+        values.frombytes(data[offset+4:offset+4+count*values.itemsize])
+        lists.append(little_endian(values))
+        offset += 4+count*values.itemsize
+    keyframe_interval, count = struct.unpack_from("<II", data, offset)
+    offset += 8
+    keyframes: list[bytes] = []
+    for _ in range(count):
+        length: int = struct.unpack_from("<I", data, offset)[0]
+        keyframes.append(data[offset+4:offset+4+length])
+        offset += 4+length
+    return GameLog(entropy, tuple(spawn_key), players, tuple(RowMode(modes >> i & 1) for i in range(5)) if modes & 0x80 else None,
+                   tile_names, max_turns, lists[0], lists[1], keyframe_interval, tuple(keyframes))
+
+
+def write_log(path: str, log: GameLog):
+    with open(path, "wb") as file:
+        file.write(encode_log(log))
+
+
+def read_log(path: str):
+    with open(path, "rb") as file:
+        return decode_log(file.read())
+
+
+def record_game(config: SimulationConfig, sequence: SeedSequence,
+                keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL) -> tuple[Game, GameLog]:
+    """
+    Plays a game as simulate does and returns it with its log, taking a keyframe every keyframe_interval turns.
+    """
+    decisions: Decisions = array("B")
+    turn_starts: array[int] = array("I")
+    keyframes: list[bytes] = []
+
+    def recording(factory: AgentFactory) -> AgentFactory:
+        return lambda name, color, rng: RecordingAgent(factory(name, color, rng), decisions)
+    game = setup_simulated_game(SimulationConfig(config.players, [recording(factory) for factory in config.agents],
+                                                 config.modes, config.tile_names, config.max_turns), sequence)
+    while not game.game_ended and game.turns_played < config.max_turns:
+        turn_starts.append(len(decisions))
+        if game.turns_played % keyframe_interval == 0:
+            keyframes.append(encode_keyframe(game))
+        game.play_turn()
+    log = GameLog(int(sequence.entropy), tuple(sequence.spawn_key), config.players,  # type: ignore
+                  tuple(config.modes) if config.modes is not None else None,
+                  tuple(config.tile_names) if config.tile_names is not None else None, config.max_turns, decisions, turn_starts,
+                  keyframe_interval, tuple(keyframes))
+    return game, log
+
+
+class Replayer:
+    """
+    Plays a logged game again, turn by turn, with every decision read from the log.
+
+    Seeking to a turn restores the latest keyframe at or before it and plays on from there. The log's keyframes are
+    decoded the first time a seek restores one, so a loaded log seeks without playing the turns before the keyframe.
+    A snapshot is also kept at every keyframe_interval-th turn the replay passes, by default the log's interval.
+    index plays the whole game once to take every keyframe up front.
+    """
+
+    def __init__(self, log: GameLog, keyframe_interval: int | None = None) -> None:
+        self.log = log
+        self.keyframe_interval = keyframe_interval or log.keyframe_interval
+        self.reader = DecisionReader(log.decisions)
+        self.game = setup_simulated_game(log.config([self.replay_agent]*log.players), log.sequence())
+        self.keyframes: dict[int, GameState] = {}
+
+    def replay_agent(self, name: str, color: int, rng: Generator) -> Agent:
+        return ReplayAgent(name, color, self.reader)
+
+    @property
+    def turn(self):
+        return self.game.turns_played
+
+    def step(self):
+        """
+        Plays the next turn, and returns False at the end of the log.
+        """
+        turn = self.game.turns_played
+        if turn >= self.log.turns:
+            return False
+        if turn % self.keyframe_interval == 0 and turn not in self.keyframes:
+            self.keyframes[turn] = self.game.snapshot()
+        if self.reader.position != self.log.turn_starts[turn]:
+            raise Exception(f"The replay diverged from its log before turn {turn}.")
+        self.game.play_turn()
+        return True
+
+    def seek(self, turn: int):
+        """
+        Puts the game where it was at the start of the given turn, or at the end for the number of turns.
+        """
+        if not 0 <= turn <= self.log.turns:
+            raise Exception(f"Turn {turn} is outside the log's {self.log.turns} turns.")
+        keyframe = turn-turn % self.keyframe_interval
+        while keyframe not in self.keyframes and keyframe > 0:
+            keyframe -= self.keyframe_interval
+        interval = self.log.keyframe_interval
+        keyframe = max(keyframe, min(turn//interval, len(self.log.keyframes)-1)*interval)
+        # Playing on is cheaper than restoring when the game is already between the keyframe and the turn.
+        if not keyframe <= self.game.turns_played <= turn:
+            if keyframe not in self.keyframes:
+                self.keyframes[keyframe] = decode_keyframe(self.log.keyframes[keyframe//interval])
+            self.game.restore(self.keyframes[keyframe])
+            self.reader.position = self.log.turn_starts[keyframe]
+        while self.game.turns_played < turn:
+            self.step()
+        return self.game
+
+    def index(self):
+        self.seek(0)
+        while self.step():
+            pass
+        if self.reader.position != len(self.log.decisions):
+            raise Exception(f"The replay used {self.reader.position} of the log's {len(self.log.decisions)} decisions.")
+        return self.game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a game as a replay log, or replay one and show any turn of it.")
+    parser.add_argument("log")
+    parser.add_argument("--record", action="store_true", help="Play a new game with random agents and write its log.")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-turns", type=int, default=2000)
+    parser.add_argument("--turn", type=int, help="Show the game at the start of this turn. The end by default.")
+    parser.add_argument("--keyframe-interval", type=int, default=DEFAULT_KEYFRAME_INTERVAL,
+                        help="Turns between the keyframes a recorded log holds.")
+    args = parser.parse_args()
+
+    if args.record:
+        started = time.perf_counter()
+        _, log = record_game(SimulationConfig(args.players, [RandomAgent]*args.players, max_turns=args.max_turns), SeedSequence(args.seed),
+                             args.keyframe_interval)
+        write_log(args.log, log)
+        print(f"Recorded {log.turns} turns and {len(log.decisions)} decisions in {time.perf_counter()-started:.2f}s, "
+              f"{len(encode_log(log))} bytes.")
+        return
+
+    log = read_log(args.log)
+    replayer = Replayer(log)
+    turn = log.turns if args.turn is None else args.turn
+    started = time.perf_counter()
+    game = replayer.seek(turn)
+    print(f"Seeked to turn {turn} of {log.turns} from the log's keyframes in {(time.perf_counter()-started)*1e3:.1f}ms.")
+    game.print_game()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import Iterator
+from typing import Any
+import numpy as np
+from binary_state import SLOTS, pack_score
+from enums import *
+from events import GameEnded, TileClaimed, TurnEnded
+from tile import tile_ids, tiles_by_name
+from zobrist import MAX_SEATS
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from main import Game
+
+# A store is a directory of chunks, one per simulated batch, each holding one .npy file per column of each table and
+# the description of its run in run.json. Chunks are named after their run and batch, so runs with different configs
+# can share a store. Chunks are written to a temporary directory and renamed into place, so readers only ever see
+# complete chunks and a store can be read while a simulation is still adding to it.
+# Scores are count*8+value, and per-seat columns are padded to MAX_SEATS with 0 past the last seat.
+# Board slots follow Game.tiles order, and games.tiles gives the tile ID in each slot.
+GAME_COLUMNS: dict[str, tuple[Any, tuple[int, ...]]] = {
+    "seed": (np.int64, ()),
+    "batch": (np.int32, ()),
+    "index": (np.int32, ()),
+    "players": (np.int8, ()),
+    # Row modes as bits, level 3 first.
+    "modes": (np.uint8, ()),
+    "tiles": (np.uint8, (SLOTS,)),
+    "turns": (np.int32, ()),
+    "finished": (np.bool_, ()),
+    # The winning seat, or -1 when nobody won or the game hit the turn limit.
+    "winner": (np.int8, ()),
+    "high_score": (np.uint8, ()),
+    "final_scores": (np.uint8, (MAX_SEATS,)),
+    "tokens": (np.int16, (MAX_SEATS,)),
+    # Board slots owned by each seat at the end, as bits.
+    "owned": (np.uint32, (MAX_SEATS,)),
+}
+TURN_COLUMNS: dict[str, tuple[Any, tuple[int, ...]]] = {
+    "batch": (np.int32, ()),
+    "index": (np.int32, ()),
+    "turn": (np.int32, ()),
+    "seat": (np.int8, ()),
+    # Board slots claimed during the turn, as bits.
+    "claimed": (np.uint32, ()),
+    "pip_ups": (np.int16, ()),
+    "rerolls": (np.int16, ()),
+    "locked": (np.int8, ()),
+    "roll_off": (np.bool_, ()),
+}
+TABLES = {"games": GAME_COLUMNS, "turns": TURN_COLUMNS}
+
+
+RUN_FILE = "run.json"
+
+
+def run_id(run: dict[str, Any]):
+    """
+    A short hash of a run's description: its config, seed and batch size.
+    """
+    return hashlib.sha256(json.dumps(run, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def chunk_name(run: dict[str, Any], batch: int):
+    return f"{run_id(run)}-{batch:06d}"
+
+
+class GameRecorder:
+    """
+    Event subscriber that adds a row to the writer's turns table after each turn, and a games row at the end.
+    """
+
+    def __init__(self, writer: ResultsWriter, game: Game, index: int) -> None:
+        self.writer = writer
+        self.game = game
+        self.index = index
+        self.claimed = 0
+
+    def __call__(self, event: Any):
+        if type(event) is TileClaimed:
+            self.claimed |= 1 << self.game.board.ids[event.tile]
+        elif type(event) is TurnEnded:
+            player = event.player
+            game = self.game
+            self.writer.add("turns", batch=self.writer.batch, index=self.index, turn=game.turns_played,
+                            seat=game.players.index(player), claimed=self.claimed, pip_ups=player.pip_up_amount,
+                            rerolls=player.reroll_amount, locked=len(player.locked_dice), roll_off=game.final_roll_off)
+            self.claimed = 0
+        elif type(event) is GameEnded:
+            self.writer.record(self.game, self.index)
+
+
+class ResultsWriter:
+    """
+    Collects the rows of one batch of games and writes them to the store as one chunk on close.
+    """
+
+    def __init__(self, path: str, run: dict[str, Any], batch: int) -> None:
+        self.path = path
+        self.run = run
+        self.seed = run["seed"]
+        self.batch = batch
+        self.rows: dict[str, dict[str, list[Any]]] = {table: {name: [] for name in columns} for table, columns in TABLES.items()}
+
+    def add(self, table: str, **values: Any):
+        for name, column in self.rows[table].items():
+            column.append(values[name])
+
+    def watch(self, game: Game, index: int):
+        """
+        Records the game as it is played with play_game.
+        """
+        return game.events.subscribe(GameRecorder(self, game, index))
+
+    def discard(self, index: int):
+        """
+        Drops the rows recorded so far for a game that could not be played to the end.
+        """
+        for columns in self.rows.values():
+            keep = len(columns["index"])
+            while keep and columns["index"][keep-1] == index:
+                keep -= 1
+            for column in columns.values():
+                del column[keep:]
+
+    def record(self, game: Game, index: int):
+        players = game.players
+        padding = [0]*(MAX_SEATS-len(players))
+        self.add("games",
+                 seed=self.seed,
+                 batch=self.batch,
+                 index=index,
+                 players=len(players),
+                 modes=sum(mode.value << i for i, mode in enumerate(game.modes)),
+                 tiles=[tile_ids[tile.name] for tile in game.board.tiles],
+                 turns=game.turns_played,
+                 finished=game.game_ended,
+                 winner=players.index(game.high_scorer) if game.high_scorer is not None and game.game_ended else -1,
+                 high_score=pack_score(game.high_score),
+                 final_scores=[pack_score(player.final_score) for player in players]+padding,
+                 tokens=[player.token_count for player in players]+padding,
+                 owned=[game.board.owned.get(player, 0) for player in players]+padding)
+
+    def close(self):
+        os.makedirs(self.path, exist_ok=True)
+        name = chunk_name(self.run, self.batch)
+        final_path = os.path.join(self.path, name)
+        # A batch written again, such as after a crash between writing and checkpointing it, replaces its chunk,
+        # but only a chunk of the same run.
+        if os.path.exists(final_path) and read_run(final_path) != self.run:
+            raise Exception(f"Chunk {name} in {self.path} belongs to a different run.")
+        temp_path = os.path.join(self.path, f".{name}.tmp")
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        for table, columns in TABLES.items():
+            for column, (dtype, shape) in columns.items():
+                values = np.array(self.rows[table][column], dtype=dtype).reshape((-1,)+shape)
+                np.save(os.path.join(temp_path, f"{table}.{column}.npy"), values)
+        with open(os.path.join(temp_path, RUN_FILE), "w") as file:
+            json.dump(self.run, file)
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path)
+        os.replace(temp_path, final_path)
+
+
+def read_run(chunk_path: str) -> dict[str, Any] | None:
+    try:
+        with open(os.path.join(chunk_path, RUN_FILE)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+class ResultsStore:
+    """
+    Read access to a store, or to the chunks of one run in it. Columns are memory-mapped one chunk at a time, so
+    aggregations over any number of rows only need one chunk's pages at once.
+    """
+
+    def __init__(self, path: str, run: str | None = None) -> None:
+        self.path = path
+        self.run = run
+
+    def chunks(self):
+        return sorted(name for name in os.listdir(self.path)
+                      if not name.startswith(".") and (self.run is None or name.rsplit("-", 1)[0] == self.run))
+
+    def runs(self) -> dict[str, dict[str, Any] | None]:
+        """
+        The description of each run in the store, by run ID.
+        """
+        runs: dict[str, dict[str, Any] | None] = {}
+        for chunk in self.chunks():
+            run = chunk.rsplit("-", 1)[0]
+            if run not in runs:
+                runs[run] = read_run(os.path.join(self.path, chunk))
+        return runs
+
+    def chunk(self, chunk: str, table: str, *columns: str) -> tuple[np.ndarray, ...]:
+        return tuple(np.load(os.path.join(self.path, chunk, f"{table}.{column}.npy"), mmap_mode="r") for column in columns)
+
+    def scan(self, table: str, *columns: str) -> Iterator[tuple[np.ndarray, ...]]:
+        """
+        The given columns of each chunk, as read-only memory maps.
+        """
+        if table not in TABLES or any(column not in TABLES[table] for column in columns):
+            raise Exception(f"Unknown columns {columns} of table {table}.")
+        for chunk in self.chunks():
+            yield self.chunk(chunk, table, *columns)
+
+    def rows(self, table: str):
+        return sum(len(column) for column, in self.scan(table, next(iter(TABLES[table]))))
+
+    def win_counts(self, players: int):
+        """
+        Wins by seat in games of the given player count, then finished games without a winner and unfinished games.
+        """
+        wins = np.zeros(players+1, dtype=np.int64)
+        unfinished = 0
+        for winner, seats, finished in self.scan("games", "winner", "players", "finished"):
+            selected = (seats == players) & finished
+            wins += np.bincount(winner[selected]+1, minlength=players+1)[:players+1]
+            unfinished += int(((seats == players) & ~finished).sum())
+        # The first entry counts games without a winner.
+        return wins[1:], int(wins[0]), unfinished
+
+    def tile_claims(self):
+        """
+        Copies claimed and copies offered of each tile, by tile ID.
+        """
+        claims = np.zeros(len(tiles_by_name), dtype=np.int64)
+        offered = np.zeros(len(tiles_by_name), dtype=np.int64)
+        for chunk in self.chunks():
+            games, tiles = self.chunk(chunk, "games", "index", "tiles")
+            index, claimed = self.chunk(chunk, "turns", "index", "claimed")
+            offered += np.bincount(tiles.ravel(), minlength=len(offered))
+            # Games are stored in index order within a chunk, but failed games leave gaps in the indices.
+            turns, slots = np.nonzero(claimed[:, None] >> np.arange(SLOTS, dtype=np.uint32) & 1)
+            claims += np.bincount(tiles[np.searchsorted(games, index[turns]), slots], minlength=len(claims))
+        return claims, offered
+
+    def summary(self):
+        lines = [f"Chunks: {len(self.chunks())}, games: {self.rows('games')}, turns: {self.rows('turns')}"]
+        lines += [f"Run {run}: {json.dumps(description)}" for run, description in self.runs().items()]
+        player_counts: set[int] = set()
+        for players, in self.scan("games", "players"):
+            player_counts.update(np.unique(players).tolist())
+        for players in sorted(player_counts):
+            wins, no_winner, unfinished = self.win_counts(players)
+            total = wins.sum()+no_winner+unfinished
+            lines.append(f"{players} players: {total} games ({unfinished} hit the turn limit, {no_winner} without a winner), "
+                         "win rates "+", ".join(f"{count/total:.3f}" for count in wins))
+        claims, offered = self.tile_claims()
+        names = list(tiles_by_name)
+        rates = sorted(((claims[i]/offered[i], names[i]) for i in np.nonzero(offered)[0]), reverse=True)
+        lines += [f"{name}: {rate:.3f} claims per game" for rate, name in rates]
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a results store written by simulate.py --store.")
+    parser.add_argument("store")
+    parser.add_argument("--run", help="Only summarize the run with this ID. Stores can hold runs of different configs.")
+    args = parser.parse_args()
+    print(ResultsStore(args.store, args.run).summary())
+
+
+if __name__ == "__main__":
+    main()
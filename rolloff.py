@@ -0,0 +1,186 @@
+from __future__ import annotations
+import itertools
+from collections.abc import Callable
+from math import comb
+from typing import NamedTuple
+import numpy as np
+from constraint_table import Histogram
+from dice import get_die
+from enums import *
+from player import scarab_types
+from solver import Activations, Choice, PoolKey, Rows, TurnSolver, TurnState, activations_of, turn_state
+from tile import Tile, palace_key, pharaohs_gift, royal_decree
+import undo
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from main import Game
+    from player import Player
+
+# One-shot tiles that add dice to the start of a turn, and the dice they add.
+boost_tiles: dict[Tile, list[DiceType]] = {
+    palace_key: [DiceType.STANDARD]*2,
+    royal_decree: [DiceType.IMMEDIATE]*3,
+}
+
+
+def roll_off_score(locked: Histogram, previous: tuple[int, int]) -> tuple[int, int]:
+    """
+    The score Player.score gives: the most dice showing one value, with that value, or the previous score if higher.
+    """
+    return max([(count, bucket+1) for bucket, count in enumerate(locked) if count]+[previous])
+
+
+class RollOffSolver(TurnSolver):
+    """
+    Values a roll-off turn by whether its score beats the high score. With Pharaoh's Gift, a turn that does not is
+    redone, and redo gives the value of doing so with the tokens and tiles left over.
+    """
+
+    def __init__(self, high_score: tuple[int, int], previous: tuple[int, int], redo: Callable[[int, int, Activations], float] | None) -> None:
+        super().__init__(lambda locked, count: float(roll_off_score(locked, previous) > high_score))
+        self.redo = redo
+
+    def finish(self, rows: Rows, pipups: int, rerolls: int, activations: Activations) -> np.ndarray:
+        values = super().finish(rows, pipups, rerolls, activations)
+        if self.redo is not None:
+            values = np.maximum(values, self.redo(pipups, rerolls, activations))
+        return values
+
+
+class RollOffPlan(NamedTuple):
+    probability: float
+    # Boost tiles to activate at the start of the turn.
+    boosts: tuple[Tile, ...]
+    # Plays the rest of the turn: best_choice gives the keep policy in any state.
+    solver: TurnSolver
+
+
+class RollOffCalculator:
+    """
+    The exact probability that a player's final roll-off turn beats the game's current high score, under the best
+    keep policy, and that policy.
+
+    The turn's dice come from running the player's turn start abilities and pending effects, such as the extra
+    Standard die from begin_final_roll_off, and undoing them again. Tokens gained at the start of the turn have random
+    types, so values average over them. Palace Key and Royal Decree are used when they help, and Pharaoh's Gift redoes
+    a losing turn, without the effects and with the tokens, boost tiles and red tiles left, and the yellow and blue
+    tiles enabled again.
+
+    Everything is memoized, so the calculator can be queried again after each roll of the turn. Turns are played by
+    TurnSolver, so the dice powers, tiles and tokens it models are all taken into account. A plan for five or six dice
+    and a few tiles takes tens of milliseconds.
+    """
+
+    def __init__(self, player: Player, game: Game) -> None:
+        self.player = player
+        self.game = game
+        self.high_score = game.high_score
+        self.boosts = frozenset(tile for tile in player.tiles if tile in boost_tiles and not tile.disabled)
+        self.gift = any(tile == pharaohs_gift and not tile.disabled for tile in player.tiles)
+        self.pools: dict[tuple[frozenset[Tile], bool], tuple[PoolKey, int]] = {}
+        self.solvers: dict[tuple[frozenset[Tile], bool, tuple[int, int]], RollOffSolver] = {}
+        self.starts: dict[tuple[frozenset[Tile], int, int, Activations, bool, tuple[int, int], bool], tuple[float, frozenset[Tile]]] = {}
+        self.renewed, self.red = self.turn_start_tiles()
+
+    def turn_start_tiles(self) -> tuple[Activations, Activations]:
+        """
+        The tiles a roll-off turn can use that are enabled again at the start of each turn, and the red ones.
+        """
+        player = self.player
+        with undo.recording() as log:
+            for tile in player.tiles:
+                if tile.type in [TileType.YELLOW, TileType.BLUE]:
+                    undo.save(tile, "disabled")
+                    tile.disabled = False
+            result = activations_of([tile for tile in player.tiles if tile.type != TileType.RED]), activations_of([tile for tile in player.tiles if tile.type == TileType.RED])
+            log.undo()
+        return result
+
+    def pool(self, boosts: frozenset[Tile], effects: bool) -> tuple[PoolKey, int]:
+        """
+        The dice a roll-off turn starts with after using the boost tiles, and how many tokens it gains.
+        """
+        key = (boosts, effects)
+        if key not in self.pools:
+            player = self.player
+            rng_state = player.rng.bit_generator.state
+            tokens = player.token_count
+            with undo.recording() as log:
+                undo.save(player, "prepared_dice", "step")
+                player.prepared_dice = []
+                player.step = TurnStep.ROLL_OFF_START
+                for tile in player.tiles:
+                    if tile.ability.turn_start is not None:
+                        tile.ability.turn_start(player, self.game, tile)
+                for tile in boosts:
+                    undo.save_list(player.prepared_dice)
+                    player.prepared_dice.extend(get_die(dice_type) for dice_type in boost_tiles[tile])
+                if effects:
+                    for effect in player.effects:
+                        effect.turn_start(player, self.game)
+                pool = [0]*len(DiceType)
+                for die in player.prepared_dice:
+                    pool[die.dice_type.value] += 1
+                self.pools[key] = (tuple(pool), player.token_count-tokens)
+                log.undo()
+            player.rng.bit_generator.state = rng_state
+        return self.pools[key]
+
+    def solver(self, redo_boosts: frozenset[Tile], gift: bool, previous: tuple[int, int]) -> RollOffSolver:
+        # Without Pharaoh's Gift the boosts left over don't matter, so every choice of boosts shares one solver.
+        key = (redo_boosts if gift else frozenset[Tile](), gift, previous)
+        if key not in self.solvers:
+            def redo(pipups: int, rerolls: int, activations: Activations) -> float:
+                red = tuple(activation for activation in activations if activation in self.red)
+                return self.start_value(redo_boosts, pipups, rerolls, red, False, (0, 0), False)[0]
+            self.solvers[key] = RollOffSolver(self.high_score, previous, redo if gift else None)
+        return self.solvers[key]
+
+    def start_value(self, boosts: frozenset[Tile], pipups: int, rerolls: int, red: Activations, effects: bool, previous: tuple[int, int], gift: bool):
+        """
+        The best value of starting a roll-off turn with the given boost tiles, tokens and red tiles, and the boosts to
+        use for it.
+        """
+        key = (boosts, pipups, rerolls, red, effects, previous, gift)
+        if key in self.starts:
+            return self.starts[key]
+        best: tuple[float, frozenset[Tile]] = (-1.0, frozenset())
+        for size in range(len(boosts)+1):
+            for used in map(frozenset, itertools.combinations(sorted(boosts, key=str), size)):
+                pool, gained = self.pool(used, effects)
+                solver = self.solver(boosts-used, gift, previous)
+                value = 0.0
+                # Each token gained is a pip-up or a reroll with equal chance.
+                for new_pipups in range(gained+1):
+                    state = TurnState(pool, (0,)*6, 0, pipups+new_pipups, rerolls+gained-new_pipups, tuple(sorted(self.renewed+red)))
+                    value += comb(gained, new_pipups)/len(scarab_types)**gained*solver.roll_value(state)
+                if value > best[0]:
+                    best = (value, used)
+        self.starts[key] = best
+        return best
+
+    def plan(self) -> RollOffPlan:
+        """
+        The player's chances from the start of their roll-off turn, the boosts to use and the policy for the rest.
+        """
+        player = self.player
+        value, used = self.start_value(self.boosts, player.pip_up_amount, player.reroll_amount, self.red, True, player.final_score, self.gift)
+        return RollOffPlan(value, tuple(used), self.solver(self.boosts-used, self.gift, player.final_score))
+
+    def current(self) -> tuple[float, Choice | None]:
+        """
+        The player's chances from where their roll-off turn stands now, with the best choice if their dice are rolled.
+        """
+        player = self.player
+        boosts = frozenset(tile for tile in player.tiles if tile in boost_tiles and not tile.disabled)
+        gift = any(tile == pharaohs_gift and not tile.disabled for tile in player.tiles)
+        solver = self.solver(boosts, gift, player.final_score)
+        state = turn_state(player)
+        if player.available_dice:
+            return solver.best_choice(state)
+        return solver.roll_value(state), None
+
+
+def roll_off_plan(player: Player, game: Game) -> RollOffPlan:
+    return RollOffCalculator(player, game).plan()
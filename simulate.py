@@ -0,0 +1,302 @@
+from __future__ import annotations
+import argparse
+import functools
+import json
+import os
+from collections.abc import Callable
+from typing import Any, cast
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from numpy.random import Generator, SeedSequence
+from enums import *
+from main import Game
+from player import Agent, Player, RandomAgent
+import profiling
+from results_store import ResultsWriter
+from streams import make_stream
+from tile import start, tiles
+
+AgentFactory = Callable[[str, int, Generator], Agent]
+
+player_colors = [4, 1, 2, 3, 5, 6]
+
+
+def describe_factory(factory: Any) -> str:
+    """
+    Names an agent factory stably across processes. Partials list their arguments, and lambdas and nested
+    functions, whose names don't tell them apart, add where they are defined and the values they close over.
+    """
+    if isinstance(factory, functools.partial):
+        partial = cast(functools.partial[Any], factory)
+        arguments = [describe_factory(arg) for arg in partial.args]+[f"{key}={describe_factory(value)}" for key, value in partial.keywords.items()]
+        return f"{describe_factory(partial.func)}({', '.join(arguments)})"
+    if not callable(factory):
+        return repr(factory)
+    name = getattr(factory, "__qualname__", None)
+    if name is None:
+        return repr(factory)
+    name = f"{factory.__module__}.{name}"
+    code = getattr(factory, "__code__", None)
+    if "<" in name and code is not None:
+        name += f"@{os.path.basename(code.co_filename)}:{code.co_firstlineno}"
+        cells: tuple[Any, ...] = getattr(factory, "__closure__", None) or ()
+        if cells:
+            name += f"[{', '.join(f'{var}={describe_factory(cell.cell_contents)}' for var, cell in zip(code.co_freevars, cells))}]"
+    return name
+
+
+class SimulationConfig:
+    def __init__(self,
+                 players: int = 2,
+                 agents: list[AgentFactory] | None = None,
+                 modes: list[RowMode] | None = None,
+                 tile_names: list[str] | None = None,
+                 max_turns: int = 2000) -> None:
+        """
+        Agents are given per seat and default to RandomAgent. Tiles are given by name, so the
+        config can be sent to worker processes; None draws a random lineup each game, as do None modes.
+        """
+        self.players = players
+        self.agents: list[AgentFactory] = agents or [RandomAgent]*players
+        if len(self.agents) != players:
+            raise Exception(f"Expected {players} agents, got {len(self.agents)}.")
+        self.modes = modes
+        self.tile_names = tile_names
+        self.max_turns = max_turns
+
+    def describe(self):
+        return {
+            "players": self.players,
+            "agents": [describe_factory(agent) for agent in self.agents],
+            "modes": [mode.name for mode in self.modes] if self.modes is not None else None,
+            "tiles": self.tile_names,
+            "max_turns": self.max_turns,
+        }
+
+
+class SimulationResult:
+    def __init__(self, players: int) -> None:
+        self.players = players
+        self.games = 0
+        self.unfinished = 0
+        self.no_winner = 0
+        self.wins = [0]*players
+        self.total_turns = 0
+        self.min_turns: int | None = None
+        self.max_turns: int | None = None
+        self.score_counts: dict[str, int] = {}
+        self.tile_offered: dict[str, int] = {}
+        self.tile_claims: dict[str, int] = {}
+        # The exception raised by each game that could not be played, keyed by seed/batch/index.
+        self.failed: dict[str, str] = {}
+
+    def record(self, game: Game):
+        self.games += 1
+        if not game.game_ended:
+            self.unfinished += 1
+        elif game.high_scorer is None:
+            self.no_winner += 1
+        else:
+            self.wins[game.players.index(game.high_scorer)] += 1
+        self.total_turns += game.turns_played
+        self.min_turns = game.turns_played if self.min_turns is None else min(self.min_turns, game.turns_played)
+        self.max_turns = game.turns_played if self.max_turns is None else max(self.max_turns, game.turns_played)
+        for player in game.players:
+            score = f"{player.final_score[0]}x{player.final_score[1]}"
+            self.score_counts[score] = self.score_counts.get(score, 0)+1
+        for tile in game.get_all_tiles():
+            self.tile_offered[tile.name] = self.tile_offered.get(tile.name, 0)+1
+        for player in game.players:
+            for tile in player.tiles:
+                if tile != start:
+                    self.tile_claims[tile.name] = self.tile_claims.get(tile.name, 0)+1
+
+    def merge(self, other: SimulationResult):
+        self.games += other.games
+        self.unfinished += other.unfinished
+        self.no_winner += other.no_winner
+        self.wins = [a+b for a, b in zip(self.wins, other.wins)]
+        self.total_turns += other.total_turns
+        if other.min_turns is not None:
+            self.min_turns = other.min_turns if self.min_turns is None else min(self.min_turns, other.min_turns)
+        if other.max_turns is not None:
+            self.max_turns = other.max_turns if self.max_turns is None else max(self.max_turns, other.max_turns)
+        for counts, other_counts in ((self.score_counts, other.score_counts), (self.tile_offered, other.tile_offered), (self.tile_claims, other.tile_claims)):
+            for key, value in other_counts.items():
+                counts[key] = counts.get(key, 0)+value
+        self.failed.update(other.failed)
+
+    @property
+    def win_rates(self):
+        return [wins/self.games if self.games else 0.0 for wins in self.wins]
+
+    @property
+    def mean_turns(self):
+        return self.total_turns/self.games if self.games else 0.0
+
+    @property
+    def claim_rates(self):
+        """
+        Average copies of each tile claimed per game it was on the board.
+        """
+        return {name: self.tile_claims.get(name, 0)/offered for name, offered in self.tile_offered.items()}
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(data: dict[str, object]):
+        result = SimulationResult(0)
+        result.__dict__.update(data)
+        return result
+
+    def summary(self) -> str:
+        lines = [f"Games: {self.games} ({self.unfinished} hit the turn limit, {self.no_winner} without a winner)",
+                 f"Turns per game: mean {self.mean_turns:.1f}, min {self.min_turns}, max {self.max_turns}"]
+        if self.failed:
+            lines.append(f"Failed games: {len(self.failed)}, first {min(self.failed)}: {self.failed[min(self.failed)]}")
+        lines += [f"Seat {seat+1} win rate: {rate:.3f}" for seat, rate in enumerate(self.win_rates)]
+        lines += [f"{name}: {rate:.3f} claims per game" for name, rate in sorted(self.claim_rates.items(), key=lambda item: -item[1])]
+        return "\n".join(lines)
+
+
+def batch_seed(seed: int, batch: int) -> SeedSequence:
+    # Every batch gets its own stream family, so results don't depend on which worker runs it.
+    return SeedSequence(seed, spawn_key=(batch,))
+
+
+def setup_simulated_game(config: SimulationConfig, sequence: SeedSequence) -> Game:
+    game_stream, *player_streams = [make_stream(child) for child in sequence.spawn(1+2*config.players)]
+    tile_lineup = [tile for tile in tiles if tile.name in config.tile_names] if config.tile_names is not None else None
+    players = [Player([start.clone()], agent(f"Player {seat+1}", player_colors[seat % len(player_colors)], player_streams[2*seat]),
+                      starting_tokens=seat, rng=player_streams[2*seat+1])
+               for seat, agent in enumerate(config.agents)]
+    return Game(players, modes=config.modes, tiles=tile_lineup, rng=game_stream)
+
+
+def play_simulated_game(config: SimulationConfig, sequence: SeedSequence) -> Game:
+    game = setup_simulated_game(config, sequence)
+    game.play_game(max_turns=config.max_turns)
+    return game
+
+
+def describe_run(config: SimulationConfig, seed: int, batch_size: int):
+    """
+    What decides the games of a run, batch by batch.
+    """
+    return {"config": config.describe(), "seed": seed, "batch_size": batch_size}
+
+
+def run_batch(config: SimulationConfig, seed: int, batch: int, games: int, profile: bool = False,
+              store: str | None = None, batch_size: int | None = None) -> tuple[int, SimulationResult, profiling.Profile | None]:
+    result = SimulationResult(config.players)
+    writer = ResultsWriter(store, describe_run(config, seed, batch_size or games), batch) if store is not None else None
+    if profile:
+        profiling.enable()
+    try:
+        for index, sequence in enumerate(batch_seed(seed, batch).spawn(games)):
+            # A game that raises is counted as failed rather than stopping its batch, which a resumed run would
+            # only replay and fail on again.
+            try:
+                game = setup_simulated_game(config, sequence)
+                if writer is not None:
+                    writer.watch(game, index)
+                game.play_game(max_turns=config.max_turns)
+            except Exception as e:
+                result.failed[f"{seed}/{batch}/{index}"] = f"{type(e).__name__}: {e}"
+                if writer is not None:
+                    writer.discard(index)
+                continue
+            result.record(game)
+    finally:
+        batch_profile = profiling.disable() if profile else None
+    if writer is not None:
+        writer.close()
+    return batch, result, batch_profile
+
+
+def load_checkpoint(path: str, config: SimulationConfig, seed: int, batch_size: int):
+    with open(path) as file:
+        data = json.load(file)
+    if {key: data[key] for key in ("config", "seed", "batch_size")} != describe_run(config, seed, batch_size):
+        raise Exception(f"Checkpoint {path} was written for a different simulation.")
+    return set(data["completed"]), SimulationResult.from_dict(data["result"])
+
+
+def save_checkpoint(path: str, config: SimulationConfig, seed: int, batch_size: int, completed: set[int], result: SimulationResult):
+    data = describe_run(config, seed, batch_size) | {"completed": sorted(completed), "result": result.to_dict()}
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def simulate(config: SimulationConfig, games: int, seed: int = 0, workers: int | None = None, batch_size: int = 100, checkpoint: str | None = None,
+             profile: profiling.Profile | None = None, store: str | None = None) -> SimulationResult:
+    """
+    Plays games headless across a process pool and merges their statistics.
+
+    Games are split into fixed batches seeded from seed, so a run gives the same totals for any worker count.
+    With a checkpoint path, progress is saved after every batch and an interrupted run resumes from it.
+    With a profile, workers record one for each batch and it is merged into profile. Batches resumed from a
+    checkpoint are not profiled again.
+    With a store path, workers write each batch's games and turns to it as a chunk, for results_store to read.
+    Chunks are named after a hash of the config, seed and batch size, so other runs can share the store.
+    Games that raise are left out of the totals and listed in the result's failed games.
+    Agents run inside the pool's workers, so they must not start pools of their own, such as MCTSAgent with workers.
+    """
+    batches = {batch: min(batch_size, games-batch*batch_size) for batch in range((games+batch_size-1)//batch_size)}
+    completed: set[int] = set()
+    result = SimulationResult(config.players)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        completed, result = load_checkpoint(checkpoint, config, seed, batch_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_batch, config, seed, batch, size, profile is not None, store, batch_size) for batch, size in batches.items() if batch not in completed]
+        for future in as_completed(futures):
+            batch, batch_result, batch_profile = future.result()
+            result.merge(batch_result)
+            if profile is not None and batch_profile is not None:
+                profile.merge(batch_profile)
+            completed.add(batch)
+            if checkpoint is not None:
+                save_checkpoint(checkpoint, config, seed, batch_size, completed, result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless Favor of the Pharaoh games in parallel.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--modes", help="Row sides for levels 3-7, e.g. ABABA. Random by default.")
+    parser.add_argument("--tiles", nargs="*", help="Tile names for the lineup. Random by default.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-turns", type=int, default=2000)
+    parser.add_argument("--checkpoint")
+    parser.add_argument("--output", help="Write the merged result as JSON.")
+    parser.add_argument("--store", help="Write every game and turn to this results store directory.")
+    parser.add_argument("--profile", help="Write time per turn step in pstats format, for snakeviz or gprof2dot.")
+    parser.add_argument("--profile-folded", help="Write time per turn step as folded stacks, for flamegraph.pl or speedscope.")
+    args = parser.parse_args()
+
+    config = SimulationConfig(players=args.players,
+                              modes=[RowMode[mode] for mode in args.modes] if args.modes else None,
+                              tile_names=args.tiles,
+                              max_turns=args.max_turns)
+    profile = profiling.Profile() if args.profile or args.profile_folded else None
+    result = simulate(config, args.games, seed=args.seed, workers=args.workers, batch_size=args.batch_size, checkpoint=args.checkpoint, profile=profile, store=args.store)
+    print(result.summary())
+    if profile is not None:
+        print(profile.summary())
+        if args.profile:
+            profile.dump_stats(args.profile)
+        if args.profile_folded:
+            profile.write_folded(args.profile_folded)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result.to_dict(), file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
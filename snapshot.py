@@ -0,0 +1,63 @@
+from __future__ import annotations
+from collections.abc import Mapping
+from typing import Any, NamedTuple
+from dice import Die
+from enums import *
+from tile import Effect, Tile
+
+# Snapshots keep references to the dice and tiles they saw, with the few fields of those objects that change.
+# Restoring puts the same objects back and resets those fields, so nothing is copied or allocated per object.
+# Everything else (faces, abilities, effects, tile definitions) is immutable and shared.
+DieState = tuple[Die, DiceFace, bool]
+TileState = tuple[Tile, bool, int]
+
+
+def dice_state(dice: list[Die]) -> tuple[DieState, ...]:
+    return tuple((die, die.face, die.power_triggered) for die in dice)
+
+
+def restore_dice(states: tuple[DieState, ...]) -> list[Die]:
+    dice: list[Die] = []
+    for die, face, power_triggered in states:
+        die.face = face
+        die.power_triggered = power_triggered
+        dice.append(die)
+    return dice
+
+
+def tile_state(tile: Tile) -> TileState:
+    return (tile, tile.disabled, tile.value)
+
+
+def restore_tile(state: TileState) -> Tile:
+    tile, tile.disabled, tile.value = state
+    return tile
+
+
+class PlayerState(NamedTuple):
+    tiles: tuple[TileState, ...]
+    borrowed_tile: TileState | None
+    available_dice: tuple[DieState, ...]
+    locked_dice: tuple[DieState, ...]
+    prepared_dice: tuple[DieState, ...]
+    tokens: tuple[ScarabType, ...]
+    effects: tuple[Effect, ...]
+    step: TurnStep
+    locked_pair: bool
+    final_score: tuple[int, int]
+    finished: bool
+    rng: Mapping[str, Any]
+
+
+class GameState(NamedTuple):
+    players: tuple[PlayerState, ...]
+    # Amounts and ownership follow the board index's tile IDs, which is also the order of Game.amounts.
+    amounts: tuple[int, ...]
+    available: int
+    owned: tuple[int, ...]
+    final_roll_off: bool
+    high_score: tuple[int, int]
+    high_scorer: int | None
+    next_player_turn: int
+    turns_played: int
+    rng: Mapping[str, Any]
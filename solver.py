@@ -0,0 +1,1222 @@
+from __future__ import annotations
+import itertools
+from collections.abc import Callable, Iterator, Sequence
+from math import comb
+from typing import NamedTuple, TypeVar
+import numpy as np
+from board import bit_indices
+from constraint_table import Histogram, constraint_table
+from dice import Die, face_tables, get_die
+from enums import *
+from player import rearrangement_options, scarab_types
+from streams import make_stream
+from tile import (Tile, add_incremental_die, add_wild_die, ancestral_guidance, ankh, astrologer, burial_mask, charioteer, embalmer, entertainer,
+                  grain_merchant, guard, head_servant, heir, herder, master_artisan, matchmaker, overseer, priest, priest_of_the_dead, priestess,
+                  royal_astrologer, royal_mother, servant, soldier, soothsayer, spirit_of_the_dead, surveyor, worker)
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from main import Game
+    from player import Player
+
+# Dice are reduced to codes of type*16 + face, and a group of dice to a sorted tuple of codes,
+# so dice that only differ in identity share one state.
+Code = int
+Dice = tuple[Code, ...]
+PoolKey = tuple[int, ...]
+# Objectives score the locked dice at the end of the turn, from their value histogram and the number of dice.
+Objective = Callable[[Histogram, int], float]
+
+# What the tiles a player can use during a turn do, as (kind, value). Fixed tiles bring in a Standard die of their
+# value, wild ones of any value and incremental ones of the tile's current value. The others change the rolled dice,
+# replace them, gain tokens, or act after a lock: LOCKED_WILD locks a die of any value once every die is locked,
+# and HERDER adds a die to roll after a pair.
+(FIXED, WILD, INCREMENTAL, SERVANT, PRIEST, PRIESTESS, HEIR, MASTER_ARTISAN, HEAD_SERVANT, ROYAL_ASTROLOGER, ENTERTAINER, MATCHMAKER,
+ REARRANGE, SURVEYOR, GRAIN_MERCHANT, ROYAL_MOTHER, TOKENS, ANKH, ANCESTRAL_GUIDANCE, LOCKED_WILD, HERDER) = range(21)
+Activation = tuple[int, int]
+Activations = tuple[Activation, ...]
+# The pool, pip-ups, rerolls, tiles and prepared dice a group of states shares.
+GroupKey = tuple[PoolKey, int, int, Activations, int]
+
+EPSILON = 1e-9
+# The most values a solver holds before it leaves tiles out, about 80 MB.
+BUDGET = 10**7
+
+value_die_tiles = {worker: 1, guard: 2, soldier: 3, overseer: 4, charioteer: 5, embalmer: 6}
+tile_activations: dict[Tile, Activation] = {tile: (FIXED, value) for tile, value in value_die_tiles.items()} | {
+    servant: (SERVANT, 0), priest: (PRIEST, 0), priestess: (PRIESTESS, 0), heir: (HEIR, 0), master_artisan: (MASTER_ARTISAN, 0),
+    head_servant: (HEAD_SERVANT, 0), royal_astrologer: (ROYAL_ASTROLOGER, 0), entertainer: (ENTERTAINER, 0), matchmaker: (MATCHMAKER, 0),
+    soothsayer: (REARRANGE, 2), astrologer: (REARRANGE, 3), surveyor: (SURVEYOR, 0), grain_merchant: (GRAIN_MERCHANT, 0),
+    royal_mother: (ROYAL_MOTHER, 0), burial_mask: (TOKENS, 5), ankh: (ANKH, 0), ancestral_guidance: (ANCESTRAL_GUIDANCE, 0),
+    spirit_of_the_dead: (LOCKED_WILD, 0), priest_of_the_dead: (LOCKED_WILD, 0), herder: (HERDER, 0)}
+# Kinds that add a die to the turn, which bounds how many dice can end up locked.
+adding_kinds = {FIXED, WILD, INCREMENTAL, SURVEYOR, ANCESTRAL_GUIDANCE, LOCKED_WILD, HERDER}
+lock_kinds = {LOCKED_WILD, HERDER}
+# Kinds whose outcome depends on the pips of the dice, so a pip-up before them can pay off without locking the die.
+pip_kinds = {ENTERTAINER, REARRANGE, SURVEYOR}
+# The order in which a solver over its budget leaves tiles out, the ones that grow the search most first.
+costly_kinds = [SURVEYOR, ROYAL_MOTHER, GRAIN_MERCHANT, REARRANGE, HEIR, ROYAL_ASTROLOGER, HEAD_SERVANT, PRIESTESS, PRIEST, ENTERTAINER, MATCHMAKER,
+                MASTER_ARTISAN, SERVANT, ANKH, TOKENS, ANCESTRAL_GUIDANCE, LOCKED_WILD, HERDER, WILD, INCREMENTAL, FIXED]
+# Tokens value for a kind whose tokens gained are the tokens held.
+HELD = -1
+T = TypeVar('T')
+
+STANDARD = DiceType.STANDARD.value
+IMMEDIATE = DiceType.IMMEDIATE.value
+SERF = DiceType.SERF.value
+VOYAGE = DiceType.VOYAGE.value
+ADD_TWO_CODE = VOYAGE*16+DiceFace.ADD_TWO.value
+# Locked dice are packed into one key, four bits for the count of each value and four for the dice without one,
+# so the key of a lock is the sum of its dice's keys.
+NULL_SHIFT = 24
+
+
+class BudgetException(Exception):
+    pass
+
+
+def code(dice_type: DiceType, face: DiceFace) -> Code:
+    return dice_type.value*16+face.value
+
+
+def code_value(die_code: Code) -> int | None:
+    value = to_value(DiceFace(die_code & 15))
+    return value.value-1 if value is not DiceValue.NULL else None
+
+
+def pipup_code(die_code: Code, amount: int = 1) -> Code | None:
+    face = face_tables[DiceType(die_code >> 4)].pipups[DiceFace(die_code & 15)][amount]
+    return die_code & ~15 | face.value if face is not None else None
+
+
+all_codes = [code(dice_type, face) for dice_type in DiceType for face in face_tables[dice_type].face_set]
+# Value bucket (0-5) of each code, or None for faces without a value.
+code_values = {die_code: code_value(die_code) for die_code in all_codes}
+code_keys = {die_code: 1 << 4*bucket if bucket is not None else 1 << NULL_SHIFT for die_code, bucket in code_values.items()}
+# Pip-ups and tiles never turn a die to a face with a dice power, which would trigger it; the solver leaves those moves out.
+power_codes = frozenset(die_code for die_code in all_codes if DiceFace(die_code & 15) in Die.power_faces)
+settled_codes = [sorted(code(dice_type, face) for face in face_tables[dice_type].face_set if face not in Die.power_faces) for dice_type in DiceType]
+immediate_codes = {die_code for die_code in all_codes if die_code >> 4 == IMMEDIATE}
+# Types that can lock a die without a value.
+null_types = [dice_type.value for dice_type in DiceType if any(code_values[code(dice_type, face)] is None for face in face_tables[dice_type].face_set)]
+
+
+def settled_pipup(die_code: Code, amount: int) -> Code | None:
+    new_code = pipup_code(die_code, amount)
+    return new_code if new_code not in power_codes else None
+
+
+def flipped_code(die_code: Code) -> Code:
+    new_code = die_code & ~15 | face_tables[DiceType(die_code >> 4)].flipped[DiceFace(die_code & 15)].value
+    return new_code if new_code not in power_codes else die_code
+
+
+pipup_codes = {die_code: settled_pipup(die_code, 1) for die_code in all_codes}
+# Multisets of dice are also hashed as the sum of a random key per code, small enough that sums never overflow, so
+# numpy can step between rolls by adding and subtracting keys. The keys come from a fixed seed, as in zobrist.py.
+code_hashes = make_stream(0x501E).integers(0, 2**56, size=len(DiceType)*16, dtype=np.int64)
+code_hash_list: list[int] = code_hashes.tolist()
+
+
+def face_distribution(dice_type: DiceType) -> list[tuple[Code, float]]:
+    faces = face_tables[dice_type].faces
+    return [(code(dice_type, face), faces.count(face)/len(faces)) for face in dict.fromkeys(faces)]
+
+
+reroll_distributions = {dice_type.value: face_distribution(dice_type) for dice_type in DiceType}
+pool_outcomes_cache: dict[PoolKey, list[tuple[Dice, float]]] = {(0,)*len(DiceType): [((), 1.0)]}
+
+
+def pool_outcomes(pool: PoolKey) -> list[tuple[Dice, float]]:
+    """
+    Every distinct roll of the pool with its probability, built per die type from the faces in dice.py.
+    """
+    if pool in pool_outcomes_cache:
+        return pool_outcomes_cache[pool]
+    outcomes: dict[Dice, float] = {(): 1.0}
+    for dice_type, amount in enumerate(pool):
+        for _ in range(amount):
+            rolled: dict[Dice, float] = {}
+            for dice, probability in outcomes.items():
+                for die_code, face_probability in reroll_distributions[dice_type]:
+                    key = tuple(sorted(dice+(die_code,)))
+                    rolled[key] = rolled.get(key, 0.0)+probability*face_probability
+            outcomes = rolled
+    pool_outcomes_cache[pool] = list(outcomes.items())
+    return pool_outcomes_cache[pool]
+
+
+def remove(items: tuple[T, ...], item: T) -> tuple[T, ...]:
+    index = items.index(item)
+    return items[:index]+items[index+1:]
+
+
+def replace(dice: Dice, old: Code, new: Code) -> Dice:
+    return tuple(sorted(remove(dice, old)+(new,)))
+
+
+def distinct(dice: Dice) -> list[Code]:
+    return list(dict.fromkeys(dice))
+
+
+def type_counts(dice: Dice) -> PoolKey:
+    counts = [0]*len(DiceType)
+    for die_code in dice:
+        counts[die_code >> 4] += 1
+    return tuple(counts)
+
+
+def add_dice(pool: PoolKey, dice_type: int, amount: int) -> PoolKey:
+    return pool[:dice_type]+(pool[dice_type]+amount,)+pool[dice_type+1:]
+
+
+def subtract(pool: PoolKey, counts: PoolKey) -> PoolKey:
+    return tuple(a-b for a, b in zip(pool, counts))
+
+
+def dice_hash(dice: Dice) -> int:
+    return sum(code_hash_list[die_code] for die_code in dice)
+
+
+def dice_key(dice: Dice) -> int:
+    return sum(code_keys[die_code] for die_code in dice)
+
+
+def locked_key(locked: Histogram, nulls: int) -> int:
+    return sum(amount << 4*bucket for bucket, amount in enumerate(locked))+(nulls << NULL_SHIFT)
+
+
+def has_pair(dice: Dice) -> bool:
+    values = [code_values[die_code] for die_code in dice]
+    return any(values.count(bucket) >= 2 for bucket in values if bucket is not None)
+
+
+def sub_multisets(dice: Dice) -> Iterator[Dice]:
+    """
+    Every sub-multiset of the dice, each once, as sorted tuples.
+    """
+    counts = {die_code: dice.count(die_code) for die_code in distinct(dice)}
+    for taken in itertools.product(*(range(amount+1) for amount in counts.values())):
+        yield tuple(die_code for die_code, amount in zip(counts, taken) for _ in range(amount))
+
+
+def after_roll(activations: Activations) -> Activations:
+    return tuple(sorted((kind, min(6, value+1) if kind == INCREMENTAL else value) for kind, value in activations))
+
+
+def potential(pool: PoolKey, activations: Activations) -> int:
+    """
+    How many dice the tiles and Voyage dice can still add to the turn.
+    """
+    return 2*pool[VOYAGE]+sum(kind in adding_kinds for kind, _ in activations)
+
+
+def null_capacity(pool: PoolKey) -> int:
+    return sum(pool[dice_type] for dice_type in null_types)
+
+
+def token_outcomes(tokens: int) -> list[tuple[int, float]]:
+    """
+    How many of the tokens gained are pip-ups, with the probability of each; each token is one type at random.
+    """
+    return [(pipups, comb(tokens, pipups)/len(scarab_types)**tokens) for pipups in range(tokens+1)]
+
+
+class Rows:
+    """
+    The locked dice a group of states is solved for at once: every histogram of count-slack to count dice past the
+    solver's base, up to nulls of them without a value, in the order of their keys.
+    """
+
+    def __init__(self, count: int, nulls: int, slack: int) -> None:
+        if count > 15 or nulls > 15:
+            raise BudgetException("The solver packs at most 15 locked dice of a value.")
+        histograms: list[tuple[int, ...]] = []
+
+        def extend(prefix: tuple[int, ...], left: int):
+            if len(prefix) == 6:
+                histograms.extend(prefix+(amount,) for amount in range(max(0, left-slack), min(nulls, left)+1))
+                return
+            for amount in range(left+1):
+                extend(prefix+(amount,), left-amount)
+        extend((), count)
+        histograms.sort(key=lambda hist: locked_key(hist[:6], hist[6]))
+        self.histograms = histograms
+        self.counts = np.array(histograms, dtype=np.int64).reshape(-1, 7)
+        self.keys = np.array([locked_key(hist[:6], hist[6]) for hist in histograms], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.histograms)
+
+    def find(self, keys: np.ndarray | int) -> np.ndarray:
+        """
+        The rows of the keys. Keys past the slack can only come from rows the turn can't reach, and get any row.
+        """
+        return np.minimum(np.searchsorted(self.keys, keys), len(self.keys)-1)
+
+
+rows_cache: dict[tuple[int, int, int], Rows] = {}
+
+
+def solver_rows(count: int, nulls: int, slack: int) -> Rows:
+    key = (count, nulls, min(count, slack))
+    if key not in rows_cache:
+        rows_cache[key] = Rows(*key)
+    return rows_cache[key]
+
+
+class Transition(NamedTuple):
+    # The dice available after an activation.
+    pool: PoolKey
+    # For each roll, the rolls of pool the activation can lead to, padded with the number of rolls of pool.
+    moves: np.ndarray
+    # Tokens gained, or HELD for as many as the player holds.
+    tokens: int
+    # Standard dice added to roll next.
+    prepared: int
+    # The value a locked die must show for the activation to be possible, or -1.
+    matching: int
+
+
+def compositions(faces: int, most: int) -> np.ndarray:
+    """
+    Every way of putting up to most dice on the faces, as counts per face.
+    """
+    counts = [[combo.count(face) for face in range(faces)] for amount in range(most+1) for combo in itertools.combinations_with_replacement(range(faces), amount)]
+    return np.array(counts, dtype=np.int64).reshape(-1, faces)
+
+
+def unique_pairs(first: np.ndarray, second: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The distinct pairs of the two arrays, sorted by first.
+    """
+    order = np.lexsort((second, first))
+    first, second = first[order], second[order]
+    keep = np.ones(len(first), dtype=bool)
+    keep[1:] = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+    return first[keep], second[keep]
+
+
+def padded_pairs(sources: np.ndarray, targets: np.ndarray, count: int, fill: int) -> np.ndarray:
+    """
+    The targets of each source as rows, padded with fill.
+    """
+    sources, targets = unique_pairs(sources, targets)
+    offsets = np.arange(len(sources))-np.searchsorted(sources, np.arange(count))[sources]
+    table = np.full((count, int(offsets.max(initial=0))+1), fill, dtype=np.intp)
+    table[sources, offsets] = targets
+    return table
+
+
+def compacted(table: np.ndarray, fill: int) -> np.ndarray:
+    """
+    The table with the fill of each row moved to its end and the columns that only hold fill dropped.
+    """
+    padding = table == fill
+    width = max(1, int((~padding).sum(axis=1).max(initial=0)))
+    return np.take_along_axis(table, np.argsort(padding, axis=1, kind="stable")[:, :width], axis=1)
+
+
+class HashIndex:
+    """
+    Finds multisets of dice by their hashes.
+    """
+
+    def __init__(self, hashes: np.ndarray) -> None:
+        self.order = np.argsort(hashes)
+        self.hashes = hashes[self.order]
+
+    def find(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Indices of the hashes, which must be listed.
+        """
+        return self.order[np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes)-1)]
+
+
+rearrangement_cache: dict[tuple[tuple[int, ...], int], list[Dice]] = {}
+
+
+def rearranged_codes(types: tuple[int, ...], total: int) -> list[Dice]:
+    key = (types, total)
+    if key not in rearrangement_cache:
+        dice = [get_die(DiceType(dice_type)) for dice_type in types]
+        rearrangement_cache[key] = [tuple(dice_type*16+face.value for dice_type, face in zip(types, faces))
+                                    for faces in rearrangement_options(dice, total) if not Die.power_faces.intersection(faces)]
+    return rearrangement_cache[key]
+
+
+def other_faces(die_code: Code) -> list[Code]:
+    return [new_code for new_code in settled_codes[die_code >> 4] if new_code != die_code]
+
+
+def pipped_faces(die_code: Code, amount: int, steps: int = 1) -> list[Code]:
+    """
+    The codes up to steps pip-ups of amount pips each take the code to.
+    """
+    options = [die_code]
+    while len(options) <= steps and (new_code := settled_pipup(options[-1], amount)) is not None:
+        options.append(new_code)
+    return options[1:]
+
+
+# The faces each kind that keeps the pool can turn a die to, for kinds that change one die and kinds that change any.
+single_kinds: dict[int, Callable[[Code], list[Code]]] = {
+    SERVANT: lambda c: [new for amount in (1, 2, 3) if (new := settled_pipup(c, amount)) is not None],
+    MASTER_ARTISAN: other_faces,
+}
+changed_kinds: dict[int, Callable[[Code], list[Code]]] = {
+    PRIEST: lambda c: pipped_faces(c, 1),
+    PRIESTESS: lambda c: pipped_faces(c, 2),
+    HEIR: lambda c: pipped_faces(c, 1, 2),
+    HEAD_SERVANT: lambda c: other_faces(c) if c >> 4 == IMMEDIATE else [],
+    ROYAL_ASTROLOGER: lambda c: other_faces(c) if c >> 4 != STANDARD else [],
+    ENTERTAINER: lambda c: [new for new in [flipped_code(c)] if new != c],
+}
+
+
+class PoolTables:
+    """
+    Lookups for one pool of dice that do not depend on the objective, shared by every solver.
+
+    Rolls are the pool's distinct outcomes. Subs are the sub-multisets of all its faces, smallest first, which are the
+    dice a lock can take, with the tables that step between them. Rolls with dice powers still to resolve are columns
+    past the rolls, one per (roll, pending dice), which the tables add to as they need them. The tables are built with
+    numpy over the counts of each code of the pool's dice types and the hashes of rolls and subs.
+    """
+
+    def __init__(self, pool: PoolKey) -> None:
+        self.pool = pool
+        self.size = sum(pool)
+        outcomes = pool_outcomes(pool)
+        self.rolls = [dice for dice, _ in outcomes]
+        self.probabilities = np.array([probability for _, probability in outcomes])
+        self.roll_index = {dice: i for i, dice in enumerate(self.rolls)}
+        self.pending: list[tuple[int, Dice]] = []
+        self.pending_index: dict[tuple[int, Dice], int] = {}
+        self.roll_columns = np.array([self.column(i, tuple(die_code for die_code in dice if die_code in power_codes)) for i, dice in enumerate(self.rolls)], dtype=np.intp)
+
+        self.codes = [code(DiceType(dice_type), face) for dice_type, count in enumerate(pool) if count for face in sorted(face_tables[DiceType(dice_type)].face_set, key=lambda f: f.value)]
+        self.code_column = {die_code: i for i, die_code in enumerate(self.codes)}
+        self.code_hashes = code_hashes[self.codes]
+        self.roll_counts = self.counts(self.rolls)
+        self.roll_hashes = self.roll_counts @ self.code_hashes
+        self.roll_lookup = HashIndex(self.roll_hashes)
+
+        # Subs by size for the layers, then by the dice each leaves to roll, so each lock bucket is a run of subs.
+        blocks = [compositions(len(face_tables[DiceType(dice_type)].face_set), count) for dice_type, count in enumerate(pool) if count]
+        sub_counts = np.zeros((1, 0), dtype=np.int64)
+        for block in blocks:
+            sub_counts = np.hstack([np.repeat(sub_counts, len(block), axis=0), np.tile(block, (len(sub_counts), 1))])
+        types = np.zeros((len(sub_counts), len(pool)), dtype=np.int64)
+        code_types = np.array([die_code >> 4 for die_code in self.codes], dtype=np.intp)
+        for dice_type in set(code_types.tolist()):
+            types[:, dice_type] = sub_counts[:, code_types == dice_type].sum(axis=1)
+        add_twos = sub_counts[:, self.code_column[ADD_TWO_CODE]] if ADD_TWO_CODE in self.code_column else np.zeros(len(sub_counts), dtype=np.int64)
+        sizes = types.sum(axis=1)
+        order = np.lexsort((add_twos,)+tuple(types.T[::-1])+(sizes,))
+        self.sub_counts = sub_counts = sub_counts[order]
+        types, add_twos, sizes = types[order], add_twos[order], sizes[order]
+        self.sub_types = types
+        self.sub_sizes = sizes
+        self.layers = [(int(np.searchsorted(sizes, size)), int(np.searchsorted(sizes, size, side="right"))) for size in range(self.size+1)]
+        self.sub_keys = sub_counts @ np.array([code_keys[die_code] for die_code in self.codes], dtype=np.int64)
+        buckets = np.array([[code_values[die_code] == bucket for bucket in range(6)] for die_code in self.codes], dtype=np.int64).reshape(-1, 6)
+        self.pairs = (sub_counts @ buckets >= 2).any(axis=1)
+        sub_hashes = sub_counts @ self.code_hashes
+        self.sub_lookup = sub_lookup = HashIndex(sub_hashes)
+        self.roll_subs = sub_lookup.find(self.roll_hashes)
+        # Locks by the dice they leave to roll and the Standard dice they add, with the run of subs they take. Locks
+        # that leave an Immediate die are not allowed.
+        starts = np.flatnonzero(np.r_[True, (types[1:] != types[:-1]).any(axis=1) | (add_twos[1:] != add_twos[:-1])])
+        ends = np.r_[starts[1:], len(sub_counts)]
+        self.lock_buckets = [(subtract(pool, tuple(types[start].tolist())), 2*int(add_twos[start]), slice(int(start), int(end)))
+                             for start, end in zip(starts, ends) if start and types[start, IMMEDIATE] == pool[IMMEDIATE]]
+        # Locks one die smaller, keeping the Immediate dice, which every lock must take; any die for a Grain Merchant;
+        # and one die pipped up. Each has an extra row for the padding and is padded with an index past the subs.
+        removals = [(die_code, None) for die_code in self.codes]
+        pipups = [(die_code, new_code) for die_code in self.codes if (new_code := pipup_codes[die_code]) is not None]
+        self.children = self.steps(sub_counts, sub_hashes, sub_lookup, [step for step in removals if step[0] not in immediate_codes], True)
+        self.all_children = self.steps(sub_counts, sub_hashes, sub_lookup, removals, True)
+        self.pipped = self.steps(sub_counts, sub_hashes, sub_lookup, pipups, True)
+        self.pipped_rolls = self.steps(self.roll_counts, self.roll_hashes, self.roll_lookup, pipups, False)
+        self.rerolls: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        self.grain: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, set[Dice]] | None = None
+        self.transition_cache: dict[Activation, list[Transition]] = {}
+
+    def subs(self, indices: np.ndarray) -> list[Dice]:
+        return [tuple(die_code for die_code, count in zip(self.codes, counts) for _ in range(count)) for counts in self.sub_counts[indices].tolist()]
+
+    def sub_index(self, dice: Dice) -> int:
+        return int(self.sub_lookup.find(np.array([dice_hash(dice)]))[0])
+
+    def chosen(self, bucket: int, pair: bool) -> np.ndarray:
+        """
+        The subs of a lock bucket, or only those holding a pair.
+        """
+        indices = np.arange(len(self.sub_counts))[self.lock_buckets[bucket][2]]
+        return indices[self.pairs[indices]] if pair else indices
+
+    def counts(self, dice: list[Dice]) -> np.ndarray:
+        """
+        How many dice of each of the pool's codes each multiset holds.
+        """
+        counts = np.zeros((len(dice), len(self.codes)), dtype=np.int64)
+        for i, multiset in enumerate(dice):
+            for die_code in multiset:
+                counts[i, self.code_column[die_code]] += 1
+        return counts
+
+    def steps(self, counts: np.ndarray, hashes: np.ndarray, lookup: HashIndex, steps: Sequence[tuple[Code, Code | None]], sentinel: bool) -> np.ndarray:
+        """
+        Where turning a die of each code into another, or removing it, leads from each multiset, padded with the number
+        of multisets, and with a row of padding if sentinel.
+        """
+        table = np.full((len(counts)+sentinel, max(1, len(steps))), len(counts), dtype=np.intp)
+        for j, (die_code, new_code) in enumerate(steps):
+            rows = np.flatnonzero(counts[:, self.code_column[die_code]])
+            change = (code_hash_list[new_code] if new_code is not None else 0)-code_hash_list[die_code]
+            table[rows, j] = lookup.find(hashes[rows]+change)
+        return compacted(table, len(counts))
+
+    def column(self, roll: int, pending: Dice) -> int:
+        """
+        The column of a roll whose pending dice still have a power to resolve.
+        """
+        if not pending:
+            return roll
+        key = (roll, pending)
+        if key not in self.pending_index:
+            self.pending_index[key] = len(self.rolls)+len(self.pending)
+            self.pending.append(key)
+        return self.pending_index[key]
+
+    def outcome(self, dice: Dice, die_code: Code, new_code: Code, pending: Dice) -> tuple[int, Dice]:
+        """
+        The roll and pending dice after a die is rolled to a new face.
+        """
+        return self.roll_index[tuple(sorted(remove(dice, die_code)+(new_code,)))], tuple(sorted(pending+(new_code,))) if new_code in power_codes else pending
+
+    def reroll_table(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        For each roll and each of its distinct dice, the columns rerolling that die leads to and their probabilities,
+        and which dice exist.
+        """
+        if self.rerolls is None:
+            shown = self.roll_counts > 0
+            width = int(shown.sum(axis=1).max())
+            # The pool's codes each roll shows, first.
+            columns = np.argsort(~shown, axis=1, kind="stable")[:, :width]
+            valid = np.take_along_axis(shown, columns, axis=1)
+            distributions = [reroll_distributions[die_code >> 4] for die_code in self.codes]
+            faces = max(map(len, distributions))
+            new_codes = np.array([[new_code for new_code, _ in distribution]+[distribution[0][0]]*(faces-len(distribution)) for distribution in distributions])
+            face_probabilities = np.array([[probability for _, probability in distribution]+[0.0]*(faces-len(distribution)) for distribution in distributions])
+            hashes = self.roll_hashes[:, None, None]-self.code_hashes[columns][:, :, None]+code_hashes[new_codes[columns]]
+            targets = self.roll_lookup.find(hashes)
+            probabilities = face_probabilities[columns]*valid[:, :, None]
+            for i, j, k in zip(*np.nonzero(np.isin(new_codes[columns], list(power_codes)) & (probabilities > 0))):
+                targets[i, j, k] = self.column(int(targets[i, j, k]), (int(new_codes[columns[i, j], k]),))
+            self.rerolls = (targets, probabilities, valid)
+        return self.rerolls
+
+    def grain_table(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, set[Dice]]:
+        """
+        The sub-multisets a Grain Merchant can keep while rerolling the rest, with the columns and probabilities of
+        each outcome, where each kept sub-multiset's outcomes start, and the sub-multisets kept.
+        """
+        if self.grain is None:
+            kept = np.flatnonzero(self.sub_sizes < self.size)
+            parts: list[np.ndarray] = []
+            probabilities: list[np.ndarray] = []
+            starts: list[int] = []
+            for dice in self.subs(kept):
+                outcomes, outcome_probabilities, outcome_hashes = rolled_hashes(subtract(self.pool, type_counts(dice)))
+                starts.append(sum(map(len, parts)))
+                targets = self.roll_lookup.find(outcome_hashes+dice_hash(dice))
+                for k, outcome in enumerate(outcomes):
+                    pending = tuple(die_code for die_code in outcome if die_code in power_codes)
+                    if pending:
+                        targets[k] = self.column(int(targets[k]), pending)
+                parts.append(targets)
+                probabilities.append(outcome_probabilities)
+            self.grain = (kept, np.concatenate(parts), np.concatenate(probabilities), np.array(starts, dtype=np.intp), set(self.subs(kept)))
+        return self.grain
+
+    def transitions(self, activation: Activation) -> list[Transition]:
+        if activation not in self.transition_cache:
+            self.transition_cache[activation] = list(self.build_transitions(*activation))
+        return self.transition_cache[activation]
+
+    def build_transitions(self, kind: int, value: int) -> Iterator[Transition]:
+        pool = self.pool
+        if kind in (FIXED, WILD, INCREMENTAL):
+            faces = range(1, 7) if kind == WILD else [value] if value else []
+            yield self.replaced(add_dice(pool, STANDARD, 1), [((), [(STANDARD*16+face,) for face in faces])])
+        elif kind == MATCHMAKER:
+            for bucket in range(6):
+                yield self.replaced(pool, [((c,), [(new,) for new in other_faces(c) if code_values[new] == bucket]) for c in self.codes], matching=bucket)
+        elif kind == SURVEYOR:
+            for dice_type, count in enumerate(pool):
+                if count:
+                    changes = [((c,), [(IMMEDIATE*16+first, IMMEDIATE*16+bucket+1-first) for first in range(max(1, bucket+1-6), (bucket+1)//2+1)])
+                               for c in self.codes if c >> 4 == dice_type and (bucket := code_values[c]) is not None and bucket > 0]
+                    yield self.replaced(add_dice(add_dice(pool, dice_type, -1), IMMEDIATE, 2), changes)
+        elif kind == ROYAL_MOTHER:
+            for immediates in range(pool[IMMEDIATE]+1):
+                for serfs in range(pool[SERF]+1):
+                    if immediates or serfs:
+                        gone = add_dice(add_dice((0,)*len(pool), IMMEDIATE, immediates), SERF, serfs)
+                        changes = [(dice, [()]) for dice in self.subs(np.flatnonzero((self.sub_types == gone).all(axis=1)))]
+                        yield self.replaced(subtract(pool, gone), changes, tokens=immediates+serfs, prepared=immediates+serfs)
+        elif kind in (TOKENS, ANKH, ANCESTRAL_GUIDANCE):
+            yield self.replaced(pool, [((), [()])], tokens=value if kind == TOKENS else 2 if kind == ANCESTRAL_GUIDANCE else HELD, prepared=int(kind == ANCESTRAL_GUIDANCE))
+        elif kind == REARRANGE:
+            nulls = [code_values[die_code] is None for die_code in self.codes]
+            changes: list[tuple[Dice, list[Dice]]] = []
+            for dice in self.subs(np.flatnonzero((self.sub_sizes == value) & ~self.sub_counts[:, nulls].any(axis=1))):
+                total = sum(bucket+1 for die_code in dice if (bucket := code_values[die_code]) is not None)
+                changes.append((dice, rearranged_codes(tuple(die_code >> 4 for die_code in dice), total)))
+            yield self.replaced(pool, changes)
+        elif kind in single_kinds:
+            yield self.replaced(pool, [((c,), [(new,) for new in single_kinds[kind](c)]) for c in self.codes])
+        elif kind in changed_kinds:
+            yield self.changed(changed_kinds[kind])
+
+    def replaced(self, target: PoolKey, changes: list[tuple[Dice, list[Dice]]], tokens: int = 0, prepared: int = 0, matching: int = -1) -> Transition:
+        """
+        The activation that replaces one of the multisets of changes, where a roll holds it, with one of its options.
+        """
+        tables = pool_tables(target)
+        sources: list[np.ndarray] = []
+        targets: list[np.ndarray] = []
+        for old, news in changes:
+            if not news:
+                continue
+            rows = np.flatnonzero((self.roll_counts >= self.counts([old])[0]).all(axis=1))
+            for new in news:
+                sources.append(rows)
+                targets.append(tables.roll_lookup.find(self.roll_hashes[rows]+(dice_hash(new)-dice_hash(old))))
+        empty = np.zeros(0, dtype=np.intp)
+        moves = padded_pairs(np.concatenate(sources+[empty]), np.concatenate(targets+[empty]), len(self.rolls), len(tables.rolls))
+        return Transition(target, moves, tokens, prepared, matching)
+
+    def changed(self, options: Callable[[Code], list[Code]]) -> Transition:
+        """
+        The activation that may turn each die into one of its options, or leave it.
+        """
+        sources = np.arange(len(self.rolls))
+        hashes = self.roll_hashes
+        for j, die_code in enumerate(self.codes):
+            others = options(die_code)
+            most = int(self.roll_counts[:, j].max())
+            if not others or not most:
+                continue
+            counts = self.roll_counts[sources, j]
+            parts = [(sources, hashes)]
+            for amount in range(1, most+1):
+                rows = counts >= amount
+                for new_codes in itertools.combinations_with_replacement(others, amount):
+                    parts.append((sources[rows], hashes[rows]+(dice_hash(new_codes)-amount*code_hash_list[die_code])))
+            sources, hashes = unique_pairs(np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]))
+        moves = padded_pairs(sources, self.roll_lookup.find(hashes), len(self.rolls), len(self.rolls))
+        return Transition(self.pool, moves, 0, 0, -1)
+
+
+rolled_cache: dict[PoolKey, tuple[list[Dice], np.ndarray, np.ndarray]] = {}
+
+
+def rolled_hashes(pool: PoolKey) -> tuple[list[Dice], np.ndarray, np.ndarray]:
+    """
+    The distinct rolls of a pool with their probabilities and hashes.
+    """
+    if pool not in rolled_cache:
+        outcomes = pool_outcomes(pool)
+        rolled_cache[pool] = ([dice for dice, _ in outcomes], np.array([probability for _, probability in outcomes]),
+                              np.array([dice_hash(dice) for dice, _ in outcomes], dtype=np.int64))
+    return rolled_cache[pool]
+
+
+pool_tables_cache: dict[PoolKey, PoolTables] = {}
+
+
+def pool_tables(pool: PoolKey) -> PoolTables:
+    if pool not in pool_tables_cache:
+        pool_tables_cache[pool] = PoolTables(pool)
+    return pool_tables_cache[pool]
+
+
+index_cache: dict[tuple[Rows, Rows, PoolKey, int, bool, int], np.ndarray] = {}
+
+
+def lock_index(rows: Rows, child_rows: Rows, tables: PoolTables, bucket: int, pair: bool, extra: int) -> np.ndarray:
+    """
+    Where each row goes in child_rows when it locks a sub-multiset of the bucket's, by row and sub-multiset, with extra
+    added to the key. With pair, only sub-multisets holding a pair are listed.
+    """
+    key = (rows, child_rows, tables.pool, bucket, pair, extra)
+    found = index_cache.get(key)
+    if found is None:
+        chosen = tables.chosen(bucket, pair)
+        found = index_cache[key] = child_rows.find(rows.keys[:, None]+tables.sub_keys[chosen]+extra)
+    return found
+
+
+def subset_max(values: np.ndarray, tables: PoolTables, children: np.ndarray):
+    """
+    Turns values by sub-multiset into the best value of each sub-multiset and those below it, layer by layer.
+    """
+    for start, end in tables.layers[1:]:
+        values[:, start:end] = np.maximum(values[:, start:end], values[:, children[start:end]].max(axis=2))
+
+
+def subset_argmax(values: np.ndarray, tables: PoolTables, children: np.ndarray) -> np.ndarray:
+    """
+    Like subset_max, and gives the sub-multiset each best value comes from.
+    """
+    best: np.ndarray = np.tile(np.arange(values.shape[1], dtype=np.intp), (len(values), 1))
+    for start, end in tables.layers[1:]:
+        below = children[start:end]
+        top = values[:, below].argmax(axis=2)[:, :, None]
+        top_values = np.take_along_axis(values[:, below], top, 2)[:, :, 0]
+        better = top_values > values[:, start:end]
+        values[:, start:end] = np.where(better, top_values, values[:, start:end])
+        best[:, start:end] = np.where(better, np.take_along_axis(best[:, below], top, 2)[:, :, 0], best[:, start:end])
+    return best
+
+
+class Group:
+    """
+    The decision values of the states that share a pool, tokens, tiles and prepared dice, by row of locked dice and roll.
+    """
+    __slots__ = ("tables", "rows", "values", "extended", "post", "resolved", "adjusted")
+
+    def __init__(self, tables: PoolTables, rows: Rows, extended: np.ndarray) -> None:
+        self.tables = tables
+        self.rows = rows
+        # The values with a column of -inf for the padding in move tables.
+        self.extended = extended
+        self.values = extended[:, :-1]
+        # With a column for each roll with dice powers pending that the tables list, once resolved.
+        self.post = self.values
+        self.resolved: dict[tuple[int, Dice], np.ndarray] = {}
+        self.adjusted: dict[tuple[int, Dice, int], np.ndarray] = {}
+
+
+class LockChoice(NamedTuple):
+    dice: Dice
+
+
+class PipUpChoice(NamedTuple):
+    die: Code
+
+
+class RerollChoice(NamedTuple):
+    die: Code
+
+
+class ActivateChoice(NamedTuple):
+    activation: Activation
+    # The rolled dice the activation leaves, or for a Grain Merchant, the dice it keeps.
+    dice: Dice
+
+
+Choice = LockChoice | PipUpChoice | RerollChoice | ActivateChoice
+
+
+class TurnState(NamedTuple):
+    dice: Dice | PoolKey
+    locked: Histogram
+    nulls: int
+    pipups: int
+    rerolls: int
+    activations: Activations
+    # Standard dice that tiles added to roll after the next lock.
+    prepared: int = 0
+
+
+class TurnSolver:
+    """
+    Expectimax over the rest of a turn, maximizing the expected objective of the dice locked at its end.
+
+    Rolls are chance nodes over the exact face distributions of each die type. After each roll, dice powers are
+    resolved, then the player may use pip-up and reroll tokens and the tiles in activations, and must lock at least
+    one die, including every Immediate die; unlocked dice are rolled again. Tokens are counted exactly and tokens
+    gained are either type with equal chance. Locked dice only matter through their value histogram and count.
+    Pip-ups, tiles and dice powers never turn a die to a face with a power, and tiles that act at the start of a turn,
+    claim tiles and tile copying from Decree dice are not modelled.
+
+    States are solved in groups that share the pool, tokens, tiles and prepared dice, with numpy arrays over every
+    roll of the pool and every histogram of locked dice the turn can still reach past a base, and the tables between
+    them are shared by all solvers. Asking for a state with fewer locked dice than the base, or one that can lock more
+    dice than the solver has rows for, clears the memo.
+
+    A solver holds at most budget values, or any number with None. When a state needs more, the solver leaves tiles
+    out, in the order of costly_kinds, and keeps leaving their kinds out of every later state; left_out lists them.
+
+    From the start of mid-game turns of random two-player games, a new solver takes a median of 20 ms, 90 ms at the
+    75th percentile and 300 ms at the 90th. Pools of six or more dice with several tiles take seconds, and the largest
+    leave tiles out.
+    """
+
+    def __init__(self, objective: Objective, budget: int | None = BUDGET) -> None:
+        self.objective = objective
+        self.budget = budget
+        self.left_out: list[int] = []
+        self.base: tuple[Histogram, int] | None = None
+        # The most dice and dice without a value the rows can hold past the base.
+        self.dice_bound = 0
+        self.null_bound = 0
+        # How far short of the dice bound rows go.
+        self.slack = 0
+        self.clear()
+
+    def clear(self):
+        self.size = 0
+        self.scores: dict[Rows, np.ndarray] = {}
+        self.groups: dict[GroupKey, Group] = {}
+        self.rolled: dict[tuple[PoolKey, int, int, Activations], np.ndarray] = {}
+        self.locks: dict[GroupKey, np.ndarray] = {}
+
+    def place(self, state: TurnState, pool: PoolKey) -> int:
+        """
+        The key of the state's locked dice past the base, after widening the rows to fit the state.
+        """
+        rebase = self.base is None or any(a < b for a, b in zip(state.locked, self.base[0])) or state.nulls < self.base[1]
+        if rebase:
+            self.base = (state.locked, state.nulls)
+        assert self.base is not None
+        locked = subtract(state.locked, self.base[0])
+        nulls = state.nulls-self.base[1]
+        dice = sum(locked)+nulls+sum(pool)+state.prepared+potential(pool, state.activations)
+        null_dice = nulls+null_capacity(pool)
+        if rebase:
+            self.dice_bound, self.null_bound, self.slack = dice, null_dice, 0
+            self.clear()
+        # Rows only hold the dice a turn can lock up to the slack short of the bound: what a state falls short by, and
+        # the two every Voyage die loses if it locks without adding them.
+        bound = max(dice, self.dice_bound)
+        slack = max(self.slack+bound-self.dice_bound, bound-dice+2*pool[VOYAGE])
+        if bound > self.dice_bound or null_dice > self.null_bound or slack > self.slack:
+            self.dice_bound = bound
+            self.null_bound = max(null_dice, self.null_bound)
+            self.slack = slack
+            self.clear()
+        return locked_key(locked, nulls)
+
+    def hold(self, size: int):
+        self.size += size
+        if self.budget is not None and self.size > self.budget:
+            raise BudgetException(f"Solving the state needs more than {self.budget} values.")
+
+    def fitted(self, state: TurnState, solve: Callable[[TurnState], T]) -> T:
+        """
+        Solves the state without the tiles left out, leaving more out while it does not fit the budget.
+        """
+        while True:
+            activations = list(state.activations)
+            for kind in self.left_out:
+                dropped = next((activation for activation in activations if activation[0] == kind), None)
+                if dropped is not None:
+                    activations.remove(dropped)
+            try:
+                return solve(state._replace(activations=tuple(activations)))
+            except BudgetException:
+                if not activations:
+                    raise
+                self.left_out.append(min((kind for kind, _ in activations), key=costly_kinds.index))
+                self.base = None
+                self.clear()
+
+    def rows(self, pool: PoolKey, activations: Activations, prepared: int) -> Rows:
+        return solver_rows(self.dice_bound-sum(pool)-prepared-potential(pool, activations), self.null_bound-null_capacity(pool),
+                           self.slack)
+
+    def score(self, rows: Rows) -> np.ndarray:
+        if rows not in self.scores:
+            assert self.base is not None
+            locked, nulls = self.base
+            self.scores[rows] = np.array([self.objective(tuple(a+b for a, b in zip(locked, hist)), sum(locked)+nulls+sum(hist)) for hist in rows.histograms])
+        return self.scores[rows]
+
+    def finish(self, rows: Rows, pipups: int, rerolls: int, activations: Activations) -> np.ndarray:
+        """
+        Values of turns that end with each row's locked dice. Subclasses can make them depend on the tokens and tiles
+        left over.
+        """
+        return self.score(rows)
+
+    def roll_values(self, pool: PoolKey, pipups: int, rerolls: int, activations: Activations) -> np.ndarray:
+        key = (pool, pipups, rerolls, activations)
+        values = self.rolled.get(key)
+        if values is None:
+            if any(pool):
+                group = self.group(pool, pipups, rerolls, after_roll(activations), 0)
+                values = self.post(group)[:, group.tables.roll_columns] @ group.tables.probabilities
+            else:
+                values = self.finish(self.rows(pool, activations, 0), pipups, rerolls, activations)
+            self.rolled[key] = values
+        return values
+
+    def group(self, pool: PoolKey, pipups: int, rerolls: int, activations: Activations, prepared: int) -> Group:
+        key = (pool, pipups, rerolls, activations, prepared)
+        group = self.groups.get(key)
+        if group is None:
+            tables = pool_tables(pool)
+            rows = self.rows(pool, activations, prepared)
+            self.hold(len(rows)*(len(tables.rolls)+1))
+            extended = np.full((len(rows), len(tables.rolls)+1), -np.inf)
+            values = extended[:, :-1]
+            if tables.size:
+                values[:] = self.lock_values(tables, rows, pool, pipups, rerolls, activations, prepared)
+                for candidate in self.action_values(tables, rows, pool, pipups, rerolls, activations, prepared):
+                    np.maximum(values, candidate, out=values)
+            else:
+                values[:, 0] = self.roll_values(add_dice(pool, STANDARD, prepared), pipups, rerolls, activations)
+            group = self.groups[key] = Group(tables, rows, extended)
+        return group
+
+    def lock_outcomes(self, child: PoolKey, activations: Activations) -> Iterator[tuple[PoolKey, Activations, int, bool]]:
+        """
+        What can follow a lock that leaves child to roll, for each way of using the tiles that act after a lock: the
+        pool, the tiles left, the key of the dice they lock and whether they need the lock to hold a pair.
+        """
+        yield child, activations, 0, False
+        if (HERDER, 0) in activations:
+            yield add_dice(child, STANDARD, 1), remove(activations, (HERDER, 0)), 0, True
+        if not any(child):
+            rest = activations
+            for amount in range(1, activations.count((LOCKED_WILD, 0))+1):
+                rest = remove(rest, (LOCKED_WILD, 0))
+                for buckets in itertools.combinations_with_replacement(range(6), amount):
+                    yield child, rest, sum(1 << 4*bucket for bucket in buckets), False
+
+    def lock_values(self, tables: PoolTables, rows: Rows, pool: PoolKey, pipups: int, rerolls: int, activations: Activations, prepared: int) -> np.ndarray:
+        """
+        The best lock of each roll, by row, with pip-ups spent on the dice locked.
+        """
+        best = self.pipped_locks(tables, rows, pool, pipups, rerolls, activations, prepared).copy()
+        subset_max(best, tables, tables.children)
+        return best[:, tables.roll_subs]
+
+    def best_locks(self, pool: PoolKey, pipups: int, rerolls: int, activations: Activations, prepared: int) -> np.ndarray:
+        """
+        The sub-multiset of the best lock of each roll of a group, by row, as an index into its tables' subs.
+        """
+        group = self.group(pool, pipups, rerolls, activations, prepared)
+        values = self.pipped_locks(group.tables, group.rows, pool, pipups, rerolls, activations, prepared).copy()
+        return subset_argmax(values, group.tables, group.tables.children)[:, group.tables.roll_subs]
+
+    def pipped_locks(self, tables: PoolTables, rows: Rows, pool: PoolKey, pipups: int, rerolls: int, activations: Activations, prepared: int) -> np.ndarray:
+        """
+        The value of locking each sub-multiset of the pool as it shows, or after spending pip-ups on it, by row.
+        """
+        key = (pool, pipups, rerolls, activations, prepared)
+        values = self.locks.get(key)
+        if values is None:
+            self.hold(len(rows)*(len(tables.sub_counts)+1))
+            values = np.full((len(rows), len(tables.sub_counts)+1), -np.inf)
+            for bucket, (remaining, added, run) in enumerate(tables.lock_buckets):
+                child = add_dice(remaining, STANDARD, prepared+added)
+                for after, rest, extra, pair in self.lock_outcomes(child, activations):
+                    if pair and not tables.pairs[run].any():
+                        continue
+                    chosen = tables.chosen(bucket, pair) if pair else run
+                    found = lock_index(rows, self.rows(after, rest, 0), tables, bucket, pair, extra)
+                    values[:, chosen] = np.maximum(values[:, chosen], self.roll_values(after, pipups, rerolls, rest)[found])
+            if pipups:
+                # A lock can spend pip-ups on its dice first and keep the rest.
+                spent = self.pipped_locks(tables, rows, pool, pipups-1, rerolls, activations, prepared)
+                np.maximum(values, spent[:, tables.pipped].max(axis=2), out=values)
+            self.locks[key] = values
+        return values
+
+    def action_values(self, tables: PoolTables, rows: Rows, pool: PoolKey, pipups: int, rerolls: int, activations: Activations, prepared: int) -> Iterator[np.ndarray]:
+        """
+        Values of the token uses and tile activations open after each roll, by row. A pip-up only pays off on a die that
+        is locked before the next roll, which locking already covers, or before a tile that depends on its pips.
+        """
+        if pipups and any(kind in pip_kinds for kind, _ in activations):
+            yield self.group(pool, pipups-1, rerolls, activations, prepared).extended[:, tables.pipped_rolls].max(axis=2)
+        if rerolls:
+            targets, probabilities, valid = tables.reroll_table()
+            post = self.post(self.group(pool, pipups, rerolls-1, activations, prepared))
+            values = np.einsum("rijk,ijk->rij", post[:, targets], probabilities)
+            values[:, ~valid] = -np.inf
+            yield values.max(axis=2)
+        for i, activation in enumerate(activations):
+            if activation in activations[:i] or activation[0] in lock_kinds:
+                continue
+            rest = activations[:i]+activations[i+1:]
+            if activation[0] == GRAIN_MERCHANT:
+                values = self.grain_values(tables, rows, pool, pipups, rerolls, rest, prepared)
+                subset_max(values, tables, tables.all_children)
+                yield values[:, tables.roll_subs]
+                continue
+            for transition in tables.transitions(activation):
+                values = self.transition_values(transition, rows, pipups, rerolls, rest, prepared)[:, transition.moves].max(axis=2)
+                if transition.matching >= 0:
+                    values[~self.showing(rows, transition.matching)] = -np.inf
+                yield values
+
+    def showing(self, rows: Rows, bucket: int) -> np.ndarray:
+        """
+        Which rows have a locked die of the value.
+        """
+        assert self.base is not None
+        return rows.counts[:, bucket]+self.base[0][bucket] > 0
+
+    def transition_values(self, transition: Transition, rows: Rows, pipups: int, rerolls: int, activations: Activations, prepared: int) -> np.ndarray:
+        """
+        Decision values after an activation, by row and roll of its pool, with a column of -inf for the padding.
+        """
+        tokens = pipups+rerolls if transition.tokens == HELD else transition.tokens
+        if not tokens:
+            group = self.group(transition.pool, pipups, rerolls, activations, prepared+transition.prepared)
+            return group.extended if group.rows is rows else group.extended[group.rows.find(rows.keys)]
+        values: np.ndarray | None = None
+        for gained, probability in token_outcomes(tokens):
+            group = self.group(transition.pool, pipups+gained, rerolls+tokens-gained, activations, prepared+transition.prepared)
+            # Replacing a die that could lock without a value, or a Voyage die, leaves rows for more locked dice.
+            extended = group.extended if group.rows is rows else group.extended[group.rows.find(rows.keys)]
+            values = probability*extended if values is None else values+probability*extended
+        assert values is not None
+        return values
+
+    def grain_values(self, tables: PoolTables, rows: Rows, pool: PoolKey, pipups: int, rerolls: int, activations: Activations, prepared: int) -> np.ndarray:
+        """
+        Values of keeping each sub-multiset of the dice with a Grain Merchant, rerolling the rest and gaining a token,
+        by row, with -inf for keeping every die.
+        """
+        kept, targets, probabilities, starts, _ = tables.grain_table()
+        groups = [self.group(pool, pipups+1, rerolls, activations, prepared), self.group(pool, pipups, rerolls+1, activations, prepared)]
+        gained = sum(self.post(group)[:, targets] for group in groups)*(probabilities/len(scarab_types))
+        values = np.full((len(rows), len(tables.sub_counts)+1), -np.inf)
+        values[:, kept] = np.add.reduceat(gained, starts, axis=1)
+        return values
+
+    def post(self, group: Group) -> np.ndarray:
+        """
+        The group's values with a column for each roll with dice powers pending that its tables list.
+        """
+        tables = group.tables
+        done = group.post.shape[1]-len(tables.rolls)
+        if done < len(tables.pending):
+            group.post = np.column_stack([group.post]+[self.resolve(group, roll, pending) for roll, pending in tables.pending[done:]])
+        return group.post
+
+    def resolve(self, group: Group, roll: int, pending: Dice) -> np.ndarray:
+        """
+        Values of a roll while the pending dice still have their powers to resolve, which comes before any other
+        choice. REROLL rolls any one die again, and the star faces adjust up to one die, or two for TWO_STAR.
+        """
+        if not pending:
+            return group.values[:, roll]
+        key = (roll, pending)
+        values = group.resolved.get(key)
+        if values is None:
+            for power in distinct(pending):
+                left = remove(pending, power)
+                if power & 15 == DiceFace.REROLL.value:
+                    options = list(self.power_rerolls(group, roll, pending, left))
+                else:
+                    options = [self.adjusted(group, roll, left, 2 if power & 15 == DiceFace.TWO_STAR.value else 1)]
+                for option in options:
+                    values = option if values is None else np.maximum(values, option)
+            assert values is not None
+            group.resolved[key] = values
+        return values
+
+    def power_rerolls(self, group: Group, roll: int, pending: Dice, left: Dice) -> Iterator[np.ndarray]:
+        """
+        Values of each die a REROLL power can roll again, with left still to resolve after it. A die can come up with
+        the same power again, which leaves the state as it was, so those outcomes are solved for instead of followed.
+        """
+        tables = group.tables
+        dice = tables.rolls[roll]
+        for die_code, after in self.adjustable(dice, left):
+            values: np.ndarray | float = 0.0
+            stay = 0.0
+            for new_code, probability in reroll_distributions[die_code >> 4]:
+                target, target_pending = tables.outcome(dice, die_code, new_code, after)
+                if target == roll and target_pending == pending:
+                    stay += probability
+                else:
+                    values = values+probability*self.resolve(group, target, target_pending)
+            yield np.asarray(values)/(1-stay)
+
+    def adjusted(self, group: Group, roll: int, pending: Dice, amount: int) -> np.ndarray:
+        """
+        The best value of adjusting up to amount dice of a roll to other faces, then resolving the pending dice.
+        """
+        key = (roll, pending, amount)
+        values = group.adjusted.get(key)
+        if values is None:
+            values = self.resolve(group, roll, pending)
+            if amount:
+                tables = group.tables
+                dice = tables.rolls[roll]
+                for die_code, after in self.adjustable(dice, pending):
+                    for new_code in other_faces(die_code):
+                        values = np.maximum(values, self.adjusted(group, tables.outcome(dice, die_code, new_code, after)[0], after, amount-1))
+            group.adjusted[key] = values
+        return values
+
+    @staticmethod
+    def adjustable(dice: Dice, pending: Dice) -> Iterator[tuple[Code, Dice]]:
+        """
+        Each die a power can change, either one whose power is resolved or one still pending, which it cancels, with the
+        dice left pending after it.
+        """
+        for die_code in distinct(dice):
+            if dice.count(die_code) > pending.count(die_code):
+                yield die_code, pending
+            if die_code in pending:
+                yield die_code, remove(pending, die_code)
+
+    def roll_value(self, state: TurnState) -> float:
+        """
+        Expected value of rolling the state's pool, given as type counts, and playing the rest of the turn well.
+        """
+        return self.fitted(state, self.solve_roll)
+
+    def decision_value(self, state: TurnState) -> float:
+        """
+        Expected value of a decision state, once the dice powers of its roll are resolved.
+        """
+        return self.fitted(state, self.solve_decision)
+
+    def best_choice(self, state: TurnState) -> tuple[float, Choice]:
+        """
+        The best thing to do in a decision state, with its value.
+        """
+        return self.fitted(state, self.solve_choice)
+
+    def solve_roll(self, state: TurnState) -> float:
+        pool: PoolKey = tuple(state.dice)
+        key = self.place(state, pool)
+        return float(self.roll_values(pool, state.pipups, state.rerolls, state.activations)[self.rows(pool, state.activations, 0).find(key)])
+
+    def solve_decision(self, state: TurnState) -> float:
+        dice = tuple(sorted(state.dice))
+        pool = type_counts(dice)
+        key = self.place(state, pool)
+        group = self.group(pool, state.pipups, state.rerolls, state.activations, state.prepared)
+        return float(group.values[group.rows.find(key), group.tables.roll_index[dice]])
+
+    def solve_choice(self, state: TurnState) -> tuple[float, Choice]:
+        dice = tuple(sorted(state.dice))
+        pool = type_counts(dice)
+        key = self.place(state, pool)
+        pipups, rerolls, activations, prepared = state.pipups, state.rerolls, state.activations, state.prepared
+        group = self.group(pool, pipups, rerolls, activations, prepared)
+        tables, rows = group.tables, group.rows
+        row = int(rows.find(key))
+        roll = tables.roll_index[dice]
+        # Locks come first, so ties go to the choice that spends nothing. Summed chance nodes are not exact,
+        # so values within EPSILON count as ties.
+        options: list[tuple[float, Choice]] = []
+        for lock in sub_multisets(dice):
+            if lock and all(lock.count(die_code) == dice.count(die_code) for die_code in dice if die_code in immediate_codes):
+                child = add_dice(subtract(pool, type_counts(lock)), STANDARD, prepared+2*lock.count(ADD_TWO_CODE))
+                value = max(float(self.roll_values(after, pipups, rerolls, rest)[self.rows(after, rest, 0).find(key+dice_key(lock)+extra)])
+                            for after, rest, extra, pair in self.lock_outcomes(child, activations) if not pair or has_pair(lock))
+                options.append((value, LockChoice(lock)))
+        for die_code in distinct(dice):
+            new_code = pipup_codes[die_code]
+            if pipups and new_code is not None:
+                pipped = self.group(pool, pipups-1, rerolls, activations, prepared)
+                options.append((float(pipped.values[row, tables.roll_index[replace(dice, die_code, new_code)]]), PipUpChoice(die_code)))
+            if rerolls:
+                outcomes = [(tables.column(*tables.outcome(dice, die_code, new_code, ())), probability) for new_code, probability in reroll_distributions[die_code >> 4]]
+                post = self.post(self.group(pool, pipups, rerolls-1, activations, prepared))
+                options.append((sum(probability*float(post[row, column]) for column, probability in outcomes), RerollChoice(die_code)))
+        for i, activation in enumerate(activations):
+            if activation in activations[:i] or activation[0] in lock_kinds:
+                continue
+            rest = activations[:i]+activations[i+1:]
+            if activation[0] == GRAIN_MERCHANT:
+                _, _, _, _, keeps = tables.grain_table()
+                values = self.grain_values(tables, rows, pool, pipups, rerolls, rest, prepared)[row]
+                options.extend((float(values[tables.sub_index(kept)]), ActivateChoice(activation, kept)) for kept in sub_multisets(dice) if kept in keeps)
+                continue
+            for transition in tables.transitions(activation):
+                if transition.matching >= 0 and not self.showing(rows, transition.matching)[row]:
+                    continue
+                values = self.transition_values(transition, rows, pipups, rerolls, rest, prepared)[row]
+                results = pool_tables(transition.pool).rolls
+                options.extend((float(values[target]), ActivateChoice(activation, results[target])) for target in transition.moves[roll] if target < len(results))
+        best = options[0]
+        for option in options[1:]:
+            if option[0] > best[0]+EPSILON:
+                best = option
+        return best
+
+
+def activations_of(tiles: list[Tile]) -> Activations:
+    activations: list[Activation] = []
+    for tile in tiles:
+        if tile.disabled:
+            continue
+        if tile in tile_activations:
+            activations.append(tile_activations[tile])
+        elif tile.ability.activation is add_wild_die:
+            activations.append((WILD, 0))
+        elif tile.ability.activation is add_incremental_die:
+            activations.append((INCREMENTAL, tile.value))
+    return tuple(sorted(activations))
+
+
+def turn_state(player: Player, rolled: bool | None = None) -> TurnState:
+    """
+    The solver's view of the player's turn. Once rolled, the state holds the available dice; otherwise it holds the pool to roll.
+    """
+    if rolled is None:
+        rolled = bool(player.available_dice)
+    locked = [0]*6
+    nulls = 0
+    for die in player.locked_dice:
+        bucket = code_values[code(die.dice_type, die.face)]
+        if bucket is None:
+            nulls += 1
+        else:
+            locked[bucket] += 1
+    pool = [0]*len(DiceType)
+    for die in player.prepared_dice:
+        pool[die.dice_type.value] += 1
+    if rolled:
+        dice: Dice | PoolKey = tuple(sorted(code(die.dice_type, die.face) for die in player.available_dice))
+        prepared = pool[STANDARD]
+    else:
+        dice = tuple(pool)
+        prepared = 0
+    return TurnState(dice, tuple(locked), nulls, player.pip_up_amount, player.reroll_amount, activations_of(player.tiles), prepared)
+
+
+def solve_turn(player: Player, objective: Objective, solver: TurnSolver | None = None) -> float:
+    """
+    Expected objective of the player's turn under optimal play, from their current dice.
+    """
+    solver = solver if solver is not None else TurnSolver(objective)
+    state = turn_state(player)
+    return solver.decision_value(state) if player.available_dice else solver.roll_value(state)
+
+
+def tile_objective(player: Player, game: Game, score: Callable[[Tile], float]) -> Objective:
+    """
+    Scores the locked dice by the best tile they let the player claim, using score, or 0 when none can be claimed.
+    """
+    board = game.board
+    claimable = board.claimable_by(player)
+
+    def objective(locked: Histogram, count: int):
+        candidates = claimable & board.levels_up_to(count) & board.satisfied_by(constraint_table.mask(locked))
+        return max((score(board.tiles[tile_id]) for tile_id in bit_indices(candidates)), default=0.0)
+    return objective
+
+
+def claim_probability(player: Player, game: Game, tile: Tile) -> Objective:
+    return tile_objective(player, game, lambda candidate: 1.0 if candidate == tile else 0.0)
+
+
+def expected_level(player: Player, game: Game) -> Objective:
+    return tile_objective(player, game, lambda candidate: float(candidate.level))
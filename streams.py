@@ -0,0 +1,43 @@
+import numpy as np
+from numpy.random import Generator, SeedSequence
+from typing import TypeVar
+from dice import dice_dict
+from enums import *
+
+T = TypeVar('T')
+
+# face_table[dice_type.value] holds the DiceFace values of that die type's faces, in Die.faces order.
+face_table = np.array([[face.value for face in dice_dict[dice_type].faces] for dice_type in DiceType], dtype=np.int8)
+
+
+def make_stream(seed: int | SeedSequence | None = None) -> Generator:
+    return np.random.default_rng(seed)
+
+
+def spawn_streams(seed: int | SeedSequence | None, count: int) -> list[Generator]:
+    """
+    Independent streams derived from one seed, e.g. one per game, player or worker process.
+
+    The same seed and count always give the same streams, regardless of which process creates them.
+    """
+    sequence = seed if isinstance(seed, SeedSequence) else SeedSequence(seed)
+    return [np.random.default_rng(child) for child in sequence.spawn(count)]
+
+
+def sample(rng: Generator, population: list[T], amount: int) -> list[T]:
+    return [population[i] for i in rng.choice(len(population), size=amount, replace=False)]
+
+
+def roll_pools(rng: Generator, dice_types: list[DiceType], pools: int = 1) -> np.ndarray:
+    """
+    Rolls the same pool of dice many times at once.
+
+    Returns an array of DiceFace values with one row per pool and one column per die.
+    """
+    types = np.array([dice_type.value for dice_type in dice_types], dtype=np.intp)
+    indices = rng.integers(face_table.shape[1], size=(pools, len(types)))
+    return face_table[types, indices]
+
+
+def roll_faces(rng: Generator, dice_types: list[DiceType]) -> list[DiceFace]:
+    return [DiceFace(int(face)) for face in roll_pools(rng, dice_types)[0]]
@@ -0,0 +1,105 @@
+from __future__ import annotations
+from collections.abc import Callable
+from typing import Any
+from display import BOLD, FOREGROUND, RESET
+from enums import *
+from events import *
+from player import pipup_color, reroll_color
+
+
+class TerminalLog:
+    """
+    Event subscriber that prints the game to the terminal.
+    """
+
+    def __init__(self) -> None:
+        self.handlers: dict[type, Callable[[Any], None]] = {
+            GameStarted: self.game_started,
+            GameEnded: self.game_ended,
+            TurnLimitReached: self.turn_limit_reached,
+            TurnStarted: self.turn_started,
+            TurnEnded: self.turn_ended,
+            ActionPhase: self.action_phase,
+            PowerResolved: self.power_resolved,
+            ActionFailed: self.failed,
+            LockRejected: self.failed,
+            RollFinished: self.roll_finished,
+            TileEligible: self.tile_eligible,
+            NoTileClaimed: self.no_tile_claimed,
+            TileClaimed: self.tile_claimed,
+            ClaimRejected: self.failed,
+            FinalRollOffBegan: self.final_roll_off_began,
+            ScoreSubmitted: self.score_submitted,
+        }
+
+    def __call__(self, event: object):
+        handler = self.handlers.get(type(event))
+        if handler is not None:
+            handler(event)
+
+    def game_started(self, event: GameStarted):
+        print(BOLD+"Welcome to Favor of the Pharaoh!"+RESET)
+        print("================================")
+
+    def game_ended(self, event: GameEnded):
+        if event.game.canvas is not None:
+            event.game.canvas.close()
+        print("================================")
+        print(BOLD+"Game Over!"+RESET)
+        print("================================")
+        for player in event.game.players:
+            if player.final_score == (0, 0):
+                print(f"{player} did not score.")
+                continue
+            print(f"{player} scored {player.final_score[0]} {DiceValue(player.final_score[1]).name}s.")
+        if event.game.high_scorer is not None:
+            print(f"{event.game.high_scorer} wins!")
+        else:
+            print("Nobody wins!")
+
+    def turn_limit_reached(self, event: TurnLimitReached):
+        print(f"Turn limit of {event.max_turns} reached.")
+
+    def turn_started(self, event: TurnStarted):
+        print(f"===={event.player.agent}'s {"turn" if not event.final_roll_off else "final roll"}!====")
+
+    def turn_ended(self, event: TurnEnded):
+        print(f"====End of {event.player.agent}'s turn!====")
+
+    def action_phase(self, event: ActionPhase):
+        player = event.player
+        event.game.print_game()
+        print(f"===={player.agent}'s {"turn" if not event.game.final_roll_off else "final roll"}====")
+        print(f'Rolled Dice: {player.available_dice}')
+        print(f'Locked dice: {player.locked_dice}')
+        print(
+            f'Tokens: {FOREGROUND(pipup_color)}{player.pip_up_amount} Pip-ups{RESET}, {FOREGROUND(reroll_color)}{player.reroll_amount} Rerolls{RESET}')
+        print(f"Tiles: {player.tiles}")
+
+    def power_resolved(self, event: PowerResolved):
+        print(f'Rolled Dice: {event.player.available_dice}')
+
+    def failed(self, event: ActionFailed | LockRejected | ClaimRejected):
+        print(event.reason)
+
+    def roll_finished(self, event: RollFinished):
+        print(f"{event.player.agent} finished their roll with {event.locked_dice} locked.")
+
+    def tile_eligible(self, event: TileEligible):
+        print(f"{event.player.agent}'s dice fulfill the {event.condition} condition for the {event.tile} tile.")
+
+    def no_tile_claimed(self, event: NoTileClaimed):
+        print(f"{event.player.agent} couldn't claim any tiles! They recieved {event.tokens} tokens as compensation.")
+
+    def tile_claimed(self, event: TileClaimed):
+        print(f"{event.tile} claimed by {event.player}!")
+
+    def final_roll_off_began(self, event: FinalRollOffBegan):
+        print("The Final Roll-Off has begun!")
+
+    def score_submitted(self, event: ScoreSubmitted):
+        print(f"{event.player} has submitted a score of {event.score[0]} {DiceValue(event.score[1]).name}s!")
+        if event.took_pharaoh:
+            print(f"{event.player} takes the Pharaoh!")
+        else:
+            print(f"{event.player} does not take the Pharaoh...")
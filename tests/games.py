@@ -0,0 +1,27 @@
+import unittest
+from collections.abc import Callable, Sequence
+from typing import Any
+from numpy.random import SeedSequence
+from main import Game
+from simulate import SimulationConfig, setup_simulated_game
+
+
+def new_game(players: int, seed: int, **config: Any) -> Game:
+    """
+    A game set up the way simulate sets up its games, with random agents unless config gives others.
+    """
+    return setup_simulated_game(SimulationConfig(players, **config), SeedSequence(seed))
+
+
+class GameTestCase(unittest.TestCase):
+    def for_each_setup(self, players: Sequence[int], seeds: Sequence[int], check: Callable[[SimulationConfig, SeedSequence], None], **config: Any):
+        """
+        Calls check with the config and seed sequence of each player count and seed, each in its own subtest.
+        """
+        for count in players:
+            for seed in seeds:
+                with self.subTest(players=count, seed=seed):
+                    check(SimulationConfig(count, **config), SeedSequence(seed))
+
+    def for_each_game(self, players: Sequence[int], seeds: Sequence[int], check: Callable[[Game], None], **config: Any):
+        self.for_each_setup(players, seeds, lambda config, sequence: check(setup_simulated_game(config, sequence)), **config)
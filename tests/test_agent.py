@@ -0,0 +1,33 @@
+import builtins
+import contextlib
+import io
+import unittest
+from unittest import mock
+from player import Agent, RandomAgent
+from tests.games import GameTestCase
+
+
+class AgentTest(GameTestCase):
+    def test_decisions_are_abstract(self):
+        self.assertEqual(Agent.__abstractmethods__, {"choose_dice", "choose_item", "choose_items", "choose_action"})
+        with self.assertRaises(TypeError):
+            Agent("Player 1", 1)  # type: ignore
+
+        class NoActions(Agent):
+            choose_dice = RandomAgent.choose_dice
+            choose_item = RandomAgent.choose_item
+            choose_items = RandomAgent.choose_items
+        with self.assertRaises(TypeError):
+            NoActions("Player 1", 1)  # type: ignore
+
+    def test_random_agents_play_headless(self):
+        def fail(*args: object):
+            raise AssertionError("The engine asked for input.")
+        output = io.StringIO()
+        with mock.patch.object(builtins, "input", fail), contextlib.redirect_stdout(output):
+            self.for_each_game((2, 5), range(2), lambda game: game.play_game(max_turns=200))
+        self.assertEqual(output.getvalue(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
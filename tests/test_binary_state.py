@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from binary_state import FORMAT_VERSION, StateBatch, decode, encode, load_batch, pack_batch, write_batch
+from enums import *
+from main import Game
+from player import Player
+from tests.games import GameTestCase, new_game
+from tile import tiles_by_name
+from zobrist import game_hash
+
+
+def played_states(game: Game, max_turns: int = 60):
+    """
+    The game encoded at every step change of every player as it is played, which covers states in the middle of turns.
+    """
+    states: list[tuple[bytes, int]] = []
+    set_step = Player.set_step
+
+    def record(player: Player, step: TurnStep):
+        set_step(player, step)
+        states.append((encode(game), game_hash(game)))
+    Player.set_step = record  # type: ignore
+    try:
+        game.play_game(max_turns=max_turns)
+    finally:
+        Player.set_step = set_step  # type: ignore
+    states.append((encode(game), game_hash(game)))
+    return states
+
+
+class BinaryStateTest(GameTestCase):
+    def test_round_trip(self):
+        self.for_each_game((2, 4, 6), range(2), self.check_round_trips)
+
+    def check_round_trips(self, game: Game):
+        states = played_states(game)
+        self.assertGreater(len(states), 10)
+        for data, hash in states:
+            self.assertLess(len(data), 200)
+            decoded = decode(data)
+            self.assertEqual(encode(decoded), data)
+            self.assertEqual(game_hash(decoded), hash)
+
+    def test_decoded_game_plays_on(self):
+        game = new_game(3, 5)
+        played_states(game, max_turns=20)
+        decoded = decode(encode(game), seed=1)
+        self.assertEqual(len(decoded.players), 3)
+        self.assertEqual(decoded.turns_played, game.turns_played)
+        decoded.play_game(max_turns=decoded.turns_played+20)
+        self.assertGreater(decoded.turns_played, game.turns_played)
+
+    def test_dice_left_over_between_turns_are_dropped(self):
+        game = new_game(2, 4)
+        game.play_game(max_turns=3)
+        idle = game.players[0]
+        self.assertIs(idle.step, TurnStep.NONE)
+        self.assertTrue(idle.locked_dice)
+        hash = game_hash(game)
+        decoded = decode(encode(game)).players[0]
+        self.assertEqual((decoded.available_dice, decoded.locked_dice, decoded.prepared_dice), ([], [], []))
+        # The next turn clears them, so they are not part of the position either.
+        idle.locked_dice = []
+        self.assertEqual(game_hash(game), hash)
+
+    def test_version(self):
+        data = bytearray(encode(new_game(2, 0)))
+        self.assertEqual(data[0], FORMAT_VERSION)
+        data[0] += 1
+        with self.assertRaises(Exception):
+            decode(bytes(data))
+
+    def test_batch(self):
+        states = [data for data, _ in played_states(new_game(2, 9), max_turns=30)]
+        batch = StateBatch(pack_batch(states))
+        self.assertEqual(len(batch), len(states))
+        self.assertEqual([bytes(state) for state in batch], states)
+        self.assertEqual(bytes(batch[-1]), states[-1])
+        self.assertEqual(encode(batch.game(3)), states[3])
+        with self.assertRaises(IndexError):
+            batch[len(states)]
+        with self.assertRaises(Exception):
+            StateBatch(b"XXXX"+pack_batch(states)[4:])
+
+    def test_batch_file(self):
+        states = [data for data, _ in played_states(new_game(4, 2), max_turns=30)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "states.bin")
+            write_batch(path, states)
+            batch = load_batch(path)
+            try:
+                self.assertEqual([bytes(state) for state in batch], states)
+            finally:
+                batch.release()
+
+    def test_tile_off_the_board(self):
+        game = new_game(2, 0)
+        names = {tile.name for tile in game.board.tiles}
+        game.players[0].owned_tiles.append(next(tile for name, tile in tiles_by_name.items() if name not in names).clone())
+        with self.assertRaises(Exception):
+            encode(game)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import math
+import os
+import random
+import tempfile
+import unittest
+from constraint_table import ConstraintTable, constraint_table, histogram, histogram_values, histograms, row_constraints
+from enums import *
+
+MAX_DICE = 7
+
+
+class ConstraintTableTest(unittest.TestCase):
+    def test_histograms(self):
+        for max_dice in range(MAX_DICE+1):
+            hists = list(histograms(max_dice))
+            self.assertEqual(len(hists), math.comb(max_dice+6, 6))
+            self.assertEqual(len(set(hists)), len(hists))
+            self.assertTrue(all(len(hist) == 6 and sum(hist) <= max_dice for hist in hists))
+            for hist in hists:
+                self.assertEqual(histogram(histogram_values(hist)), hist)
+
+    def test_masks_match_the_constraints(self):
+        table = ConstraintTable(row_constraints())
+        for hist in histograms(MAX_DICE):
+            values = histogram_values(hist)
+            expected = [constraint for constraint in table.constraints if constraint.function(values)]
+            self.assertEqual(table.satisfied(table.mask(hist)), expected, hist)
+
+    def test_satisfies_ignores_order_and_nulls(self):
+        rng = random.Random(0)
+        table = ConstraintTable(row_constraints())
+        for _ in range(300):
+            values = [DiceValue(rng.randint(1, 6)) for _ in range(rng.randint(0, MAX_DICE))]
+            shuffled = values+[DiceValue.NULL]*rng.randint(0, 2)
+            rng.shuffle(shuffled)
+            for constraint in table.constraints:
+                self.assertEqual(table.satisfies(shuffled, constraint), constraint.function(values), (values, constraint.name))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "table.bin")
+            constraint_table.save(path, 5)
+            table = ConstraintTable(constraint_table.constraints)
+            table.load(path)
+            self.assertEqual(table.masks, {hist: constraint_table.mask(hist) for hist in histograms(5)})
+
+            with open(path, "rb") as file:
+                data = file.read()
+            for broken in (data[:-8], data[:-3], data+bytes(8), b"XXXX"+data[4:]):
+                with open(path, "wb") as file:
+                    file.write(broken)
+                with self.assertRaises(Exception):
+                    ConstraintTable(constraint_table.constraints).load(path)
+
+            constraint_table.save(path, 2)
+            with self.assertRaises(Exception):
+                ConstraintTable(constraint_table.constraints[1:]).load(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
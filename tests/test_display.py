@@ -0,0 +1,66 @@
+import io
+import unittest
+from display import CLEAR_SCREEN, MOVE, RESET_SCROLL_REGION, RESTORE_CURSOR, SAVE_CURSOR, SCROLL_REGION, Screen, Text_Canvas
+
+
+def canvas_output(log_lines: int = 5):
+    output = io.StringIO()
+    return Text_Canvas(20, 4, output, log_lines), output
+
+
+def written(output: io.StringIO):
+    text = output.getvalue()
+    output.seek(0)
+    output.truncate()
+    return text
+
+
+class TextCanvasTest(unittest.TestCase):
+    def test_first_frame_reserves_the_log_region(self):
+        canvas, output = canvas_output()
+        canvas.draw_text(0, 0, "board", fcolor=7, bcolor=0)
+        canvas.display()
+        text = written(output)
+        self.assertTrue(text.startswith(RESET_SCROLL_REGION+CLEAR_SCREEN))
+        self.assertTrue(text.endswith(SCROLL_REGION(4, 8)+MOVE(0, 4)))
+
+    def test_later_frames_leave_the_log_alone(self):
+        canvas, output = canvas_output()
+        canvas.display()
+        written(output)
+        canvas.display()
+        self.assertEqual(written(output), SAVE_CURSOR+RESTORE_CURSOR)
+
+        canvas.clear()
+        canvas.draw_text(3, 2, "x", fcolor=1, bcolor=2)
+        canvas.display()
+        text = written(output)
+        self.assertTrue(text.startswith(SAVE_CURSOR+MOVE(3, 2)))
+        self.assertTrue(text.endswith(RESTORE_CURSOR))
+        self.assertNotIn("\n", text)
+        self.assertNotIn(CLEAR_SCREEN, text)
+
+    def test_diffs_match_the_frame(self):
+        first = Screen(10, 3)
+        second = first.copy()
+        second.set_char(2, 1, "a", 1, 2)
+        second.set_char(9, 1, "b", 1, 2)
+        self.assertIn("a", second.render(first))
+        self.assertIn("b", second.render(first))
+        self.assertEqual(first.render(first), "")
+
+    def test_invalidate_and_close(self):
+        canvas, output = canvas_output()
+        canvas.close()
+        self.assertEqual(written(output), "")
+        canvas.display()
+        canvas.invalidate()
+        written(output)
+        canvas.display()
+        self.assertIn(CLEAR_SCREEN, written(output))
+        canvas.close()
+        self.assertEqual(written(output), SAVE_CURSOR+RESET_SCROLL_REGION+RESTORE_CURSOR)
+
+
+if __name__ == "__main__":
+    unittest.main()
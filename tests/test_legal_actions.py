@@ -0,0 +1,102 @@
+import itertools
+import random
+import unittest
+from dice import Die, get_die
+from enums import *
+from legal_actions import Activate, AdjustPower, Claim, Lock, Pass, RerollPower, UseToken, legal_actions, lock_actions, power_actions, token_actions
+from main import Game
+from tests.games import new_game
+
+
+def dice(*specs: tuple[DiceType, DiceFace]):
+    return [get_die(dice_type).set_face(face) for dice_type, face in specs]
+
+
+def signature(pool: list[Die], indices: tuple[int, ...]):
+    return tuple(sorted((pool[i].dice_type.value, pool[i].face.value) for i in indices))
+
+
+def rolling_player(game: Game, pool: list[Die]):
+    player = game.players[0]
+    player.step = TurnStep.ROLLS
+    player.available_dice = pool
+    for die in pool:
+        die.power_triggered = False
+    return player
+
+
+class LegalActionsTest(unittest.TestCase):
+    def test_interchangeable_dice_are_locked_once(self):
+        pool = dice((DiceType.STANDARD, DiceFace.FOUR), (DiceType.STANDARD, DiceFace.FOUR), (DiceType.SERF, DiceFace.TWO), (DiceType.IMMEDIATE, DiceFace.THREE))
+        player = rolling_player(new_game(2, 0), pool)
+        locks = lock_actions(player)
+        self.assertEqual(len(locks), 6)
+        self.assertTrue(all(3 in lock.dice for lock in locks))
+
+    def test_locks_match_brute_force(self):
+        rng = random.Random(0)
+        game = new_game(2, 0)
+        types = [DiceType.STANDARD, DiceType.IMMEDIATE, DiceType.SERF, DiceType.NOBLE]
+        for _ in range(40):
+            pool = [get_die(rng.choice(types)) for _ in range(rng.randint(1, 6))]
+            for die in pool:
+                die.set_face(rng.choice(die.faces))
+            player = rolling_player(game, pool)
+            immediate = {i for i, die in enumerate(pool) if die.dice_type == DiceType.IMMEDIATE}
+            expected = {signature(pool, subset) for amount in range(1, len(pool)+1) for subset in itertools.combinations(range(len(pool)), amount) if immediate <= set(subset)}
+            locks = [signature(pool, lock.dice) for lock in lock_actions(player)]
+            with self.subTest(pool=pool):
+                self.assertEqual(len(locks), len(set(locks)))
+                self.assertEqual(set(locks), expected)
+
+    def test_tokens(self):
+        pool = dice((DiceType.STANDARD, DiceFace.SIX), (DiceType.STANDARD, DiceFace.TWO), (DiceType.STANDARD, DiceFace.TWO))
+        player = rolling_player(new_game(2, 0), pool)
+        player.tokens = []
+        self.assertEqual(token_actions(player), [])
+        player.tokens = [ScarabType.PIPUP, ScarabType.REROLL]
+        self.assertEqual(token_actions(player), [UseToken(ScarabType.PIPUP, 1), UseToken(ScarabType.REROLL, 0), UseToken(ScarabType.REROLL, 1)])
+
+    def test_rolled_powers_come_first(self):
+        game = new_game(2, 0)
+        pool = dice((DiceType.VOYAGE, DiceFace.REROLL), (DiceType.STANDARD, DiceFace.ONE))
+        player = rolling_player(game, pool)
+        self.assertTrue(all(not isinstance(action, RerollPower) for action in legal_actions(player, game)))
+        pool[0].power_triggered = True
+        self.assertEqual(power_actions(player), [RerollPower(0, 0), RerollPower(0, 1)])
+
+        pool = dice((DiceType.ARTISAN, DiceFace.STAR_ONE), (DiceType.SERF, DiceFace.ONE))
+        player = rolling_player(game, pool)
+        pool[0].power_triggered = True
+        actions = legal_actions(player, game)
+        self.assertTrue(all(isinstance(action, AdjustPower) for action in actions))
+        self.assertIn(AdjustPower(0, ()), actions)
+        self.assertIn(AdjustPower(0, ((1, DiceFace.THREE),)), actions)
+        self.assertEqual(len(actions), len(set(actions)))
+
+    def test_roll_step_lists_activations_and_locks(self):
+        game = new_game(3, 4)
+        player = rolling_player(game, dice((DiceType.STANDARD, DiceFace.THREE), (DiceType.STANDARD, DiceFace.FIVE)))
+        actions = legal_actions(player, game)
+        self.assertEqual(sum(isinstance(action, Lock) for action in actions), 3)
+        activated = {action.tile for action in actions if isinstance(action, Activate)}
+        self.assertTrue(activated <= set(player.get_active_tiles(game)))
+        self.assertNotIn(Pass(), actions)
+
+    def test_claims_are_mandatory(self):
+        game = new_game(2, 1)
+        player = game.players[0]
+        player.step = TurnStep.CLAIM
+        player.available_dice = []
+        player.locked_dice = dice(*[(DiceType.STANDARD, DiceFace.SIX)]*7)
+        claimable = [Claim(tile) for tile, _ in player.claimable_tiles(game, player.locked_dice)]
+        self.assertGreater(len(claimable), 0)
+        self.assertEqual(legal_actions(player, game), claimable)
+        self.assertIn(Pass(), legal_actions(player, game, claimed=True))
+
+        player.locked_dice = []
+        self.assertIn(Pass(), legal_actions(player, game))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+import numpy as np
+from enums import *
+from lockstep import (AVAILABLE, HERDER, LOCKED, SLOTS, LockstepGames, catalog, catalog_ids, catalog_played, face_lists, of_a_kind_bot,
+                      reroll_faces, simulate_lockstep)
+from solver import ENTERTAINER, HEAD_SERVANT, HEIR, MASTER_ARTISAN, MATCHMAKER, PRIEST, PRIESTESS, ROYAL_ASTROLOGER, SERVANT
+from streams import make_stream
+from tile import tiles
+
+
+def lineup(*names: str):
+    """
+    A full lineup of played tiles, with the named tiles in place of the first ones of their level and type.
+    """
+    chosen: list[str] = []
+    for level in range(3, 8):
+        for tile_type, amount in ((TileType.YELLOW, 2 if level < 7 else 1), (TileType.BLUE, 1), (TileType.RED, 1)):
+            category = [tile.name for tile in tiles if tile.level == level and tile.type is tile_type and catalog_played[catalog_ids[tile.name]]]
+            named = [name for name in names if name in category]
+            chosen += (named+[name for name in category if name not in named])[:amount]
+    return chosen
+
+
+def new_games(*names: str, games: int = 1, players: int = 2):
+    return LockstepGames(games, [of_a_kind_bot()]*players, make_stream(0), tile_names=lineup(*names))
+
+
+def set_dice(games: LockstepGames, dice: list[tuple[DiceType, DiceFace, int]]):
+    """
+    Puts the dice, as type, face and zone, into the first game's first slots and empties the rest.
+    """
+    games.zones[0] = 0
+    for slot, (dice_type, face, zone) in enumerate(dice):
+        games.dice_types[0, slot] = dice_type.value
+        games.faces[0, slot] = face_lists[dice_type.value].index(face)
+        games.zones[0, slot] = zone
+
+
+def shown(games: LockstepGames, count: int):
+    return [face_lists[int(games.dice_types[0, slot])][int(games.faces[0, slot])] for slot in range(count)]
+
+
+class LockstepTest(unittest.TestCase):
+    def test_lineups_only_hold_played_tiles(self):
+        games = LockstepGames(200, [of_a_kind_bot()]*2, make_stream(1))
+        self.assertTrue(catalog_played[games.tiles].all())
+        self.assertTrue((games.tiles[:, -1] == HERDER).all())
+        # The Queen and the Herder are on every board.
+        self.assertEqual(len(lineup()), SLOTS-2)
+        for name in ("SOOTHSAYER", "SURVEYOR", "GRAIN MERCHANT", "ROYAL MOTHER", "BAD OMEN", "TREASURE", "QUEEN'S FAVOR"):
+            with self.subTest(tile=name), self.assertRaises(Exception):
+                LockstepGames(1, [of_a_kind_bot()]*2, make_stream(0), tile_names=lineup()+[name])
+        # Every level and type has enough played tiles for a random lineup.
+        self.assertEqual({catalog[tile_id].name for tile_id in games.tiles.ravel()} - {"QUEEN", "HERDER"},
+                         {tile.name for tile in tiles if catalog_played[catalog_ids[tile.name]]})
+
+    def test_adjusting_tiles_turn_dice_to_the_aim(self):
+        dice = [(DiceType.STANDARD, DiceFace.FOUR, AVAILABLE), (DiceType.STANDARD, DiceFace.THREE, AVAILABLE),
+                (DiceType.STANDARD, DiceFace.TWO, AVAILABLE), (DiceType.IMMEDIATE, DiceFace.ONE, AVAILABLE),
+                (DiceType.STANDARD, DiceFace.FIVE, LOCKED)]
+        expected = {
+            PRIEST: [True, False, False, False],
+            PRIESTESS: [False, True, False, False],
+            HEIR: [True, True, False, False],
+            SERVANT: [True, True, True, False],
+            ENTERTAINER: [False, False, True, False],
+            MASTER_ARTISAN: [True, True, True, True],
+            HEAD_SERVANT: [False, False, False, True],
+            ROYAL_ASTROLOGER: [False, False, False, True],
+            MATCHMAKER: [True, True, True, True],
+        }
+        games = new_games()
+        set_dice(games, dice)
+        aim = games.aim(np.array([0]))
+        self.assertEqual(aim.tolist(), [5])
+        for kind, movable in expected.items():
+            with self.subTest(kind=kind):
+                new, can_move = games.adjusted_faces(kind, np.array([0]), aim)
+                self.assertEqual(can_move[0, :4].tolist(), movable)
+                for slot in np.nonzero(can_move[0])[0]:
+                    self.assertIs(face_lists[int(games.dice_types[0, slot])][int(new[0, slot])], DiceFace.FIVE)
+        # Without a locked die showing the aim, there is nothing to match.
+        set_dice(games, dice[:4])
+        self.assertFalse(games.adjusted_faces(MATCHMAKER, np.array([0]), np.array([4]))[1].any())
+
+    def test_adjusting_tiles_are_used_once_per_turn(self):
+        games = new_games("PRIEST", "SERVANT")
+        board = games.tiles[:1]
+        ready = np.isin(board, [catalog_ids["PRIEST"], catalog_ids["SERVANT"]])
+        set_dice(games, [(DiceType.STANDARD, DiceFace.FIVE, AVAILABLE), (DiceType.STANDARD, DiceFace.FIVE, LOCKED),
+                         (DiceType.STANDARD, DiceFace.FOUR, AVAILABLE), (DiceType.STANDARD, DiceFace.TWO, AVAILABLE),
+                         (DiceType.STANDARD, DiceFace.ONE, AVAILABLE)])
+        rolled = np.zeros((1, games.zones.shape[1]), dtype=bool)
+        games.act(np.array([0]), np.array([0]), ready, board, rolled, 2)
+        self.assertEqual(shown(games, 5), [DiceFace.FIVE, DiceFace.FIVE, DiceFace.FIVE, DiceFace.FIVE, DiceFace.ONE])
+        self.assertFalse(ready.any())
+        self.assertFalse(games.spent.any())
+
+    def test_powers(self):
+        games = new_games(games=50)
+        games.zones[:] = 0
+        games.dice_types[:, :4] = DiceType.VOYAGE.value
+        games.zones[:, :4] = 1
+        rolled = games.roll(np.arange(50))
+        games.resolve_powers(np.arange(50), rolled)
+        self.assertFalse(reroll_faces[games.dice_types, games.faces][:, :4].any())
+
+        set_dice(games, [(DiceType.INTRIGUE, DiceFace.TWO_STAR, AVAILABLE), (DiceType.STANDARD, DiceFace.SIX, LOCKED),
+                         (DiceType.STANDARD, DiceFace.ONE, AVAILABLE), (DiceType.STANDARD, DiceFace.TWO, AVAILABLE),
+                         (DiceType.STANDARD, DiceFace.THREE, AVAILABLE)])
+        rolled = np.zeros((1, games.zones.shape[1]), dtype=bool)
+        rolled[0, 0] = True
+        games.resolve_powers(np.array([0]), rolled)
+        # The Intrigue die has no six, so the two adjusted dice are the next ones.
+        self.assertEqual(shown(games, 5), [DiceFace.TWO_STAR, DiceFace.SIX, DiceFace.SIX, DiceFace.SIX, DiceFace.THREE])
+
+    def test_claims_that_give_another_turn(self):
+        for name, roll_off, extra in (("GOOD OMEN", False, [0, 0]), ("OMEN", False, [-1, 0]), ("ROYAL DEATH", True, [1, 2])):
+            with self.subTest(tile=name):
+                games = new_games(name)
+                slot = int(np.nonzero(games.tiles[0] == catalog_ids[name])[0][0])
+                games.claim_tables[0, catalog_ids[name]] = 1000
+                games.conditions[0, slot] = 0
+                games.next_player[0] = 1
+                # Enough locked sixes for any level.
+                set_dice(games, [(DiceType.STANDARD, DiceFace.SIX, LOCKED)]*7)
+                games.claim(np.array([0]), np.array([0]))
+                self.assertTrue(games.owned[0, 0, slot])
+                self.assertEqual(games.next_player[0], 0)
+                self.assertEqual(games.final_roll_off[0], roll_off)
+                self.assertEqual(games.extra_dice[0, 0, [DiceType.STANDARD.value, DiceType.IMMEDIATE.value]].tolist(), extra)
+                self.assertEqual(games.extra_dice[0, 1, DiceType.STANDARD.value], int(roll_off))
+
+    def test_pharaohs_gift_redoes_a_losing_roll_off(self):
+        games = new_games("PHARAOH'S GIFT")
+        board = games.tiles[:1]
+        slot = int(np.nonzero(board[0] == catalog_ids["PHARAOH'S GIFT"])[0][0])
+        games.owned[0, 0, slot] = True
+        # A tie does not beat the high score, so the first turn is redone.
+        games.high_score[0] = 3*8+5
+        for face, redone in ((DiceFace.FIVE, True), (DiceFace.SIX, False)):
+            set_dice(games, [(DiceType.STANDARD, face, LOCKED)]*3)
+            games.next_player[0] = 1
+            games.end_roll_off_turns(np.array([0]), np.array([0]), games.owned[:1, 0] & ~games.spent[:1, 0], board)
+            self.assertEqual(games.finished[0, 0], not redone)
+            self.assertEqual(games.next_player[0], 0 if redone else 1)
+        self.assertTrue(games.spent[0, 0, slot])
+        self.assertEqual((games.final_scores[0, 0], games.high_score[0], games.high_scorer[0]), (3*8+6, 3*8+6, 0))
+
+    def test_games_finish(self):
+        result = simulate_lockstep(300, [of_a_kind_bot()]*3, seed=2, batch_size=128)
+        self.assertEqual(result.games, 300)
+        self.assertEqual(result.unfinished, 0)
+        self.assertEqual(sum(result.wins)+result.no_winner, 300)
+        self.assertTrue(set(result.tile_claims) <= {tile.name for tile in catalog if catalog_played[catalog_ids[tile.name]]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import pickle
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from main import Game
+from mcts import OVERHEAD, ChoiceAgent, MCTSAgent, Search, evaluate
+from player import Player, RandomAgent
+from tests.games import GameTestCase, new_game
+
+
+class TimedAgent(MCTSAgent):
+    """
+    Records how long each search takes and how many candidates it had.
+    """
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        super().__init__(*args, **kwargs)  # type: ignore
+        self.searches: list[tuple[float, int, int]] = []
+
+    def search(self, player: Player, game: Game, amount: int) -> int:
+        start = time.time()
+        choice = super().search(player, game, amount)
+        self.searches.append((time.time()-start, amount, choice))
+        return choice
+
+
+def searching_agent(game: Game) -> TimedAgent:
+    agent = game.players[0].agent
+    assert isinstance(agent, TimedAgent)
+    return agent
+
+
+class MCTSTest(GameTestCase):
+    def test_pick_is_abstract(self):
+        self.assertEqual(ChoiceAgent.__abstractmethods__, {"pick"})
+        with self.assertRaises(TypeError):
+            ChoiceAgent("Player 1", 1)  # type: ignore
+
+    def test_searches_keep_to_the_time_budget(self):
+        budget = 0.05
+        game = new_game(2, 4, agents=[partial(TimedAgent, time_budget=budget), RandomAgent])
+        game.play_game(max_turns=4)
+        searches = searching_agent(game).searches
+        self.assertTrue(searches)
+        for seconds, amount, choice in searches:
+            self.assertGreater(amount, 1)
+            self.assertIn(choice, range(amount))
+            # A search runs to its deadline and lets the rollout under way finish its turn.
+            self.assertGreaterEqual(seconds, budget-OVERHEAD)
+            self.assertLess(seconds, budget+0.1)
+
+    def test_search_visits_every_root_choice(self):
+        game = new_game(3, 2)
+        game.play_game(max_turns=3)
+        player = game.players[game.turns_played % len(game.players)]
+        for other in game.players:
+            other.agent = None  # type: ignore
+        payload = pickle.dumps((game, game.snapshot(), game.players.index(player)))
+        results = Search(payload, (), 7).run(time.time()+0.2)
+        self.assertTrue(results)
+        for visits, total in results.values():
+            self.assertGreaterEqual(visits, 1)
+            self.assertTrue(0.0 <= total <= visits)
+
+    def test_root_parallel_search_leaves_the_callers_executor_open(self):
+        with ThreadPoolExecutor(2) as executor:
+            game = new_game(2, 5, agents=[partial(TimedAgent, time_budget=0.03, workers=2, executor=executor), RandomAgent])
+            game.play_game(max_turns=2)
+            agent = searching_agent(game)
+            agent.close()
+            self.assertIs(agent.executor, executor)
+            self.assertTrue(agent.searches)
+            self.assertEqual(executor.submit(lambda: 1).result(), 1)
+            self.assertIsNone(pickle.loads(pickle.dumps(agent)).executor)
+
+    def test_evaluate(self):
+        game = new_game(2, 0)
+        self.assertEqual(evaluate(game, game.players[0]), 0.5)
+        game.play_game()
+        self.assertEqual({evaluate(game, player) for player in game.players}, {0.0, 1.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import tempfile
+import unittest
+from constraint_table import constraint_table
+from enums import *
+from policy_table import PolicyTable, every_pool, parse_pool
+from solver import ADD_TWO_CODE, STANDARD, Dice, PoolKey, TurnSolver, TurnState, add_dice, code_values, pool_tables, subtract, type_counts
+
+POOLS = [parse_pool("STANDARD=4"), parse_pool("STANDARD=1,IMMEDIATE=1,NOBLE=1"), parse_pool("VOYAGE=1,ARTISAN=1")]
+CONSTRAINTS = [constraint_table.constraints[i] for i in (1, 2, 3, 10)]
+
+
+def condition_solver(bit: int):
+    return TurnSolver(lambda locked, count: float(bool(constraint_table.mask(locked) & bit)))
+
+
+def lock_state(pool: PoolKey, locked: tuple[int, ...], nulls: int, lock: Dice):
+    """
+    The state to roll after locking the dice, with the Standard dice locked Voyage dice add.
+    """
+    new_locked = list(locked)
+    for die_code in lock:
+        if (bucket := code_values[die_code]) is not None:
+            new_locked[bucket] += 1
+    child = add_dice(subtract(pool, type_counts(lock)), STANDARD, 2*lock.count(ADD_TWO_CODE))
+    return TurnState(child, tuple(new_locked), nulls+sum(code_values[die_code] is None for die_code in lock), 0, 0, ())
+
+
+class PolicyTableTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.table = PolicyTable(CONSTRAINTS)
+        cls.table.build(POOLS)
+
+    def assert_matches_solver(self, table: PolicyTable, seed: int):
+        rng = random.Random(seed)
+        for constraint in CONSTRAINTS:
+            solver = condition_solver(constraint_table.bits[constraint])
+            for pool in POOLS*5:
+                locked, nulls = (0,)*6, 0
+                while any(pool):
+                    dice = rng.choice(pool_tables(pool).rolls)
+                    slot = table.slot(dice, locked, nulls)
+                    assert slot is not None
+                    lock = tuple(die_code for i, die_code in enumerate(dice) if table.lock(slot, constraint) >> i & 1)
+                    with self.subTest(constraint=constraint.name, dice=dice, locked=locked, nulls=nulls):
+                        value = solver.decision_value(TurnState(dice, locked, nulls, 0, 0, ()))
+                        self.assertAlmostEqual(table.probability(slot, constraint), value, places=5)
+                        self.assertAlmostEqual(solver.roll_value(lock_state(pool, locked, nulls, lock)), value, places=9)
+                    state = lock_state(pool, locked, nulls, lock)
+                    pool, locked, nulls = tuple(state.dice), state.locked, state.nulls
+
+    def test_lookups_match_the_solver(self):
+        self.assert_matches_solver(self.table, 1)
+
+    def test_saved_table_matches_the_solver(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "policy.bin")
+            self.table.save(path)
+            loaded = PolicyTable(CONSTRAINTS)
+            loaded.load(path)
+            self.assertEqual(len(loaded), len(self.table))
+            self.assert_matches_solver(loaded, 2)
+
+    def test_pools(self):
+        self.assertEqual(parse_pool("STANDARD=5, immediate=1"), (5, 1)+(0,)*(len(DiceType)-2))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_pool("STANDARD")
+        pools = every_pool(3)
+        self.assertIn(parse_pool("SERF=1,NOBLE=1,DECREE=1"), pools)
+        self.assertIn(parse_pool("VOYAGE=1"), pools)
+        self.assertNotIn(parse_pool("VOYAGE=1,STANDARD=1"), pools)
+        self.assertEqual(len(pools), 120)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import itertools
+import random
+import unittest
+from collections import Counter
+from fractions import Fraction
+from constraint_table import constraint_table, histogram, histogram_values
+from dice import dice_dict
+from enums import *
+from probability import PoolProbabilities
+
+
+def brute_force(dice_types: list[DiceType]):
+    """
+    The histogram of every combination of faces the pool can roll, each counted once.
+    """
+    return Counter(histogram(list(values)) for values in itertools.product(*(dice_dict[dice_type].values for dice_type in dice_types)))
+
+
+class ProbabilityTest(unittest.TestCase):
+    def test_distributions_match_brute_force(self):
+        rng = random.Random(1)
+        probabilities = PoolProbabilities()
+        pools = [[dice_type] for dice_type in DiceType]+[[rng.choice(list(DiceType)) for _ in range(rng.randint(2, 4))] for _ in range(25)]
+        for dice_types in pools:
+            with self.subTest(dice_types=dice_types):
+                expected = brute_force(dice_types)
+                total = sum(expected.values())
+                self.assertEqual(probabilities.histogram_probabilities(dice_types), {hist: Fraction(count, total) for hist, count in expected.items()})
+                conditions = probabilities.condition_probabilities(dice_types)
+                for constraint in constraint_table.constraints:
+                    satisfied = sum(count for hist, count in expected.items() if constraint.function(histogram_values(hist)))
+                    self.assertEqual(conditions[constraint], Fraction(satisfied, total), constraint.name)
+                    self.assertEqual(probabilities.probability(dice_types, constraint), conditions[constraint])
+
+    def test_order_does_not_matter(self):
+        probabilities = PoolProbabilities()
+        pool = [DiceType.STANDARD, DiceType.SERF, DiceType.NOBLE, DiceType.STANDARD, DiceType.VOYAGE]
+        first = probabilities.histogram_probabilities(pool)
+        self.assertEqual(PoolProbabilities().histogram_probabilities(pool[::-1]), first)
+        self.assertEqual(sum(first.values()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
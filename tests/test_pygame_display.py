@@ -0,0 +1,57 @@
+import os
+import unittest
+
+# Draw to an off-screen surface, so the test runs without a window.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+from pygame_display import PygameDisplay, SlotContents
+from tests.games import new_game
+
+
+class PygameDisplayTest(unittest.TestCase):
+    def tearDown(self):
+        pygame.quit()
+
+    def pixels(self, display: PygameDisplay):
+        return pygame.image.tobytes(display.screen, "RGB")
+
+    def test_redraw_matches_full_draw(self):
+        game = new_game(4, 2)
+        display = PygameDisplay(game)
+        display.draw_board(full=True)
+        redrawn = 0
+        for _ in range(60):
+            if game.game_ended:
+                break
+            game.play_turn()
+            drawn = dict(display.drawn)
+            display.draw_board()
+            redrawn += display.drawn != drawn
+            incremental = self.pixels(display)
+            display.draw_board(full=True)
+            self.assertEqual(incremental, self.pixels(display), game.turns_played)
+        self.assertGreater(redrawn, 0)
+
+    def test_unchanged_board_draws_nothing(self):
+        game = new_game(2, 0)
+        display = PygameDisplay(game)
+        display.draw_board(full=True)
+        cached = len(display.tile_cache)
+        slots: list[tuple[int, int]] = []
+        draw_slot = display.draw_slot
+
+        def counting_draw_slot(x: int, y: int, contents: SlotContents):
+            slots.append((x, y))
+            return draw_slot(x, y, contents)
+        display.draw_slot = counting_draw_slot  # type: ignore
+        display.draw_board()
+        self.assertEqual(slots, [])
+        display.draw_board(full=True)
+        self.assertEqual(len(slots), len(display.board_slots()))
+        self.assertEqual(len(display.tile_cache), cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
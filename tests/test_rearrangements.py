@@ -0,0 +1,58 @@
+import itertools
+import random
+import unittest
+from dice import Die, get_die
+from enums import *
+from player import count_rearrangements, rearrangement_options
+
+# Every type with numeric faces. Voyage dice have none.
+NUMERIC_TYPES = [dice_type for dice_type in DiceType if dice_type != DiceType.VOYAGE]
+
+
+def brute_force_options(dice: list[Die], target_sum: int) -> list[tuple[DiceFace, ...]]:
+    """
+    The implementation the dynamic program replaced: every combination of faces, filtered by total and deduplicated
+    by the multiset of (dice type, face) in the order itertools.product reaches them.
+    """
+    def value(face: DiceFace):
+        return 1 if face == DiceFace.STAR_ONE else face.value
+
+    options = [[face for face in die.faces if face.value in range(1, 7) or face == DiceFace.STAR_ONE] for die in dice]
+    seen: set[tuple[tuple[int, str], ...]] = set()
+    found: list[tuple[DiceFace, ...]] = []
+    for combo in itertools.product(*options):
+        if sum(value(face) for face in combo) == target_sum:
+            signature = tuple(sorted((die.dice_type.value, face.name) for die, face in zip(dice, combo)))
+            if signature not in seen:
+                seen.add(signature)
+                found.append(combo)
+    return found
+
+
+class RearrangementTest(unittest.TestCase):
+    def check(self, dice: list[Die]):
+        for target_sum in range(len(dice)-1, 6*len(dice)+2):
+            expected = brute_force_options(dice, target_sum)
+            self.assertEqual(rearrangement_options(dice, target_sum), expected, (dice, target_sum))
+            self.assertEqual(count_rearrangements(dice, target_sum), len(expected), (dice, target_sum))
+
+    def test_single_types(self):
+        for dice_type in NUMERIC_TYPES:
+            for count in range(1, 4):
+                with self.subTest(dice_type=dice_type, count=count):
+                    self.check([get_die(dice_type) for _ in range(count)])
+
+    def test_random_mixes(self):
+        rng = random.Random(0)
+        for _ in range(40):
+            dice = [get_die(rng.choice(NUMERIC_TYPES)) for _ in range(rng.randint(1, 4))]
+            with self.subTest(dice=dice):
+                self.check(dice)
+
+    def test_no_numeric_faces(self):
+        with self.assertRaises(ValueError):
+            rearrangement_options([get_die(DiceType.STANDARD), get_die(DiceType.VOYAGE)], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
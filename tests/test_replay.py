@@ -0,0 +1,84 @@
+import os
+import random
+import tempfile
+import unittest
+from numpy.random import SeedSequence
+from binary_state import encode
+from enums import *
+from replay import LOG_VERSION, Replayer, decode_log, encode_log, read_log, record_game, write_log
+from simulate import SimulationConfig, batch_seed
+from tests.games import GameTestCase
+from tile import herder, queen
+
+
+class ReplayTest(GameTestCase):
+    def test_log_round_trip(self):
+        game, _ = record_game(SimulationConfig(3, max_turns=60), SeedSequence(4))
+        lineup = tuple(tile.name for tile in game.board.tiles if tile not in (queen, herder))
+        configs = [SimulationConfig(3, max_turns=60),
+                   SimulationConfig(2, modes=[RowMode.B, RowMode.A, RowMode.B, RowMode.B, RowMode.A], tile_names=list(lineup), max_turns=40)]
+        for config in configs:
+            _, log = record_game(config, batch_seed(12345678901234567890, 3).spawn(2)[1])
+            data = encode_log(log)
+            decoded = decode_log(data)
+            self.assertEqual(decoded, log)
+            self.assertEqual(encode_log(decoded), data)
+
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "game.log")
+                write_log(path, log)
+                self.assertEqual(read_log(path), log)
+
+            data = bytearray(data)
+            data[4] = LOG_VERSION+1
+            with self.assertRaises(Exception):
+                decode_log(bytes(data))
+
+    def test_replay_reproduces_the_game(self):
+        self.for_each_setup((2, 4), range(2), self.check_replay, max_turns=80)
+
+    def check_replay(self, config: SimulationConfig, sequence: SeedSequence):
+        game, log = record_game(config, sequence)
+        replayer = Replayer(decode_log(encode_log(log)), keyframe_interval=7)
+        states = [encode(replayer.game)]
+        while replayer.step():
+            states.append(encode(replayer.game))
+        self.assertEqual(len(states), log.turns+1)
+        self.assertEqual(states[-1], encode(game))
+        self.assertEqual(replayer.reader.position, len(log.decisions))
+
+        # Seeking goes back to keyframes and forward from wherever the game is.
+        for turn in random.Random(log.entropy).choices(range(log.turns+1), k=12)+[0, log.turns]:
+            self.assertEqual(encode(replayer.seek(turn)), states[turn], turn)
+
+    def test_loaded_log_seeks_from_its_keyframes(self):
+        game, log = record_game(SimulationConfig(4, max_turns=120), SeedSequence(6), keyframe_interval=10)
+        self.assertEqual(len(log.keyframes), (log.turns+9)//10)
+        replayer = Replayer(log)
+        states = [encode(replayer.game)]
+        while replayer.step():
+            states.append(encode(replayer.game))
+
+        for turn in (13, log.turns//2, log.turns-1, log.turns):
+            with self.subTest(turn=turn):
+                replayer = Replayer(decode_log(encode_log(log)))
+                self.assertEqual(encode(replayer.seek(turn)), states[turn])
+                # Only the stored keyframe before the turn was restored, rather than the game played from the start.
+                self.assertEqual(list(replayer.keyframes), [min(turn, log.turns-1)//10*10])
+                # Generators and tile orders come back too, so the rest of the game plays out as it was recorded.
+                while replayer.step():
+                    pass
+                self.assertEqual(encode(replayer.game), encode(game))
+                self.assertEqual(replayer.reader.position, len(log.decisions))
+
+    def test_index(self):
+        game, log = record_game(SimulationConfig(2, max_turns=50), SeedSequence(8))
+        replayer = Replayer(log, keyframe_interval=10)
+        self.assertEqual(encode(replayer.index()), encode(game))
+        self.assertEqual(sorted(replayer.keyframes), list(range(0, log.turns, 10)))
+        with self.assertRaises(Exception):
+            replayer.seek(log.turns+1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from main import Game
+from player import Player, RandomAgent
+from results_store import RUN_FILE, ResultsStore, ResultsWriter, chunk_name, read_run, run_id
+from simulate import AgentFactory, SimulationConfig, SimulationResult, describe_run, run_batch
+from tile import tile_ids
+
+
+def by_name(counts: np.ndarray):
+    return {name: int(counts[tile_id]) for name, tile_id in tile_ids.items() if counts[tile_id]}
+
+
+class FailingAgent(RandomAgent):
+    """
+    Gives up at the start of a few turns, so some games of a batch fail partway through.
+    """
+
+    def start_turn(self, player: Player, game: Game):
+        if self.rng.random() < 0.004:
+            raise Exception("Gave up.")
+        super().start_turn(player, game)
+
+
+class ResultsStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def run_batches(self, config: SimulationConfig, seed: int, batches: int, batch_size: int):
+        result = SimulationResult(config.players)
+        for batch in range(batches):
+            result.merge(run_batch(config, seed, batch, batch_size, store=self.path, batch_size=batch_size)[1])
+        return result
+
+    def test_store_matches_result(self):
+        config = SimulationConfig(3, max_turns=200)
+        result = self.run_batches(config, 5, 2, 6)
+        run = describe_run(config, 5, 6)
+        self.assertEqual(sorted(os.listdir(self.path)), [chunk_name(run, 0), chunk_name(run, 1)])
+        self.assertEqual(read_run(os.path.join(self.path, chunk_name(run, 1))), run)
+
+        store = ResultsStore(self.path)
+        self.assertEqual(store.runs(), {run_id(run): run})
+        self.assertEqual(store.rows("games"), result.games)
+        self.assertEqual(store.rows("turns"), result.total_turns)
+        wins, no_winner, unfinished = store.win_counts(3)
+        self.assertEqual((wins.tolist(), no_winner, unfinished), (result.wins, result.no_winner, result.unfinished))
+        claims, offered = store.tile_claims()
+        self.assertEqual(by_name(offered), result.tile_offered)
+        self.assertEqual(by_name(claims), result.tile_claims)
+        self.assertIn(f"games: {result.games}", store.summary())
+
+    def test_runs_share_a_store(self):
+        first = self.run_batches(SimulationConfig(2, max_turns=100), 1, 1, 4)
+        second = self.run_batches(SimulationConfig(2, max_turns=100), 2, 2, 3)
+        runs = ResultsStore(self.path).runs()
+        self.assertEqual(len(runs), 2)
+        games = {runs[run]["seed"]: ResultsStore(self.path, run).rows("games") for run in runs}  # type: ignore
+        self.assertEqual(games, {1: first.games, 2: second.games})
+        self.assertEqual(ResultsStore(self.path).rows("games"), first.games+second.games)
+
+    def test_rewriting_a_batch(self):
+        config = SimulationConfig(2, max_turns=100)
+        self.run_batches(config, 3, 1, 4)
+        self.run_batches(config, 3, 1, 4)
+        self.assertEqual(ResultsStore(self.path).rows("games"), 4)
+
+        # A chunk of the same name from another run is never replaced.
+        run = describe_run(config, 3, 4)
+        with open(os.path.join(self.path, chunk_name(run, 0), RUN_FILE), "w") as file:
+            json.dump(describe_run(config, 4, 4), file)
+        with self.assertRaises(Exception):
+            ResultsWriter(self.path, run, 0).close()
+
+    def test_failed_games(self):
+        agents: list[AgentFactory] = [FailingAgent]*2
+        config = SimulationConfig(2, agents, max_turns=100)
+        _, result, _ = run_batch(config, 0, 0, 12, store=self.path)
+        self.assertGreater(len(result.failed), 0)
+        self.assertGreater(result.games, 0)
+        self.assertEqual(result.games+len(result.failed), 12)
+
+        store = ResultsStore(self.path)
+        (games,), = store.scan("games", "index")
+        (turns,), = store.scan("turns", "index")
+        failed = {int(key.rsplit("/", 1)[1]) for key in result.failed}
+        self.assertEqual(set(games.tolist()), set(range(12))-failed)
+        self.assertTrue(set(turns.tolist()) <= set(games.tolist()))
+        self.assertEqual(len(turns), result.total_turns)
+        # Failed games leave gaps in the indices, which claims still have to be matched to their game's tiles across.
+        self.assertEqual(by_name(store.tile_claims()[0]), result.tile_claims)
+
+    def test_discard(self):
+        writer = ResultsWriter(self.path, {"seed": 0}, 0)
+        for index in (0, 0, 1, 1, 1):
+            writer.add("turns", batch=0, index=index, turn=0, seat=0, claimed=0, pip_ups=0, rerolls=0, locked=0, roll_off=False)
+        writer.discard(1)
+        self.assertEqual(writer.rows["turns"]["index"], [0, 0])
+        self.assertEqual(writer.rows["games"]["index"], [])
+        writer.close()
+        (index,), = ResultsStore(self.path).scan("turns", "index")
+        np.testing.assert_array_equal(index, [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from enums import *
+from main import Game
+from player import Player, RandomAgent
+from rolloff import RollOffCalculator, roll_off_score
+from solver import PoolKey
+from streams import make_stream
+from tile import palace_key, start, tile_named
+import tests.test_solver as solver_tests
+
+
+def roll_off_game(tile_names: list[str], high_score: tuple[int, int], tokens: list[ScarabType] | None = None):
+    """
+    A two-player game in its final roll-off, where the first player, holding the named tiles, is still to roll.
+    """
+    players = [Player([start.clone()]+([tile_named(name) for name in tile_names] if seat == 0 else []),
+                      RandomAgent(f"Player {seat+1}", seat+1, make_stream(seat)), rng=make_stream(10+seat)) for seat in range(2)]
+    game = Game(players, rng=make_stream(5))
+    game.begin_final_roll_off()
+    game.high_score = high_score
+    players[0].tokens = tokens or []
+    return game, players[0]
+
+
+def brute_force(pool: PoolKey, high_score: tuple[int, int], pipups: int = 0, rerolls: int = 0, previous: tuple[int, int] = (0, 0)):
+    player = solver_tests.BruteForce(lambda locked, count: float(roll_off_score(locked, previous) > high_score))
+    return player.roll(tuple(dice_type for dice_type, amount in enumerate(pool) for _ in range(amount)), (), pipups, rerolls, ())
+
+
+class RollOffTest(unittest.TestCase):
+    def test_score(self):
+        self.assertEqual(roll_off_score((0, 2, 0, 0, 0, 2), (0, 0)), (2, 6))
+        self.assertEqual(roll_off_score((0, 0, 0, 0, 0, 0), (1, 4)), (1, 4))
+        self.assertEqual(roll_off_score((3, 0, 0, 0, 0, 0), (2, 6)), (3, 1))
+
+    def test_plans_match_brute_force(self):
+        setups: list[tuple[list[str], tuple[int, int], list[ScarabType]]] = [
+            ([], (3, 6), []),
+            ([], (2, 5), [ScarabType.PIPUP, ScarabType.REROLL]),
+        ]
+        for tile_names, high_score, tokens in setups:
+            game, player = roll_off_game(tile_names, high_score, tokens)
+            calculator = RollOffCalculator(player, game)
+            pool, _ = calculator.pool(frozenset(), True)
+            with self.subTest(tiles=tile_names, high_score=high_score, tokens=tokens):
+                expected = brute_force(pool, high_score, tokens.count(ScarabType.PIPUP), tokens.count(ScarabType.REROLL))
+                self.assertAlmostEqual(calculator.plan().probability, expected, places=9)
+
+    def test_dice_powers_match_brute_force(self):
+        # Without the roll-off's extra die, to keep the brute force quick.
+        for tile_name, high_score, pipups, rerolls in (("SHIP CAPTAIN", (3, 6), 0, 0), ("GRAND VIZIER", (2, 6), 1, 0)):
+            game, player = roll_off_game([tile_name], high_score)
+            calculator = RollOffCalculator(player, game)
+            pool, _ = calculator.pool(frozenset(), False)
+            with self.subTest(tile=tile_name):
+                value, _ = calculator.start_value(frozenset(), pipups, rerolls, (), False, (0, 0), False)
+                self.assertAlmostEqual(value, brute_force(pool, high_score, pipups, rerolls), places=9)
+
+    def test_gift_redoes_a_losing_turn(self):
+        game, player = roll_off_game(["PHARAOH'S GIFT"], (3, 5))
+        calculator = RollOffCalculator(player, game)
+        first = brute_force(calculator.pool(frozenset(), True)[0], (3, 5))
+        redo = brute_force(calculator.pool(frozenset(), False)[0], (3, 5))
+        self.assertAlmostEqual(calculator.plan().probability, 1-(1-first)*(1-redo), places=9)
+
+    def test_boosts_are_used_when_they_help(self):
+        game, player = roll_off_game(["PALACE KEY"], (4, 6))
+        plan = RollOffCalculator(player, game).plan()
+        self.assertEqual(plan.boosts, (palace_key,))
+        game, player = roll_off_game([], (4, 6))
+        self.assertGreater(plan.probability, RollOffCalculator(player, game).plan().probability)
+
+
+if __name__ == "__main__":
+    unittest.main()
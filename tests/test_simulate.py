@@ -0,0 +1,38 @@
+import functools
+import unittest
+from numpy.random import Generator
+from player import Agent, RandomAgent
+from simulate import AgentFactory, SimulationConfig, describe_factory
+
+
+def seeded_agent(name: str, color: int, rng: Generator, bias: int = 0) -> Agent:
+    return RandomAgent(name, color, rng)
+
+
+def biased(bias: int) -> AgentFactory:
+    return lambda name, color, rng: seeded_agent(name, color, rng, bias)
+
+
+class DescribeTest(unittest.TestCase):
+    def test_classes_and_functions(self):
+        self.assertEqual(describe_factory(RandomAgent), "player.RandomAgent")
+        self.assertEqual(describe_factory(seeded_agent), "tests.test_simulate.seeded_agent")
+        self.assertEqual(SimulationConfig(2).describe()["agents"], ["player.RandomAgent"]*2)
+
+    def test_partials_list_their_arguments(self):
+        self.assertEqual(describe_factory(functools.partial(seeded_agent, bias=3)), "tests.test_simulate.seeded_agent(bias=3)")
+        self.assertNotEqual(describe_factory(functools.partial(seeded_agent, bias=3)), describe_factory(functools.partial(seeded_agent, bias=4)))
+        nested = functools.partial(functools.partial(seeded_agent, "a"), color=1)
+        self.assertEqual(describe_factory(nested), "tests.test_simulate.seeded_agent('a', color=1)")
+
+    def test_lambdas_are_told_apart(self):
+        first: AgentFactory = lambda name, color, rng: RandomAgent(name, color, rng)
+        second: AgentFactory = lambda name, color, rng: seeded_agent(name, color, rng)
+        self.assertNotEqual(describe_factory(first), describe_factory(second))
+        self.assertEqual(describe_factory(biased(1)), describe_factory(biased(1)))
+        self.assertNotEqual(describe_factory(biased(1)), describe_factory(biased(2)))
+        self.assertIn("bias=1", describe_factory(biased(1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from typing import Any
+from numpy.random import Generator
+from main import Game
+from player import Player, RandomAgent
+from tests.games import GameTestCase, new_game
+
+
+def describe(game: Game) -> Any:
+    """
+    The game's state by value, so games holding different but equal dice and tiles compare equal.
+    """
+    players = tuple((
+        tuple((tile.name, tile.disabled, tile.value) for tile in player.owned_tiles),
+        (player.borrowed_tile.name, player.borrowed_tile.value) if player.borrowed_tile is not None else None,
+        tuple(tuple((die.dice_type, die.face, die.power_triggered) for die in dice)
+              for dice in (player.available_dice, player.locked_dice, player.prepared_dice)),
+        tuple(player.tokens),
+        tuple(effect.turn_start.__name__ for effect in player.effects),
+        player.step, player.locked_pair, player.final_score, player.finished,
+    ) for player in game.players)
+    return (players, tuple(game.amounts.values()), game.board.available, tuple(game.board.owned.get(player, 0) for player in game.players),
+            game.final_roll_off, game.high_score, game.players.index(game.high_scorer) if game.high_scorer is not None else None,
+            game.next_player_turn, game.turns_played)
+
+
+def agent_stream(player: Player) -> Generator:
+    assert isinstance(player.agent, RandomAgent)
+    return player.agent.rng
+
+
+class SnapshotTest(GameTestCase):
+    def test_restore_replays_the_game(self):
+        self.for_each_game((2, 4), range(3), self.check_restore)
+
+    def check_restore(self, game: Game):
+        game.play_game(max_turns=15)
+        state = game.snapshot()
+        before = describe(game)
+        # Agents are not part of a snapshot, so their streams are put back separately.
+        agent_states = [agent_stream(player).bit_generator.state for player in game.players]
+        game.play_game(max_turns=150)
+        finished = describe(game)
+        self.assertNotEqual(finished, before)
+
+        game.restore(state)
+        self.assertEqual(describe(game), before)
+        self.assertEqual(game.snapshot(), state)
+        for player, agent_state in zip(game.players, agent_states):
+            agent_stream(player).bit_generator.state = agent_state
+        game.play_game(max_turns=150)
+        self.assertEqual(describe(game), finished)
+
+    def test_restore_twice(self):
+        game = new_game(3, 7)
+        game.play_game(max_turns=10)
+        state = game.snapshot()
+        before = describe(game)
+        for _ in range(2):
+            game.play_game(max_turns=game.turns_played+20)
+            game.restore(state)
+            self.assertEqual(describe(game), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,319 @@
+import itertools
+import random
+import unittest
+from collections.abc import Iterator
+from math import comb
+from constraint_table import constraint_table, histogram
+from dice import Die, face_tables, get_die
+from enums import *
+from player import rearrangement_options
+from probability import PoolProbabilities
+from solver import (ANCESTRAL_GUIDANCE, ANKH, ENTERTAINER, FIXED, GRAIN_MERCHANT, HEAD_SERVANT, HEIR, HERDER, LOCKED_WILD, MASTER_ARTISAN, MATCHMAKER,
+                    PRIEST, PRIESTESS, REARRANGE, ROYAL_ASTROLOGER, ROYAL_MOTHER, SERVANT, SURVEYOR, TOKENS, WILD, Activations, Dice, LockChoice, Objective,
+                    TurnSolver, TurnState, after_roll)
+
+STANDARD = DiceType.STANDARD.value
+IMMEDIATE = DiceType.IMMEDIATE.value
+SERF = DiceType.SERF.value
+ADD_TWO = DiceType.VOYAGE.value*16+DiceFace.ADD_TWO.value
+
+
+def face_of(die_code: int):
+    return DiceFace(die_code & 15)
+
+
+def die_of(die_code: int):
+    return get_die(DiceType(die_code >> 4)).set_face(face_of(die_code))
+
+
+def bucket(die_code: int):
+    value = to_value(face_of(die_code))
+    return None if value is DiceValue.NULL else value.value
+
+
+def pipped(die_code: int, amount: int):
+    die = die_of(die_code)
+    die.pipup(amount)
+    return die_code & ~15 | die.face.value
+
+
+def without(items: tuple[int, ...], *indices: int):
+    return tuple(item for i, item in enumerate(items) if i not in indices)
+
+
+def index_subsets(dice: tuple[int, ...]):
+    return [subset for size in range(len(dice)+1) for subset in itertools.combinations(range(len(dice)), size)]
+
+
+def objective(locked: tuple[int, ...], count: int):
+    return float(max(locked) >= 2)+0.1*count+0.01*sum(i*amount for i, amount in enumerate(locked))
+
+
+class BruteForce:
+    """
+    Plays a turn out over every face of every die and every choice the rules give, one die at a time.
+    """
+
+    def __init__(self, objective: Objective = objective) -> None:
+        self.objective = objective
+        self.memo: dict[tuple[object, ...], float] = {}
+
+    def finish(self, locked: tuple[int, ...]):
+        values = [bucket(die_code) for die_code in locked]
+        return self.objective(histogram([DiceValue(value) for value in values if value is not None]), len(locked))
+
+    def roll(self, types: tuple[int, ...], locked: Dice, pipups: int, rerolls: int, activations: Activations) -> float:
+        if not types:
+            return self.finish(locked)
+        key = ("roll", tuple(sorted(types)), tuple(sorted(locked)), pipups, rerolls, activations)
+        if key not in self.memo:
+            outcomes = list(itertools.product(*(face_tables[DiceType(dice_type)].faces for dice_type in types)))
+            total = 0.0
+            for faces in outcomes:
+                dice = tuple(sorted(dice_type*16+face.value for dice_type, face in zip(types, faces)))
+                total += self.decide(dice, locked, pipups, rerolls, after_roll(activations), 0, tuple(c for c in dice if face_of(c) in Die.power_faces))
+            self.memo[key] = total/len(outcomes)
+        return self.memo[key]
+
+    def rerolled(self, dice: Dice, indices: tuple[int, ...], pending: Dice):
+        """
+        Each way the dice at indices can come up when rolled again, with the pending dice after it.
+        """
+        for faces in itertools.product(*(face_tables[DiceType(dice[i] >> 4)].faces for i in indices)):
+            new = tuple(dice[i] & ~15 | face.value for i, face in zip(indices, faces))
+            yield tuple(sorted(without(dice, *indices)+new)), tuple(sorted(pending+tuple(c for c in new if face_of(c) in Die.power_faces)))
+
+    def changeable(self, dice: Dice, pending: list[int]):
+        """
+        Each die a power can change, with the dice left pending: a die whose power is still pending cancels it.
+        """
+        for die_code in set(dice):
+            if dice.count(die_code) > pending.count(die_code):
+                yield dice.index(die_code), tuple(pending)
+            if die_code in pending:
+                after = list(pending)
+                after.remove(die_code)
+                yield dice.index(die_code), tuple(after)
+
+    def resolve(self, dice: Dice, locked: Dice, pipups: int, rerolls: int, activations: Activations, prepared: int, pending: Dice) -> float:
+        best = float("-inf")
+        for power in set(pending):
+            left = list(pending)
+            left.remove(power)
+            for i, after in self.changeable(dice, left):
+                if face_of(power) == DiceFace.REROLL:
+                    # Rolling the same power again comes back to this state, so the value is that of the other faces.
+                    outcomes = [outcome for outcome in self.rerolled(dice, (i,), after) if outcome != (dice, pending)]
+                    best = max(best, sum(self.decide(new, locked, pipups, rerolls, activations, prepared, new_pending) for new, new_pending in outcomes)/len(outcomes))
+                else:
+                    best = max(best, self.decide(dice, locked, pipups, rerolls, activations, prepared, after, 2 if face_of(power) == DiceFace.TWO_STAR else 1))
+        return best
+
+    def decide(self, dice: Dice, locked: Dice, pipups: int, rerolls: int, activations: Activations, prepared: int, pending: Dice = (), adjust: int = 0) -> float:
+        dice, locked, pending = tuple(sorted(dice)), tuple(sorted(locked)), tuple(sorted(pending))
+        key = ("decide", dice, locked, pipups, rerolls, activations, prepared, pending, adjust)
+        if key in self.memo:
+            return self.memo[key]
+        if adjust:
+            # A star power adjusts up to adjust dice to another face without a power, one at a time.
+            value = self.decide(dice, locked, pipups, rerolls, activations, prepared, pending)
+            for i, after in self.changeable(dice, list(pending)):
+                for face in face_tables[DiceType(dice[i] >> 4)].face_set:
+                    if face != face_of(dice[i]) and face not in Die.power_faces:
+                        value = max(value, self.decide(without(dice, i)+(dice[i] & ~15 | face.value,), locked, pipups, rerolls, activations, prepared, after, adjust-1))
+        elif pending:
+            value = self.resolve(dice, locked, pipups, rerolls, activations, prepared, pending)
+        elif not dice:
+            value = self.roll((STANDARD,)*prepared, locked, pipups, rerolls, activations)
+        else:
+            value = max(self.options(dice, locked, pipups, rerolls, activations, prepared))
+        self.memo[key] = value
+        return value
+
+    def options(self, dice: Dice, locked: Dice, pipups: int, rerolls: int, activations: Activations, prepared: int) -> Iterator[float]:
+        immediates = {i for i, die_code in enumerate(dice) if die_code >> 4 == IMMEDIATE}
+        for subset in index_subsets(dice):
+            if subset and immediates <= set(subset):
+                lock = tuple(dice[i] for i in subset)
+                child = tuple(die_code >> 4 for die_code in without(dice, *subset))+(STANDARD,)*(prepared+2*lock.count(ADD_TWO))
+                yield self.roll(child, locked+lock, pipups, rerolls, activations)
+                values = [bucket(die_code) for die_code in lock if bucket(die_code) is not None]
+                if (HERDER, 0) in activations and len(set(values)) < len(values):
+                    yield self.roll(child+(STANDARD,), locked+lock, pipups, rerolls, tuple(a for a in activations if a != (HERDER, 0)))
+                if (LOCKED_WILD, 0) in activations and not child:
+                    for face in range(1, 7):
+                        yield self.roll((), locked+lock+(STANDARD*16+face,), pipups, rerolls, tuple(a for a in activations if a != (LOCKED_WILD, 0)))
+        for i, die_code in enumerate(dice):
+            if pipups and die_of(die_code).can_pipup_x(1):
+                yield self.decide(without(dice, i)+(pipped(die_code, 1),), locked, pipups-1, rerolls, activations, prepared)
+            if rerolls:
+                outcomes = list(self.rerolled(dice, (i,), ()))
+                yield sum(self.decide(new, locked, pipups, rerolls-1, activations, prepared, pending) for new, pending in outcomes)/len(outcomes)
+        for activation in set(activations):
+            rest = list(activations)
+            rest.remove(activation)
+            yield from self.activated(dice, locked, pipups, rerolls, tuple(rest), prepared, activation)
+
+    def changed(self, dice: Dice, kind: int, amount: int = 1):
+        """
+        Each set of dice a Priest-like tile can leave by changing any number of the dice at once.
+        """
+        for subset in index_subsets(dice):
+            changed = [die_of(dice[i]) for i in subset]
+            if kind != ENTERTAINER and not all(die.can_pipup_x(amount) for die in changed):
+                continue
+            for die in changed:
+                die.pipup(amount) if kind != ENTERTAINER else die.flip()
+            yield without(dice, *subset)+tuple(die.dice_type.value*16+die.face.value for die in changed)
+
+    def adjusted(self, dice: Dice, indices: tuple[int, ...]):
+        """
+        Each set of dice adjusting the dice at indices to other faces without a power can leave.
+        """
+        options = [[dice[i] & ~15 | face.value for face in face_tables[DiceType(dice[i] >> 4)].face_set if face != face_of(dice[i]) and face not in Die.power_faces]
+                   for i in indices]
+        for new in itertools.product(*options):
+            yield without(dice, *indices)+new
+
+    def tokens(self, dice: Dice, locked: Dice, pipups: int, rerolls: int, activations: Activations, prepared: int, gained: int, pending: Dice = ()):
+        return sum(comb(gained, new)/2**gained*self.decide(dice, locked, pipups+new, rerolls+gained-new, activations, prepared, pending) for new in range(gained+1))
+
+    def activated(self, dice: Dice, locked: Dice, pipups: int, rerolls: int, activations: Activations, prepared: int, activation: tuple[int, int]) -> Iterator[float]:
+        kind, value = activation
+        state = (locked, pipups, rerolls, activations, prepared)
+
+        def settled(new: Dice):
+            return not any(face_of(die_code) in Die.power_faces for die_code in new if die_code not in dice or new.count(die_code) > dice.count(die_code))
+        if kind in (FIXED, WILD):
+            for face in range(1, 7) if kind == WILD else [value]:
+                yield self.decide(dice+(STANDARD*16+face,), *state)
+        elif kind == SERVANT:
+            for i, die_code in enumerate(dice):
+                for amount in (1, 2, 3):
+                    if die_of(die_code).can_pipup_x(amount):
+                        new = without(dice, i)+(pipped(die_code, amount),)
+                        if settled(new):
+                            yield self.decide(new, *state)
+        elif kind in (PRIEST, PRIESTESS, ENTERTAINER):
+            for new in self.changed(dice, kind, 2 if kind == PRIESTESS else 1):
+                if settled(new):
+                    yield self.decide(new, *state)
+        elif kind == HEIR:
+            for first in self.changed(dice, PRIEST):
+                if settled(first):
+                    for new in self.changed(first, PRIEST):
+                        if settled(new):
+                            yield self.decide(new, *state)
+        elif kind in (MASTER_ARTISAN, HEAD_SERVANT, ROYAL_ASTROLOGER):
+            if kind == MASTER_ARTISAN:
+                choices = [(i,) for i in range(len(dice))]
+            else:
+                adjustable = [i for i, die_code in enumerate(dice) if (die_code >> 4 == IMMEDIATE if kind == HEAD_SERVANT else die_code >> 4 != STANDARD)]
+                choices = [subset for size in range(len(adjustable)+1) for subset in itertools.combinations(adjustable, size)]
+            for indices in choices:
+                for new in self.adjusted(dice, indices):
+                    yield self.decide(new, *state)
+        elif kind == MATCHMAKER:
+            values = {bucket(die_code) for die_code in locked} - {None}
+            for i, die_code in enumerate(dice):
+                for face in face_tables[DiceType(die_code >> 4)].face_set:
+                    new = without(dice, i)+(die_code & ~15 | face.value,)
+                    if bucket(new[-1]) in values and face != face_of(die_code) and settled(new):
+                        yield self.decide(new, *state)
+        elif kind == REARRANGE:
+            for subset in itertools.combinations(range(len(dice)), value):
+                chosen = [dice[i] for i in subset]
+                if all(bucket(die_code) is not None for die_code in chosen):
+                    for faces in rearrangement_options([die_of(die_code) for die_code in chosen], sum(bucket(die_code) or 0 for die_code in chosen)):
+                        new = without(dice, *subset)+tuple(die_code & ~15 | face.value for die_code, face in zip(chosen, faces))
+                        if settled(new):
+                            yield self.decide(new, *state)
+        elif kind == SURVEYOR:
+            for i, die_code in enumerate(dice):
+                total = bucket(die_code)
+                if total is not None and total > 1:
+                    for first in range(1, total):
+                        if total-first <= 6:
+                            yield self.decide(without(dice, i)+(IMMEDIATE*16+first, IMMEDIATE*16+total-first), *state)
+        elif kind == GRAIN_MERCHANT:
+            for subset in index_subsets(dice)[1:]:
+                outcomes = list(self.rerolled(dice, subset, ()))
+                yield sum(self.tokens(new, locked, pipups, rerolls, activations, prepared, 1, pending) for new, pending in outcomes)/len(outcomes)
+        elif kind == ROYAL_MOTHER:
+            for subset in index_subsets(dice)[1:]:
+                if all(dice[i] >> 4 in (IMMEDIATE, SERF) for i in subset):
+                    yield self.tokens(without(dice, *subset), locked, pipups, rerolls, activations, prepared+len(subset), len(subset))
+        elif kind in (TOKENS, ANKH):
+            yield self.tokens(dice, locked, pipups, rerolls, activations, prepared, value if kind == TOKENS else pipups+rerolls)
+        elif kind == ANCESTRAL_GUIDANCE:
+            yield self.tokens(dice, locked, pipups, rerolls, activations, prepared+1, 2)
+
+
+def turn(pool: list[DiceType], pipups: int = 0, rerolls: int = 0, activations: Activations = ()):
+    counts = [0]*len(DiceType)
+    for dice_type in pool:
+        counts[dice_type.value] += 1
+    return TurnState(tuple(counts), (0,)*6, 0, pipups, rerolls, tuple(sorted(activations)))
+
+
+class SolverTest(unittest.TestCase):
+    def assert_brute_force(self, pool: list[DiceType], pipups: int = 0, rerolls: int = 0, activations: Activations = ()):
+        state = turn(pool, pipups, rerolls, activations)
+        expected = BruteForce().roll(tuple(dice_type.value for dice_type in pool), (), pipups, rerolls, state.activations)
+        with self.subTest(pool=pool, pipups=pipups, rerolls=rerolls, activations=activations):
+            self.assertAlmostEqual(TurnSolver(objective).roll_value(state), expected, places=9)
+
+    def test_tokens_match_brute_force(self):
+        self.assert_brute_force([DiceType.STANDARD]*3)
+        self.assert_brute_force([DiceType.STANDARD]*3, 2, 1)
+        self.assert_brute_force([DiceType.STANDARD, DiceType.IMMEDIATE, DiceType.SERF], 1, 2)
+
+    def test_powers_match_brute_force(self):
+        self.assert_brute_force([DiceType.VOYAGE, DiceType.STANDARD], 0, 1)
+        self.assert_brute_force([DiceType.INTRIGUE, DiceType.ARTISAN])
+        self.assert_brute_force([DiceType.VOYAGE, DiceType.DECREE])
+
+    def test_tiles_match_brute_force(self):
+        tiles: list[tuple[list[DiceType], int, int, Activations]] = [
+            ([DiceType.STANDARD]*2, 1, 0, ((FIXED, 3), (HERDER, 0))),
+            ([DiceType.STANDARD]*2, 0, 1, ((WILD, 0), (LOCKED_WILD, 0))),
+            ([DiceType.STANDARD, DiceType.SERF], 1, 0, ((SERVANT, 0), (MATCHMAKER, 0))),
+            ([DiceType.STANDARD, DiceType.NOBLE], 1, 0, ((PRIEST, 0), (ENTERTAINER, 0))),
+            ([DiceType.STANDARD, DiceType.ARTISAN], 1, 0, ((REARRANGE, 2), (SURVEYOR, 0))),
+            ([DiceType.STANDARD, DiceType.INTRIGUE], 0, 0, ((GRAIN_MERCHANT, 0), (ANKH, 0))),
+            ([DiceType.IMMEDIATE, DiceType.SERF], 0, 1, ((ROYAL_MOTHER, 0), (TOKENS, 2))),
+            ([DiceType.STANDARD, DiceType.IMMEDIATE], 1, 0, ((PRIESTESS, 0), (HEAD_SERVANT, 0))),
+            ([DiceType.STANDARD, DiceType.NOBLE], 0, 0, ((HEIR, 0), (ANCESTRAL_GUIDANCE, 0))),
+            ([DiceType.STANDARD, DiceType.ARTISAN], 0, 0, ((MASTER_ARTISAN, 0), (ROYAL_ASTROLOGER, 0))),
+        ]
+        for pool, pipups, rerolls, activations in tiles:
+            self.assert_brute_force(pool, pipups, rerolls, activations)
+
+    def test_single_lock_matches_pool_probabilities(self):
+        probabilities = PoolProbabilities()
+        rng = random.Random(2)
+        for _ in range(6):
+            pool = [DiceType.IMMEDIATE]*rng.randint(1, 4)
+            constraint = rng.choice(constraint_table.constraints)
+            bit = constraint_table.bits[constraint]
+            solver = TurnSolver(lambda locked, count: float(bool(constraint_table.mask(locked) & bit)))
+            with self.subTest(pool=len(pool), constraint=constraint.name):
+                self.assertAlmostEqual(solver.roll_value(turn(pool)), float(probabilities.probability(pool, constraint)), places=9)
+
+    def test_best_choice_has_the_decision_value(self):
+        rng = random.Random(3)
+        solver = TurnSolver(objective)
+        faces = {dice_type: sorted(face_tables[dice_type].face_set, key=lambda face: face.value) for dice_type in DiceType}
+        for _ in range(30):
+            pool = [rng.choice([DiceType.STANDARD, DiceType.SERF, DiceType.IMMEDIATE, DiceType.NOBLE]) for _ in range(rng.randint(1, 4))]
+            dice = tuple(sorted(dice_type.value*16+rng.choice([face for face in faces[dice_type] if face not in Die.power_faces]).value for dice_type in pool))
+            state = TurnState(dice, (rng.randint(0, 1),)+(0,)*5, 0, rng.randint(0, 1), rng.randint(0, 1), tuple(sorted(rng.sample([(FIXED, 5), (SERVANT, 0), (HERDER, 0)], 2))))
+            value, choice = solver.best_choice(state)
+            with self.subTest(state=state):
+                self.assertAlmostEqual(value, solver.decision_value(state), places=9)
+                if isinstance(choice, LockChoice):
+                    self.assertTrue(set(choice.dice) <= set(dice))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import undo
+from main import Game
+from snapshot import GameState
+from tests.games import GameTestCase, new_game
+
+
+def state_without_streams(game: Game):
+    # Undoing does not rewind random number generators.
+    state = game.snapshot()
+    return state._replace(players=tuple(player._replace(rng=None) for player in state.players), rng=None)
+
+
+class UndoTest(GameTestCase):
+    def test_undo_whole_games(self):
+        self.for_each_game((2, 3, 5), range(3), self.check_undo_game)
+
+    def check_undo_game(self, game: Game):
+        game.play_game(max_turns=10)
+        before = state_without_streams(game)
+        with undo.recording() as log:
+            game.play_game(max_turns=150)
+            self.assertGreater(len(log.entries), 0)
+            log.undo()
+        self.assertEqual(state_without_streams(game), before)
+
+    def test_undo_to_marks(self):
+        game = new_game(4, 11)
+        with undo.recording() as log:
+            states: list[tuple[int, GameState]] = []
+            for _ in range(30):
+                states.append((log.mark(), state_without_streams(game)))
+                game.play_turn()
+            for mark, state in reversed(states):
+                log.undo(mark)
+                self.assertEqual(state_without_streams(game), state)
+        self.assertEqual(log.entries, [])
+
+    def test_nothing_recorded_outside_recording(self):
+        game = new_game(2, 3)
+        log = undo.UndoLog()
+        game.play_game(max_turns=20)
+        with undo.recording(log):
+            pass
+        game.play_game(max_turns=40)
+        self.assertEqual(log.entries, [])
+        self.assertIsNone(undo.history)
+
+
+if __name__ == "__main__":
+    unittest.main()
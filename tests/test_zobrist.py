@@ -0,0 +1,126 @@
+import pickle
+import unittest
+from collections.abc import Callable
+import undo
+from dice import get_die
+from enums import *
+from main import Game
+from player import Player
+from tests.games import GameTestCase, new_game
+from tile import tiles_by_name
+from zobrist import MASK, HashedList, TranspositionTable, game_hash
+
+
+def hashed_lists(player: Player) -> list[HashedList[object]]:
+    return [player.available_dice, player.locked_dice, player.prepared_dice, player.tokens, player.owned_tiles, player.effects]  # type: ignore
+
+
+def watch_steps(game: Game, check: Callable[[], None]):
+    """
+    Plays the game to its end or the turn limit, calling check at every step change of every player.
+    """
+    set_step = Player.set_step
+
+    def checked(player: Player, step: TurnStep):
+        set_step(player, step)
+        check()
+    Player.set_step = checked  # type: ignore
+    try:
+        game.play_game(max_turns=game.turns_played+40)
+    finally:
+        Player.set_step = set_step  # type: ignore
+
+
+class ZobristTest(GameTestCase):
+    def assert_sums_current(self, game: Game):
+        for player in game.players:
+            for items in hashed_lists(player):
+                self.assertEqual(items.hash, sum(map(items.key, items)) & MASK, type(items).__name__)
+
+    def test_incremental_matches_recomputed(self):
+        self.for_each_game((2, 4, 6), range(2), lambda game: watch_steps(game, lambda: self.assert_sums_current(game)))
+
+    def test_undo_restores_hash(self):
+        game = new_game(3, 7)
+        with undo.recording() as log:
+            hashes: list[tuple[int, int]] = []
+            for _ in range(25):
+                hashes.append((log.mark(), game_hash(game)))
+                game.play_turn()
+            for mark, h in reversed(hashes):
+                log.undo(mark)
+                self.assertEqual(game_hash(game), h)
+                self.assert_sums_current(game)
+
+    def test_restore_and_pickle_keep_hash(self):
+        game = new_game(4, 3)
+        game.play_game(max_turns=15)
+        state, h = game.snapshot(), game_hash(game)
+        game.play_game(max_turns=30)
+        game.restore(state)
+        self.assertEqual(game_hash(game), h)
+        copy: Game = pickle.loads(pickle.dumps(game))
+        self.assertEqual(game_hash(copy), h)
+        self.assert_sums_current(copy)
+        copy.play_game(max_turns=40)
+        self.assert_sums_current(copy)
+
+    def test_transpositions(self):
+        first, second = new_game(2, 1), new_game(2, 1)
+        for game, order in ((first, (0, 1, 2)), (second, (2, 0, 1))):
+            player = game.players[0]
+            # Dice only count for a player taking a turn.
+            player.step = TurnStep.ROLLS
+            dice = [get_die(DiceType.STANDARD).set_face(DiceFace.FOUR), get_die(DiceType.SERF).set_face(DiceFace.TWO), get_die(DiceType.STANDARD).set_face(DiceFace.ONE)]
+            player.available_dice = dice
+            for i in order:
+                player.available_dice.remove(dice[i])
+                player.locked_dice.append(dice[i])
+            player.tokens = [ScarabType.REROLL, ScarabType.PIPUP][::1 if order[0] == 0 else -1]
+            player.owned_tiles.extend(tiles_by_name[name].clone() for name in (["FARMER", "GUARD"] if order[0] == 0 else ["GUARD", "FARMER"]))
+        self.assertEqual(game_hash(first), game_hash(second))
+
+        die = second.players[0].locked_dice[0]
+        face = die.face
+        die.set_face(DiceFace.SIX)
+        self.assertNotEqual(game_hash(first), game_hash(second))
+        die.set_face(face)
+        self.assertEqual(game_hash(first), game_hash(second))
+
+        second.players[0].owned_tiles[-1].disabled = True
+        self.assertNotEqual(game_hash(first), game_hash(second))
+        second.players[0].owned_tiles[-1].disabled = False
+        self.assertEqual(game_hash(first), game_hash(second))
+
+    def test_counts_are_not_clamped(self):
+        game = new_game(2, 0)
+        player = game.players[0]
+        player.tokens = [ScarabType.PIPUP]*40
+        h = game_hash(game)
+        player.tokens.append(ScarabType.PIPUP)
+        self.assertNotEqual(game_hash(game), h)
+        player.tokens.pop()
+        self.assertEqual(game_hash(game), h)
+
+    def test_seats_matter(self):
+        game = new_game(2, 0)
+        game.players[0].tokens = [ScarabType.PIPUP]
+        game.players[1].tokens = []
+        h = game_hash(game)
+        game.players[0].tokens = []
+        game.players[1].tokens = [ScarabType.PIPUP]
+        self.assertNotEqual(game_hash(game), h)
+
+    def test_transposition_table_evicts_least_recent(self):
+        table = TranspositionTable(max_entries=2)
+        table.put(1, "a")
+        table.put(2, "b")
+        self.assertEqual(table.get(1), "a")
+        table.put(3, "c")
+        self.assertNotIn(2, table)
+        self.assertEqual((table.get(1), table.get(3), table.get(2, "none")), ("a", "c", "none"))
+        self.assertEqual((table.hits, table.misses), (3, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
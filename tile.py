@@ -2,12 +2,16 @@ from __future__ import annotations
 from collections.abc import Callable
 from dice import Die, get_die
 from display import COLOR
+import profiling
+import undo
+from events import ActionFailed
 from enums import *
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from main import Game
     from player import Player
+    from zobrist import TileList
 
 
 AbilityFunction = Callable[['Player', 'Game', 'Tile'], None]
@@ -45,6 +49,7 @@ class Effect:
 
 def add_roll_dice(dice: list[DiceType]):
     def func(player: Player, game: Game, tile: Tile):
+        undo.save_list(player.prepared_dice)
         [player.prepared_dice.append(get_die(die)) for die in dice]
     return func
 
@@ -57,17 +62,19 @@ def add_scarabs(amount: int):
 
 def add_value_die(face: DiceFace):
     def func(player: Player, game: Game, tile: Tile):
+        undo.save_list(player.available_dice)
         player.available_dice.append(get_die(DiceType.STANDARD).set_face(face))
     return func
 
 
 def add_wild_die(player: Player, game: Game, tile: Tile):
-    print("Choose the dice value")
-    face = player.agent.choose_item(sorted(get_die(DiceType.STANDARD).faces, key=lambda v: v.value))
+    face = player.agent.choose_item(sorted(get_die(DiceType.STANDARD).faces, key=lambda v: v.value), message="Choose the dice value")
+    undo.save_list(player.available_dice)
     player.available_dice.append(get_die(DiceType.STANDARD).set_face(face))
 
 
 def add_incremental_die(player: Player, game: Game, tile: Tile):
+    undo.save_list(player.available_dice)
     player.available_dice.append(get_die(DiceType.STANDARD).set_face(DiceFace(tile.value)))
 
 
@@ -88,7 +95,7 @@ def rearrange_dice(amount: int):
     def func(player: Player, game: Game, tile: Tile):
         chosen_dice = player.agent.choose_dice(player, game, amount, message="Choose dice to rearrange pips:")
         if any(to_value(die.face) is DiceValue.NULL for die in chosen_dice):
-            print("Can't move pips on non-numeric faces!")
+            game.events.emit(ActionFailed, player, "Can't move pips on non-numeric faces!")
             raise RearrangementException()
         try:
             total_sum = sum(to_value(die.face).value for die in chosen_dice)
@@ -96,7 +103,7 @@ def rearrange_dice(amount: int):
             for die, face in rearrangement:
                 die.set_face(face)
         except ValueError as e:
-            print(e.args)
+            game.events.emit(ActionFailed, player, str(e.args))
             raise RearrangementException()
     return func
 
@@ -105,12 +112,35 @@ def ankh_ability(player: Player, game: Game, tile: Tile):
     player.add_scarabs(player.token_count)
 
 
+# Turn start effects are module level, so effects in game snapshots can be pickled.
+def remove_red(player: Player, game: Game):
+    for die in player.prepared_dice:
+        if die.dice_type == DiceType.STANDARD:
+            undo.save_list(player.prepared_dice)
+            player.prepared_dice.remove(die)
+            break
+
+
+def add_red(player: Player, game: Game):
+    undo.save_list(player.prepared_dice)
+    player.prepared_dice.append(get_die(DiceType.STANDARD))
+
+
+def remove_any_2(player: Player, game: Game):
+    if player.step == TurnStep.ROLL_OFF_START:
+        return
+    dice_to_lose = player.agent.choose_dice(player, game, min(2, len(player.prepared_dice)), message="Choose dice to lose for the turn", source=player.prepared_dice)
+    for die in dice_to_lose:
+        undo.save_list(player.prepared_dice)
+        player.prepared_dice.remove(die)
+
+
+def add_2_grey(player: Player, game: Game):
+    undo.save_list(player.prepared_dice)
+    player.prepared_dice.extend([get_die(DiceType.IMMEDIATE) for _ in range(2)])
+
+
 def omen_ability(player: Player, game: Game, tile: Tile):
-    def remove_red(player: Player, game: Game):
-        for die in player.prepared_dice:
-            if die.dice_type == DiceType.STANDARD:
-                player.prepared_dice.remove(die)
-                break
     if player.step == TurnStep.CLAIM:
         game.set_next_turn(player)
         player.add_effect(Effect(remove_red))
@@ -126,7 +156,7 @@ def grain_merchant_ability(player: Player, game: Game, tile: Tile):
     if not chosen_dice:
         raise SelectionException()
     for die in chosen_dice:
-        die.roll()
+        die.roll(player.rng)
     player.add_scarabs(1)
 
 
@@ -141,16 +171,16 @@ def matchmaker_ability(player: Player, game: Game, tile: Tile):
     possible_matches = [die for die in player.available_dice if any(to_value(face) in locked_values for face in die.faces)]
     if len(possible_matches) == 0:
         raise SelectionException("No possible matches!")
-    die_to_adjust = player.agent.choose_dice(player, game, 1, message="Choose a die to match a locked die:")[0]
-    print("Choose a face from among locked dice:")
+    die_to_adjust = player.agent.choose_dice(player, game, 1, message="Choose a die to match a locked die:",
+                                             constraint=lambda d: d in possible_matches)[0]
     options = [face for face in die_to_adjust.faces if to_value(face) in locked_values]
-    face_to_match = player.agent.choose_item(options)
+    face_to_match = player.agent.choose_item(options, message="Choose a face from among locked dice:")
     die_to_adjust.set_face(face_to_match)
 
 
 def add_locked_wild_die(player: Player, game: Game, tile: Tile):
-    print("Choose the dice value")
-    face = player.agent.choose_item(sorted(get_die(DiceType.STANDARD).faces, key=lambda v: v.value))
+    face = player.agent.choose_item(sorted(get_die(DiceType.STANDARD).faces, key=lambda v: v.value), message="Choose the dice value")
+    undo.save_list(player.locked_dice)
     player.locked_dice.append(get_die(DiceType.STANDARD).set_face(face))
 
 
@@ -178,15 +208,6 @@ def plus_x_to_all(x: int):
 
 
 def bad_omen_ability(player: Player, game: Game, tile: Tile):
-    def add_red(player: Player, game: Game):
-        player.prepared_dice.append(get_die(DiceType.STANDARD))
-
-    def remove_any_2(player: Player, game: Game):
-        if player.step == TurnStep.ROLL_OFF_START:
-            return
-        dice_to_lose = player.agent.choose_dice(player, game, 2, message="Choose dice to lose for the turn", source=player.prepared_dice)
-        for die in dice_to_lose:
-            player.prepared_dice.remove(die)
     player.add_effect(Effect(add_red))
     for opponent in game.get_opponents(player):
         opponent.add_effect(Effect(remove_any_2))
@@ -195,10 +216,12 @@ def bad_omen_ability(player: Player, game: Game, tile: Tile):
 def surveyor_ability(player: Player, game: Game, tile: Tile):
     split_die = player.agent.choose_dice(player, game, 1, message="Choose dice to split:",
                                          constraint=lambda d: is_numeric(d.face) and to_value(d.face).value > 1)[0]
+    undo.save_list(player.available_dice)
     player.available_dice.remove(split_die)
     new_dice = player.agent.choose_rearrangement(player, game, [get_die(DiceType.IMMEDIATE)
                                                  for _ in range(2)], to_value(split_die.face).value)
     for die, face in new_dice:
+        undo.save_list(player.available_dice)
         player.available_dice.append(die.set_face(face))
 
 
@@ -209,7 +232,7 @@ def secret_passage_ability(player: Player, game: Game, tile: Tile):
     except ValueError:
         choices = lv_3_tiles
     if not choices:
-        print("No Tiles Claimed!")
+        game.events.emit(ActionFailed, player, "No Tiles Claimed!")
         return
     for choice in choices:
         game.claim_tile(player, choice)
@@ -219,6 +242,7 @@ def treasure_ability(player: Player, game: Game, tile: Tile):
     group_1 = player.agent.choose_dice(
         player, game, 1, None, message="Select dice for group 1 (the rest will be in group 2):", source=player.locked_dice)
     group_2 = [die for die in player.locked_dice if die not in group_1]
+    undo.save(tile, "disabled")
     tile.disabled = True
     player.claim_tile(game, group_1, restriction=lambda tile: tile.type is not TileType.RED)
     player.claim_tile(game, group_2, restriction=lambda tile: tile.type is not TileType.RED)
@@ -229,7 +253,9 @@ def royal_mother_ability(player: Player, game: Game, tile: Tile):
                                          constraint=lambda d: d.dice_type in (DiceType.IMMEDIATE, DiceType.SERF))
     player.add_scarabs(len(swap_dice))
     for die in swap_dice:
+        undo.save_list(player.available_dice)
         player.available_dice.remove(die)
+        undo.save_list(player.prepared_dice)
         player.prepared_dice.append(get_die(DiceType.STANDARD))
 
 
@@ -239,7 +265,7 @@ def queens_favor_ability(player: Player, game: Game, tile: Tile):
             player, lambda tile: tile.level <= 6 and tile.type is not TileType.RED), 1)[0]
         game.claim_tile(player, choice)
     except:
-        print("No tiles remain!")
+        game.events.emit(ActionFailed, player, "No tiles remain!")
     game.set_next_turn(player)
 
 
@@ -250,7 +276,7 @@ def royal_power_ability(player: Player, game: Game, tile: Tile):
         for choice in choices:
             game.claim_tile(player, choice)
     except:
-        print("No tiles remain!")
+        game.events.emit(ActionFailed, player, "No tiles remain!")
         return
 
 
@@ -260,14 +286,13 @@ def queen_claim(player: Player, game: Game, tile: Tile):
 
 
 def pharaohs_gift_ability(player: Player, game: Game, tile: Tile):
+    undo.save(player, "final_score", "finished")
     player.final_score = (0, 0)
     player.finished = False
     game.set_next_turn(player)
 
 
 def royal_death_ability(player: Player, game: Game, tile: Tile):
-    def add_2_grey(player: Player, game: Game):
-        player.prepared_dice.extend([get_die(DiceType.IMMEDIATE) for _ in range(2)])
     player.add_effect(Effect(add_2_grey))
     game.set_next_turn(player)
     game.begin_final_roll_off()
@@ -286,22 +311,52 @@ class Tile:
         self.level = level
         self.type = type
         self.ability = ability
-        self.disabled = False
-        self.value = 0
+        # The list of tiles the tile is owned in, which changes to disabled and value rekey.
+        self.zone: TileList | None = None
+        self._disabled = False
+        self._value = 0
+
+    @property
+    def disabled(self):
+        return self._disabled
+
+    @disabled.setter
+    def disabled(self, disabled: bool):
+        if self.zone is not None:
+            self.zone.change_disabled(self, disabled)
+        self._disabled = disabled
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value: int):
+        if self.zone is not None:
+            self.zone.change_value(self, value)
+        self._value = value
 
     def activate(self, player: Player, game: Game):
         if self.ability.activation is None or self.disabled:
             raise Exception("Tile can't be activated.")
+        if profiling.enabled:
+            profiling.current.count("tile_activations")
         self.ability.activation(player, game, self)
+        undo.save(self, "disabled")
         self.disabled = True
 
     def value_up(self):
         if self.value < 6:
+            undo.save(self, "value")
             self.value += 1
 
     def clone(self):
         return Tile(self.name, self.description, self.level, self.type, self.ability)
 
+    def __reduce__(self):
+        # Abilities are closures, so tiles are pickled by name and rebuilt from the definitions below.
+        return (tile_named, (self.name,), {"_disabled": self._disabled, "_value": self._value})
+
     def __eq__(self, value: object) -> bool:
         return isinstance(value, Tile) and value.name == self.name
 
@@ -450,3 +505,11 @@ start = Tile("START", 'Once per turn, after locking 2 or more matching dice on o
 
 tiles = [farmer, guard, indentured_worker, serf, worker, beggar, servant, soothsayer, ankh, omen, ancestral_guidance, artisan, builder, noble_adoption, palace_servants, soldier, grain_merchant, entertainer, matchmaker, good_omen, palace_key, spirit_of_the_dead, charioteer, conspirator, overseer, ship_captain, tomb_builder, head_servant,
          master_artisan, priest, bad_omen, burial_mask, royal_decree, embalmer, estate_overseer, grain_trader, priest_of_the_dead, royal_attendants, astrologer, priestess, surveyor, pharaohs_gift, secret_passage, treasure, general, grand_vizier, granary_master, heir, royal_astrologer, royal_mother, queens_favor, royal_death, royal_power]
+tiles_by_name = {tile.name: tile for tile in tiles+[queen, herder, start]}
+# Tiles are numbered by their position in tiles_by_name wherever they are stored by number. Changing the tile list
+# renumbers them, which needs a new binary_state format version.
+tile_ids = {name: i for i, name in enumerate(tiles_by_name)}
+
+
+def tile_named(name: str):
+    return tiles_by_name[name].clone()
@@ -0,0 +1,73 @@
+from __future__ import annotations
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from operator import setitem
+from typing import Any
+
+
+class UndoLog:
+    """
+    A stack of inverse operations for the state changes made while the log is active.
+
+    A search marks the log, applies a move, explores it and undoes back to the mark, all on the same objects.
+    Random number generators are not rewound, so replaying a move after undoing it rolls new dice.
+    """
+
+    def __init__(self) -> None:
+        self.entries: list[tuple[Callable[..., Any], Any, Any, Any]] = []
+
+    def mark(self):
+        return len(self.entries)
+
+    def undo(self, mark: int = 0):
+        entries = self.entries
+        while len(entries) > mark:
+            inverse, target, key, value = entries.pop()
+            inverse(target, key, value)
+
+
+# The log that mutations are currently recorded to, if any.
+history: UndoLog | None = None
+
+
+@contextmanager
+def recording(log: UndoLog | None = None) -> Generator[UndoLog]:
+    global history
+    previous = history
+    history = log if log is not None else UndoLog()
+    try:
+        yield history
+    finally:
+        history = previous
+
+
+@contextmanager
+def paused() -> Generator[None]:
+    """
+    Stops recording while work that is thrown away, such as a search on a copy of the game, runs.
+    """
+    global history
+    previous = history
+    history = None
+    try:
+        yield
+    finally:
+        history = previous
+
+
+# Each of these is called just before the change it protects.
+
+def save(obj: object, *names: str):
+    if history is not None:
+        for name in names:
+            history.entries.append((setattr, obj, name, getattr(obj, name)))
+
+
+def save_item(mapping: dict[Any, Any], key: object):
+    if history is not None:
+        history.entries.append((setitem, mapping, key, mapping[key]))
+
+
+def save_list(items: list[Any]):
+    if history is not None:
+        history.entries.append((setitem, items, slice(None), items[:]))
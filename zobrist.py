@@ -0,0 +1,341 @@
+from __future__ import annotations
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
+from typing import Any, Generic, SupportsIndex, TypeVar
+from enums import *
+from streams import make_stream
+import undo
+from tile import Effect, Tile, add_2_grey, add_red, remove_any_2, remove_red, tile_ids
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from dice import Die
+    from main import Game
+    from player import Player
+
+T = TypeVar('T')
+
+# Keys are drawn from a fixed seed, so hashes agree across processes and runs.
+ZOBRIST_SEED = 0x5A0B
+MAX_SEATS = 6
+# Every level from 3 to 7 has four tiles, and level 1 has the Herder. Each tile has at most one copy per player.
+BOARD_SLOTS = 21
+ZONES = 3
+AVAILABLE, LOCKED, PREPARED = range(ZONES)
+
+key_stream = make_stream(ZOBRIST_SEED)
+
+
+def keys(*shape: int) -> Any:
+    return key_stream.integers(0, 2**64, size=shape, dtype="uint64").tolist()
+
+
+MASK = 2**64-1
+
+# Dice zones, tokens, tiles and effects are multisets, so their keys are summed rather than XORed, which would cancel
+# out equal items. A sum counts any number of copies, so none of their tables are sized by a count.
+# Enum values start at -1 for NULL and NONE, so faces and steps are offset by one.
+# die_keys[zone][dice type][face value+1]
+die_keys = keys(ZONES, len(DiceType), len(DiceFace)+1)
+token_keys = keys(len(ScarabType))
+# Tiles a player owns or borrows are keyed by their tile_ids, which cover tiles off the board such as START.
+owned_keys = keys(len(tile_ids))
+disabled_keys = keys(len(tile_ids))
+tile_value_keys = keys(len(tile_ids), 7)
+borrowed_keys = keys(len(tile_ids))
+effect_functions: list[Callable[..., None]] = [add_red, remove_red, remove_any_2, add_2_grey]
+effect_keys: dict[Callable[..., None], int] = dict(zip(effect_functions, keys(len(effect_functions))))
+# amount_keys[board slot][amount]
+amount_keys = keys(BOARD_SLOTS, MAX_SEATS+1)
+step_keys = keys(len(TurnStep))
+finished_key, locked_pair_key, final_roll_off_key = keys(3)
+# A score of count dice of a value is keyed by score_keys[value]+count*score_count_keys[value].
+score_keys = keys(7)
+score_count_keys = keys(7)
+high_score_keys = keys(7)
+high_score_count_keys = keys(7)
+high_scorer_keys = keys(MAX_SEATS)
+next_player_keys = keys(MAX_SEATS)
+# Each seat's hash is multiplied by its own odd key, so players that swap positions change the game's hash.
+seat_keys = [key | 1 for key in keys(MAX_SEATS)]
+
+
+def score_key(score: tuple[int, int], value_keys: list[int], count_keys: list[int]):
+    return value_keys[score[1]]+score[0]*count_keys[score[1]]
+
+
+def board_hash(amounts: Iterable[int]):
+    """
+    The hash of the amount of each tile left on the board, by board slot. BoardIndex keeps this up to date as tiles are claimed.
+    """
+    h = 0
+    for tile_id, amount in enumerate(amounts):
+        h ^= amount_keys[tile_id][amount]
+    return h
+
+
+class HashedList(list[T]):
+    """
+    A list that keeps the sum of its items' keys up to date as items are added and removed.
+    Undo and restore put a list back by assigning to a slice of it or replacing it, which rehashes it in full.
+    """
+    __slots__ = ("hash",)
+
+    def __init__(self, items: Iterable[T] = ()) -> None:
+        super().__init__(items)
+        self.rehash()
+
+    def key(self, item: T) -> int:
+        raise NotImplementedError
+
+    def adopt(self, item: T):
+        """
+        Called for every item added, so items whose own state changes can find the list to rekey them in.
+        """
+
+    def release(self, item: T):
+        pass
+
+    def rehash(self):
+        h = 0
+        for item in self:
+            self.adopt(item)
+            h += self.key(item)
+        self.hash = h & MASK
+
+    def append(self, item: T):
+        super().append(item)
+        self.adopt(item)
+        self.hash = (self.hash+self.key(item)) & MASK
+
+    def extend(self, items: Iterable[T]):
+        for item in items:
+            self.append(item)
+
+    def __iadd__(self, items: Iterable[T]):  # type: ignore[override]
+        self.extend(items)
+        return self
+
+    def insert(self, index: SupportsIndex, item: T):
+        super().insert(index, item)
+        self.adopt(item)
+        self.hash = (self.hash+self.key(item)) & MASK
+
+    def pop(self, index: SupportsIndex = -1) -> T:
+        item = super().pop(index)
+        self.release(item)
+        self.hash = (self.hash-self.key(item)) & MASK
+        return item
+
+    def remove(self, item: T):
+        self.pop(self.index(item))
+
+    def clear(self):
+        for item in self:
+            self.release(item)
+        super().clear()
+        self.hash = 0
+
+    def __setitem__(self, index: Any, value: Any):
+        for item in self:
+            self.release(item)
+        super().__setitem__(index, value)
+        self.rehash()
+
+    def __delitem__(self, index: SupportsIndex | slice):
+        for item in self:
+            self.release(item)
+        super().__delitem__(index)
+        self.rehash()
+
+    def same_kind(self, items: Iterable[Any]) -> bool:
+        return type(items) is type(self)
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (type(self), (list(self),))
+
+
+L = TypeVar('L', bound=HashedList[Any])
+
+
+class HashedAttribute(Generic[L]):
+    """
+    An attribute that always holds a HashedList. A list of the same kind assigned to it, such as one undo puts back,
+    is kept as it is and rehashed; any other iterable is copied into a new one.
+    Only assignment goes through the descriptor: the list is stored in the instance under the attribute's own name,
+    which reads find without a call, as the descriptor has no __get__ outside of type checking.
+    """
+
+    def __init__(self, make: Callable[[Iterable[Any]], L]) -> None:
+        self.make = make
+
+    def __set_name__(self, owner: type, name: str):
+        self.name = name
+
+    if TYPE_CHECKING:
+        def __get__(self, obj: object, owner: type | None = None) -> L: ...
+
+    def __set__(self, obj: object, items: Iterable[Any]):
+        current: L | None = obj.__dict__.get(self.name)
+        if current is not None and current.same_kind(items):
+            hashed: L = items  # type: ignore
+            hashed.rehash()
+        else:
+            hashed = self.make(items)
+        obj.__dict__[self.name] = hashed
+
+
+class DiceZone(HashedList['Die']):
+    """
+    One of a player's zones of dice. Dice point back at the zone they are in, so a die rekeys it as its face changes.
+    Prepared dice are rolled before their faces matter, so they are keyed by type alone. The faces left over from
+    their last roll would otherwise tell apart positions that play out the same.
+    """
+    __slots__ = ("zone", "zone_keys", "faces")
+
+    def __init__(self, zone: int, dice: Iterable[Die] = ()) -> None:
+        self.zone = zone
+        self.zone_keys = die_keys[zone]
+        self.faces = zone != PREPARED
+        super().__init__(dice)
+
+    def key(self, item: Die) -> int:
+        return self.zone_keys[item.dice_type.value][item.face.value+1 if self.faces else 0]
+
+    def adopt(self, item: Die):
+        item.zone = self
+
+    def release(self, item: Die):
+        if item.zone is self:
+            item.zone = None
+
+    def change_face(self, die: Die, face: DiceFace):
+        """
+        Called by a die in this zone just before its face becomes face.
+        """
+        if self.faces:
+            undo.save(self, "hash")
+            keys = self.zone_keys[die.dice_type.value]
+            self.hash = (self.hash-keys[die.face.value+1]+keys[face.value+1]) & MASK
+
+    def same_kind(self, items: Iterable[Any]) -> bool:
+        return isinstance(items, DiceZone) and items.zone == self.zone
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (DiceZone, (self.zone, list(self)))
+
+
+class TokenList(HashedList[ScarabType]):
+    __slots__ = ()
+
+    def key(self, item: ScarabType) -> int:
+        return token_keys[item.value]
+
+
+class EffectList(HashedList[Effect]):
+    __slots__ = ()
+
+    def key(self, item: Effect) -> int:
+        return effect_keys[item.turn_start]
+
+
+class TileList(HashedList[Tile]):
+    """
+    The tiles a player owns. Tiles point back at the list they are in, so their disabled and value setters update its
+    sum. Those setters are what undo calls too, so the sum needs no undo of its own.
+    """
+    __slots__ = ()
+
+    def key(self, item: Tile) -> int:
+        tile_id = tile_ids[item.name]
+        return owned_keys[tile_id]+(disabled_keys[tile_id] if item.disabled else 0)+tile_value_keys[tile_id][item.value]
+
+    def adopt(self, item: Tile):
+        item.zone = self
+
+    def release(self, item: Tile):
+        if item.zone is self:
+            item.zone = None
+
+    def change_disabled(self, tile: Tile, disabled: bool):
+        """
+        Called by a tile in this list just before it is disabled or enabled.
+        """
+        if disabled != tile.disabled:
+            key = disabled_keys[tile_ids[tile.name]]
+            self.hash = (self.hash+key if disabled else self.hash-key) & MASK
+
+    def change_value(self, tile: Tile, value: int):
+        keys = tile_value_keys[tile_ids[tile.name]]
+        self.hash = (self.hash-keys[tile.value]+keys[value]) & MASK
+
+
+def player_hash(player: Player):
+    """
+    The hash of one player's part of the position. Dice zones, tokens, tiles and effects keep their own sums up to
+    date as they change, so this only combines them with the player's few other fields.
+    """
+    h = (player.tokens.hash ^ player.owned_tiles.hash ^ player.effects.hash ^ step_keys[player.step.value+1]
+         ^ score_key(player.final_score, score_keys, score_count_keys) & MASK)
+    # A player between turns has the dice left over from their last turn, which the next one clears before they matter.
+    if player.step is not TurnStep.NONE:
+        h ^= player.available_dice.hash ^ player.locked_dice.hash ^ player.prepared_dice.hash
+    if player.borrowed_tile is not None:
+        h ^= borrowed_keys[tile_ids[player.borrowed_tile.name]]
+    if player.finished:
+        h ^= finished_key
+    if player.locked_pair:
+        h ^= locked_pair_key
+    return h
+
+
+def game_hash(game: Game):
+    """
+    64-bit hash of everything a decision can depend on: the dice by zone of a player taking a turn, each player's
+    tokens, tiles, effects, step and score, plus the tiles left on the board and the roll-off state. Agents and RNG states are not included.
+    Every part that grows with the game is kept up to date as it changes, so a call costs a few operations per player.
+    """
+    h = game.board.hash ^ next_player_keys[game.next_player_turn] ^ score_key(game.high_score, high_score_keys, high_score_count_keys) & MASK
+    for seat, player in enumerate(game.players):
+        h ^= player_hash(player)*seat_keys[seat] & MASK
+    if game.high_scorer is not None:
+        h ^= high_scorer_keys[game.players.index(game.high_scorer)]
+    if game.final_roll_off:
+        h ^= final_roll_off_key
+    return h
+
+
+class TranspositionTable:
+    """
+    A bounded map from position hashes to evaluations that evicts the least recently used entry when full.
+    """
+
+    def __init__(self, max_entries: int = 1 << 20) -> None:
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self.entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0